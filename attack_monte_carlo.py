@@ -0,0 +1,285 @@
+"""
+Monte Carlo simulation of attacks on proof of work, vectorised over trials with NumPy.
+Honest and attacker hash power are modelled as competing block arrivals: each block found
+belongs to the attacker with probability equal to the attacker's share of the hash power.
+
+Scenarios:
+- double-spend: the merchant waits for `depth` confirmations while the attacker mines a
+  conflicting branch in private, then the attacker races until it is ahead or gives up
+- selfish: the attacker withholds blocks to waste honest work (Eyal and Sirer), its share
+  of the main chain's blocks is compared with its share of the hash power
+- majority: the double-spend race for an attacker with at least half of the hash power,
+  bounded by a number of blocks, with the blocks it takes to get ahead
+
+The double-spend race is cross-checked by playing a few trials with real blocks: the honest
+and attacker branches are mined with Blockchain.build_block and the attacker's branch is
+released through add_block, so the fork choice decides whether the payment is reversed.
+
+Usage: python attack_monte_carlo.py [--scenario all] [--trials 1000000] [--shares 0.1,0.2,0.3,0.4]
+                                    [--depths 1,2,3,4,5,6] [--cross-check 200] [--seed 0]
+"""
+import argparse
+import io
+from contextlib import redirect_stdout
+from math import comb, sqrt
+
+import numpy as np
+
+from blockchain import Blockchain, Transaction
+
+# The attacker abandons a double-spend once its chance of ever catching up is below this
+GIVE_UP_PROBABILITY = 1e-9
+# and in any case once this many blocks behind
+MAX_DEFICIT = 1_000
+# Blocks of the race drawn at once per trial
+STEP_CHUNK = 64
+# Blocks mined in each selfish mining trial
+SELFISH_BLOCKS = 2_000
+
+
+def double_spend_probability(share, depth):
+    """
+    Closed-form probability that a double-spend succeeds against `depth` confirmations when the
+    attacker has `share` of the hash power. This is Rosenfeld's analysis (2014) with the attacker
+    having to get strictly ahead, since the fork choice keeps the first block seen on a tie:
+    with m private blocks when the merchant's wait ends, it catches up from depth - m blocks
+    behind with probability (q/p)^(depth - m + 1).
+    """
+    if share >= 0.5:
+        return 1.0
+    honest = 1 - share
+    return 1 - sum(
+        comb(m + depth - 1, m) * honest ** depth * share ** m * (1 - (share / honest) ** (depth - m + 1))
+        for m in range(depth + 1)
+    )
+
+
+def eyal_sirer_revenue(share, gamma):
+    """
+    Closed-form share of the main chain's blocks a selfish miner ends up with (Eyal and Sirer 2014)
+    """
+    return ((share * (1 - share) ** 2 * (4 * share + gamma * (1 - 2 * share)) - share ** 3)
+            / (1 - share * (1 + (2 - share) * share)))
+
+
+def give_up_deficit(share):
+    """
+    Deficit from which an attacker with `share` of the hash power catches up with a probability
+    below GIVE_UP_PROBABILITY, so racing on cannot move the estimate
+    """
+    if share >= 0.5:
+        return MAX_DEFICIT
+    return min(MAX_DEFICIT, int(np.log(GIVE_UP_PROBABILITY) / np.log(share / (1 - share))) + 1)
+
+
+def race(deficit, share, rng, max_deficit=None, horizon=None):
+    """
+    Continues double-spend races from the attacker's deficit (honest blocks minus attacker blocks)
+    until the attacker is one block ahead, falls max_deficit behind or has spent horizon blocks.
+    :param deficit: <ndarray> Deficit of every trial
+    :param share: <float> Attacker's share of the hash power
+    :param rng: <Generator> Random number generator
+    :param max_deficit: <int> Deficit at which the attacker gives up, None for give_up_deficit
+    :param horizon: <int> Most blocks raced, None for no limit
+    :return: <tuple> Per trial whether the attacker got ahead and the blocks it took
+    """
+    if max_deficit is None:
+        max_deficit = give_up_deficit(share)
+    count = len(deficit)
+    success = np.zeros(count, dtype=bool)
+    blocks = np.zeros(count, dtype=np.int64)
+    # Trials already ahead succeed without racing
+    success[deficit < 0] = True
+
+    active = np.flatnonzero(deficit >= 0)
+    current = deficit[active].astype(np.int32)
+    elapsed = 0
+    while len(active) and (horizon is None or elapsed < horizon):
+        steps = STEP_CHUNK if horizon is None else min(STEP_CHUNK, horizon - elapsed)
+        # Each block found lowers the deficit if the attacker found it, raises it otherwise
+        moves = 1 - 2 * (rng.random((len(active), steps), dtype=np.float32) < share).astype(np.int16)
+        paths = current[:, None] + np.cumsum(moves, axis=1, dtype=np.int32)
+
+        ahead = paths < 0
+        behind = paths >= max_deficit
+        ended = ahead | behind
+        done = ended.any(axis=1)
+        first = ended.argmax(axis=1)
+        won = done & ahead[np.arange(len(active)), first]
+
+        success[active[won]] = True
+        blocks[active[done]] = elapsed + first[done] + 1
+        active = active[~done]
+        current = paths[~done, -1]
+        elapsed += steps
+
+    blocks[active] = elapsed
+    return success, blocks
+
+
+def double_spend(share, depth, trials, rng, max_deficit=None, horizon=None):
+    """
+    Probability that a double-spend reverses a payment after `depth` confirmations.
+    While the merchant waits for `depth` honest blocks the attacker mines a negative binomial
+    number of private blocks, then the race goes on from the resulting deficit.
+    :return: <tuple> Success probability and mean blocks raced by the successful trials
+    """
+    attacker_blocks = rng.negative_binomial(depth, 1 - share, size=trials)
+    success, blocks = race(depth - attacker_blocks, share, rng, max_deficit, horizon)
+    mean_blocks = blocks[success].mean() if success.any() else float('nan')
+    return success.mean(), mean_blocks
+
+
+def selfish_mining(share, gamma, trials, rng, blocks=SELFISH_BLOCKS):
+    """
+    Plays the selfish mining strategy of Eyal and Sirer in every trial at once, one block at a time.
+    :param share: <float> Attacker's share of the hash power
+    :param gamma: <float> Share of honest miners that build on the attacker's block during a tie
+    :param blocks: <int> Blocks mined per trial
+    :return: <float> Attacker's mean share of the blocks on the main chain
+    """
+    lead = np.zeros(trials, dtype=np.int64)  # Private blocks ahead of the public chain
+    tie = np.zeros(trials, dtype=bool)  # Two public branches of equal length are competing
+    attacker = np.zeros(trials, dtype=np.int64)  # Attacker blocks that made it to the main chain
+    honest = np.zeros(trials, dtype=np.int64)
+
+    for _ in range(blocks):
+        draws = rng.random(trials)
+        mined = draws < share
+
+        # Attacker finds a block: during a tie it publishes and wins both, otherwise it keeps it
+        won_tie = mined & tie
+        attacker[won_tie] += 2
+        lead[mined & ~tie] += 1
+
+        found = ~mined
+        # During a tie gamma of the honest miners build on the attacker's branch
+        on_attacker = found & tie & (draws < share + (1 - share) * gamma)
+        on_honest = found & tie & ~on_attacker
+        attacker[on_attacker] += 1
+        honest[on_attacker] += 1
+        honest[on_honest] += 2
+
+        quiet = found & ~tie
+        honest[quiet & (lead == 0)] += 1
+        # A lead of one is published to force a tie, a lead of two is published to win outright,
+        # a longer lead gives up one block to stay ahead
+        new_tie = quiet & (lead == 1)
+        outright = quiet & (lead == 2)
+        attacker[outright] += 2
+        ahead = quiet & (lead > 2)
+        attacker[ahead] += 1
+
+        tie = new_tie
+        lead[new_tie | outright] = 0
+        lead[ahead] -= 1
+
+    return (attacker / np.maximum(attacker + honest, 1)).mean()
+
+
+def play_double_spend(share, depth, rng, difficulty=1, max_deficit=20):
+    """
+    Plays one double-spend with real blocks, the way double_spend models it.
+    The honest network mines the payment and the merchant's confirmations; the attacker mines
+    a conflicting payment to itself on a private copy of the chain. Once the attacker's branch
+    is longer, or it gives up, its blocks are released to the honest node.
+    :return: <bool> Whether the honest node's chain ended up reversing the payment
+    """
+    with redirect_stdout(io.StringIO()):
+        node = Blockchain(difficulty=difficulty)
+        attacker = Blockchain(difficulty=difficulty, genesis=node.chain[0])
+    payment = Transaction('attacker', 'merchant', 1.0)
+    refund = Transaction('attacker', 'attacker', 1.0)
+
+    honest_blocks = attacker_blocks = 0
+    while honest_blocks < depth or attacker_blocks <= honest_blocks:
+        if honest_blocks >= depth and honest_blocks - attacker_blocks >= max_deficit:
+            break
+        if rng.random() < share:
+            transactions = [refund] if attacker_blocks == 0 else []
+            attacker.add_block(attacker.build_block(attacker.last_block.current_hash, transactions))
+            attacker_blocks += 1
+        else:
+            transactions = [payment] if honest_blocks == 0 else []
+            node.add_block(node.build_block(node.last_block.current_hash, transactions))
+            honest_blocks += 1
+
+    if attacker_blocks:
+        for block in attacker.chain[1:]:
+            node.add_block(block)
+    return node.chain[1].transactions == [refund]
+
+
+def cross_check(share, depth, trials, rng):
+    """
+    Compares the modelled double-spend probability with trials played on Blockchain.
+    :return: <tuple> Success rate over the played trials and its standard error
+    """
+    rate = sum(play_double_spend(share, depth, rng) for _ in range(trials)) / trials
+    return rate, sqrt(rate * (1 - rate) / trials)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte Carlo attack simulations")
+    parser.add_argument('--scenario', choices=('double-spend', 'selfish', 'majority', 'all'), default='all')
+    parser.add_argument('--trials', type=int, default=1_000_000)
+    parser.add_argument('--shares', default='0.1,0.2,0.3,0.4',
+                        help="Attacker hash power shares for the double-spend and selfish scenarios")
+    parser.add_argument('--majority-shares', default='0.5,0.55,0.6,0.7')
+    parser.add_argument('--depths', default='1,2,3,4,5,6', help="Confirmation depths")
+    parser.add_argument('--horizon', type=int, default=100, help="Blocks the majority attacker races for")
+    parser.add_argument('--gamma', type=float, default=0.5, help="Honest share building on the selfish miner in a tie")
+    parser.add_argument('--selfish-trials', type=int, default=10_000)
+    parser.add_argument('--cross-check', type=int, default=200,
+                        help="Double-spends played on Blockchain per share and depth, 0 to skip")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    shares = [float(share) for share in args.shares.split(',')]
+    majority_shares = [float(share) for share in args.majority_shares.split(',')]
+    depths = [int(depth) for depth in args.depths.split(',')]
+    scenarios = ('double-spend', 'selfish', 'majority') if args.scenario == 'all' else (args.scenario,)
+
+    if 'double-spend' in scenarios:
+        print(f"\nDouble-spend success probability, {args.trials} trials (closed form in brackets)")
+        print("share " + "".join(f"{f'z={depth}':>20}" for depth in depths))
+        for share in shares:
+            cells = []
+            for depth in depths:
+                probability, _ = double_spend(share, depth, args.trials, rng)
+                cells.append(f"{probability:.5f} ({double_spend_probability(share, depth):.5f})")
+            print(f"{share:5.2f} " + "".join(f"{cell:>20}" for cell in cells))
+
+        if args.cross_check:
+            print(f"\nCross-check against Blockchain, {args.cross_check} played trials per cell (rate ± std err)")
+            print("share " + "".join(f"{f'z={depth}':>20}" for depth in depths[:2]))
+            for share in shares:
+                cells = []
+                for depth in depths[:2]:
+                    rate, error = cross_check(share, depth, args.cross_check, rng)
+                    cells.append(f"{rate:.3f} ± {error:.3f}")
+                print(f"{share:5.2f} " + "".join(f"{cell:>20}" for cell in cells))
+
+    if 'selfish' in scenarios:
+        print(f"\nSelfish mining share of main chain blocks, gamma {args.gamma}, "
+              f"{args.selfish_trials} trials of {SELFISH_BLOCKS} blocks")
+        print(f"{'share':>5} {'simulated':>10} {'closed form':>12} {'profitable':>11}")
+        for share in shares:
+            revenue = selfish_mining(share, args.gamma, args.selfish_trials, rng)
+            print(f"{share:5.2f} {revenue:10.4f} {eyal_sirer_revenue(share, args.gamma):12.4f} "
+                  f"{'yes' if revenue > share else 'no':>11}")
+
+    if 'majority' in scenarios:
+        print(f"\nMajority attack success within {args.horizon} blocks (mean blocks to get ahead in brackets)")
+        print("share " + "".join(f"{f'z={depth}':>20}" for depth in depths))
+        for share in majority_shares:
+            cells = []
+            for depth in depths:
+                probability, mean_blocks = double_spend(share, depth, args.trials, rng, horizon=args.horizon)
+                cells.append(f"{probability:.4f} ({mean_blocks:.1f})")
+            print(f"{share:5.2f} " + "".join(f"{cell:>20}" for cell in cells))
+
+
+if __name__ == '__main__':
+    main()
@@ -56,6 +56,9 @@ CORS_ALLOW_METHODS = (
     "PUT",
 )
 
+# Lets the frontend read the cursor of the next /api/chain/ page
+CORS_EXPOSE_HEADERS = ["X-Next-Cursor"]
+
 ROOT_URLCONF = 'backend.urls'
 
 TEMPLATES = [
@@ -122,6 +125,44 @@ REST_FRAMEWORK = {
 
 AUTH_USER_MODEL = 'blockchain.CustomUser'
 
+# Proof of work
+BLOCKCHAIN_DIFFICULTY = 8  # Leading zero bits required for the first blocks ('00' in hex)
+BLOCKCHAIN_RETARGET_INTERVAL = None  # Retarget the difficulty every N blocks, None keeps it fixed
+BLOCKCHAIN_BLOCK_TIME = 10  # Target seconds between blocks used by retargeting
+
+# Background mining
+BLOCKCHAIN_MINING_WORKERS = 1  # Threads running mining jobs
+BLOCKCHAIN_MINING_JOB_HISTORY = 1000  # Finished jobs kept for status polling
+
+# Signature verification
+BLOCKCHAIN_PUBLIC_KEY_CACHE_SIZE = 10_000  # Parsed public keys kept in memory
+BLOCKCHAIN_SIGNATURE_CACHE_SIZE = 100_000  # Memoised verification results
+BLOCKCHAIN_VERIFY_THREADS = 4  # Threads verifying the pending pool at mining time
+BLOCKCHAIN_SIGNATURE_SCHEME = "ed25519"  # Scheme of new users' keys: "ed25519" or "rsa-pss"; existing keys keep theirs
+BLOCKCHAIN_KEY_POOL_SIZE = 32  # Key pairs generated ahead of registrations in the background, 0 generates on demand
+
+# /api/chain/ paging
+BLOCKCHAIN_CHAIN_PAGE_SIZE = 100  # Blocks per page when no limit is given
+BLOCKCHAIN_CHAIN_MAX_PAGE_SIZE = 1000  # Largest page a client can ask for, also the streaming read size
+
+# Cached chain and mempool responses, refetched as soon as the tip or the pending set changes
+BLOCKCHAIN_RESPONSE_CACHE_TIMEOUT = 300  # Seconds an unchanged response is kept
+
+# Event stream at /api/events/, served under ASGI
+BLOCKCHAIN_EVENT_QUEUE_SIZE = 256  # Events a stream can fall behind before it is disconnected
+BLOCKCHAIN_EVENT_REPLAY_SIZE = 1_000  # Latest events replayed to a client reconnecting with Last-Event-ID
+BLOCKCHAIN_EVENT_HEARTBEAT = 15  # Idle seconds before a keepalive comment is sent
+BLOCKCHAIN_EVENT_PROGRESS_INTERVAL = 1.0  # Least seconds between two progress events of a mining job
+
+# Balance ledger
+BLOCKCHAIN_SNAPSHOT_INTERVAL = 100  # Blocks between two stored copies of every balance
+
+# Mempool
+BLOCKCHAIN_MEMPOOL_MAX_SIZE = 100_000  # Pending transactions held before the lowest fees are evicted
+BLOCKCHAIN_BLOCK_MAX_TRANSACTIONS = 1_000  # Most transactions mined into one block
+BLOCKCHAIN_NONCE_RETRIES = 10  # Nonces tried for a transaction submitted without one before giving up
+BLOCKCHAIN_BATCH_MAX_TRANSACTIONS = 1_000  # Most transactions submitted in one batch request
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=5),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=90),
@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import CustomUser, Transaction, Block
+from .models import CustomUser, Transaction, Block, BalanceSnapshot
 
 admin.site.register(CustomUser)
 admin.site.register(Transaction)
-admin.site.register(Block)
\ No newline at end of file
+admin.site.register(Block)
+admin.site.register(BalanceSnapshot)
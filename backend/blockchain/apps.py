@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class BlockchainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'blockchain'
+
+    def ready(self):
+        # Connects the signal handlers that reset the validation checkpoint and the cached tip
+        from . import responses, validation  # noqa: F401
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import threading
+import uuid
+from collections import deque
+from itertools import count
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+class Subscriber:
+    """
+    One open event stream: the events waiting to be sent, on the event loop serving it.
+    """
+    __slots__ = ('loop', 'queue', 'since')
+
+    def __init__(self, loop, queue_size, since):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.since = since  # Sequence of the last event it already has
+
+
+class EventBroker:
+    """
+    In-memory fan-out of chain events to Server-Sent Events streams.
+    Events are published from any thread and each is encoded once. Each event loop serving
+    streams is woken once per event and copies it to the queues of its subscribers, so an idle
+    stream costs a queue and a suspended coroutine. A subscriber more than `queue_size` events
+    behind is disconnected; the latest `replay_size` events are kept so a client reconnecting with
+    Last-Event-ID misses nothing, or is told to reload with a resync event when it is too far behind.
+    """
+
+    def __init__(self, queue_size, replay_size):
+        self.queue_size = queue_size
+        self.lock = threading.Lock()
+        self.loops = {}  # Event loop -> its subscribers
+        self.recent = deque(maxlen=replay_size)  # (sequence, message) of the latest events
+        # Event ids are "<epoch>-<sequence>"; the epoch tells ids of an earlier process apart
+        self.epoch = uuid.uuid4().hex[:12]
+        self.sequence = count(1)
+        self.last_sequence = 0
+
+    def publish(self, event, data):
+        """
+        Sends `data`, encoded as JSON, to every subscriber as an event named `event`.
+        """
+        payload = json.dumps(data, cls=DjangoJSONEncoder)
+        with self.lock:
+            sequence = self.last_sequence = next(self.sequence)
+            message = f"id: {self.epoch}-{sequence}\nevent: {event}\ndata: {payload}\n\n".encode()
+            self.recent.append((sequence, message))
+            loops = list(self.loops.items())
+
+        for loop, subscribers in loops:
+            try:
+                loop.call_soon_threadsafe(self.deliver, subscribers, sequence, message)
+            except RuntimeError:
+                # The loop closed while its last streams were ending
+                pass
+
+    def deliver(self, subscribers, sequence, message):
+        """
+        Queues a message for the subscribers of the running loop.
+        """
+        for subscriber in list(subscribers):
+            if sequence <= subscriber.since:
+                # Already in the backlog it was given when subscribing
+                continue
+            try:
+                subscriber.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Too slow: drop what it has not read and end its stream, the client catches up on reconnecting
+                while not subscriber.queue.empty():
+                    subscriber.queue.get_nowait()
+                subscriber.queue.put_nowait(None)
+                self.unsubscribe(subscriber)
+
+    def subscribe(self, last_event_id=None):
+        """
+        Registers a subscriber on the running event loop.
+        Returns it with the messages it missed since `last_event_id`.
+        """
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            subscriber = Subscriber(loop, self.queue_size, self.last_sequence)
+            self.loops.setdefault(loop, set()).add(subscriber)
+            return subscriber, self.backlog(last_event_id)
+
+    def backlog(self, last_event_id):
+        if not last_event_id:
+            return []
+        epoch, _, sequence = last_event_id.partition('-')
+        oldest = self.recent[0][0] if self.recent else self.last_sequence + 1
+        if epoch != self.epoch or not sequence.isdigit() or int(sequence) < oldest - 1:
+            return [b"event: resync\ndata: {}\n\n"]
+        return [message for message_sequence, message in self.recent if message_sequence > int(sequence)]
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            subscribers = self.loops.get(subscriber.loop)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self.loops[subscriber.loop]
+
+    async def stream(self, last_event_id=None, heartbeat=None):
+        """
+        Yields the encoded events for one client until it disconnects or falls too far behind.
+        A comment is sent after `heartbeat` idle seconds so proxies keep the connection open.
+        """
+        subscriber, backlog = self.subscribe(last_event_id)
+        try:
+            yield b"retry: 3000\n\n"
+            for message in backlog:
+                yield message
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscriber.queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                if message is None:
+                    return
+                yield message
+        finally:
+            self.unsubscribe(subscriber)
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(subscribers) for subscribers in self.loops.values())
+
+
+events = EventBroker(settings.BLOCKCHAIN_EVENT_QUEUE_SIZE, settings.BLOCKCHAIN_EVENT_REPLAY_SIZE)
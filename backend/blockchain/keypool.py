@@ -0,0 +1,48 @@
+import queue
+import threading
+
+from django.conf import settings
+
+from .schemes import generate_key_pair
+
+
+class KeyPool:
+    """
+    Key pairs generated ahead of time on a background thread, so registering a user does not wait
+    on key generation. The thread starts on first use and tops the pool up to `size` pairs.
+    When the pool is empty, or `size` is 0, a pair is generated on the spot.
+    """
+
+    def __init__(self, scheme, size):
+        self.scheme = scheme
+        self.size = size
+        self.pairs = queue.Queue(maxsize=max(size, 1))
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def take(self):
+        """
+        Returns a key pair as (public PEM, private PEM).
+        """
+        if self.size <= 0:
+            return generate_key_pair(self.scheme)
+
+        self.start()
+        try:
+            return self.pairs.get_nowait()
+        except queue.Empty:
+            return generate_key_pair(self.scheme)
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.fill, name='key-pool', daemon=True)
+                self.thread.start()
+
+    def fill(self):
+        while True:
+            # Blocks while the pool is full, until a registration takes a pair
+            self.pairs.put(generate_key_pair(self.scheme))
+
+
+key_pool = KeyPool(settings.BLOCKCHAIN_SIGNATURE_SCHEME, settings.BLOCKCHAIN_KEY_POOL_SIZE)
@@ -0,0 +1,124 @@
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Max, Sum
+
+from .models import BalanceSnapshot, Block, CustomUser, Transaction
+
+# Balance of an address before any transaction touched it
+INITIAL_BALANCE = CustomUser._meta.get_field('currency').default
+
+
+def tip_height():
+    """
+    Index of the last block, 0 for an empty chain.
+    """
+    return Block.objects.aggregate(height=Max('index'))['height'] or 0
+
+
+def nearest_snapshot(height):
+    """
+    Height and balances of the newest snapshot at or below `height`,
+    or the empty genesis state when there is none.
+    """
+    snapshot = BalanceSnapshot.objects.filter(height__lte=height).order_by('-height').first()
+    if snapshot is None:
+        return 0, {}
+    return snapshot.height, snapshot.balances
+
+
+def balance_changes(after, upto, address=None):
+    """
+    Net balance change per address over the blocks with an index in (after, upto],
+    summed by the database in two grouped queries. Limited to `address` when given.
+    """
+    mined = Transaction.objects.filter(block__index__gt=after, block__index__lte=upto)
+    sent = mined.filter(sender_address=address) if address else mined
+    received = mined.filter(recipient_address=address) if address else mined
+
+    changes = defaultdict(float)
+    for row in sent.values('sender_address').annotate(total=Sum('amount')):
+        changes[row['sender_address']] -= row['total']
+    for row in received.values('recipient_address').annotate(total=Sum('amount')):
+        changes[row['recipient_address']] += row['total']
+    return changes
+
+
+def balances_at(height):
+    """
+    Balance of every address a transaction touched, after the block at index `height`:
+    the nearest snapshot below it plus the changes of the blocks since.
+    """
+    snapshot_height, balances = nearest_snapshot(height)
+    balances = dict(balances)
+    for address, change in balance_changes(snapshot_height, height).items():
+        balances[address] = balances.get(address, INITIAL_BALANCE) + change
+    return balances
+
+
+def balance_at(address, height):
+    """
+    Balance of `address` after the block at index `height`.
+    """
+    snapshot_height, balances = nearest_snapshot(height)
+    change = balance_changes(snapshot_height, height, address).get(address, 0.0)
+    return balances.get(address, INITIAL_BALANCE) + change
+
+
+def take_snapshot(block):
+    """
+    Stores the balances after `block` when its index falls on the snapshot interval.
+    Meant to run in the transaction that settles the block.
+    """
+    if block.index % settings.BLOCKCHAIN_SNAPSHOT_INTERVAL:
+        return None
+    snapshot, _ = BalanceSnapshot.objects.update_or_create(
+        height=block.index,
+        defaults={'block_hash': block.current_hash, 'balances': balances_at(block.index)},
+    )
+    return snapshot
+
+
+def rebuild_snapshots():
+    """
+    Brings the snapshots in line with the chain, e.g. after blocks were replaced.
+    Drops every snapshot from the first one whose block is no longer on the chain, then
+    rebuilds the missing ones forward from the newest snapshot left.
+    Returns the number of snapshots written.
+    """
+    chain_hashes = dict(
+        Block.objects.filter(index__in=BalanceSnapshot.objects.values('height')).values_list('index', 'current_hash')
+    )
+    for snapshot in BalanceSnapshot.objects.order_by('height').only('height', 'block_hash'):
+        if chain_hashes.get(snapshot.height) != snapshot.block_hash:
+            BalanceSnapshot.objects.filter(height__gte=snapshot.height).delete()
+            break
+
+    interval = settings.BLOCKCHAIN_SNAPSHOT_INTERVAL
+    height, balances = nearest_snapshot(tip_height())
+    written = 0
+    for block in Block.objects.filter(index__gt=height, index__gte=interval).order_by('index').only('index', 'current_hash'):
+        if block.index % interval:
+            continue
+        balances = dict(balances)
+        for address, change in balance_changes(height, block.index).items():
+            balances[address] = balances.get(address, INITIAL_BALANCE) + change
+        BalanceSnapshot.objects.create(height=block.index, block_hash=block.current_hash, balances=balances)
+        height = block.index
+        written += 1
+    return written
+
+
+def audit_balances():
+    """
+    Compares the stored balance of every user with the balance replayed from the chain.
+    Returns {address: (replayed, stored)} for the users that disagree.
+    """
+    replayed = balances_at(tip_height())
+    mismatches = {}
+    for address, stored in CustomUser.objects.filter(address__isnull=False).values_list('address', 'currency'):
+        expected = replayed.get(address, INITIAL_BALANCE)
+        if not math.isclose(expected, stored, abs_tol=1e-6):
+            mismatches[address] = (expected, stored)
+    return mismatches
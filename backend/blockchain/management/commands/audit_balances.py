@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from blockchain.ledger import audit_balances, rebuild_snapshots
+
+
+class Command(BaseCommand):
+    help = "Checks the stored user balances against the balances replayed from the chain."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help="Rebuild the balance snapshots first, e.g. after blocks were replaced")
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            written = rebuild_snapshots()
+            self.stdout.write(f"Wrote {written} snapshots")
+
+        mismatches = audit_balances()
+        for address, (replayed, stored) in mismatches.items():
+            self.stdout.write(f"{address}: chain {replayed}, stored {stored}")
+        self.stdout.write(f"{len(mismatches)} balances differ from the chain")
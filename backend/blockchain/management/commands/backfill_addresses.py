@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from blockchain.models import CustomUser, Transaction, public_key_address
+
+
+class Command(BaseCommand):
+    help = "Fills in the public key addresses of users and transactions created before addresses existed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        users = CustomUser.objects.filter(address__isnull=True, public_key__isnull=False).order_by('id')
+        updated = self.backfill(users, ['address'], batch_size, self.fill_user)
+        self.stdout.write(f"Backfilled {updated} users")
+
+        transactions = Transaction.objects.filter(
+            Q(sender_address__isnull=True) | Q(recipient_address__isnull=True)
+        ).order_by('id')
+        updated = self.backfill(transactions, ['sender_address', 'recipient_address'], batch_size, Transaction.fill_addresses)
+        self.stdout.write(f"Backfilled {updated} transactions")
+
+    @staticmethod
+    def fill_user(user):
+        user.address = public_key_address(user.public_key)
+
+    @staticmethod
+    def backfill(queryset, fields, batch_size, fill):
+        """
+        Walks the rows in id order, filling and writing back one batch at a time.
+        """
+        updated = 0
+        last_id = 0
+        while True:
+            batch = list(queryset.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                return updated
+            for row in batch:
+                fill(row)
+            queryset.model.objects.bulk_update(batch, fields)
+            updated += len(batch)
+            last_id = batch[-1].id
@@ -0,0 +1,313 @@
+import heapq
+import threading
+from bisect import insort
+from collections import defaultdict
+from itertools import count
+
+from django.conf import settings
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import Max
+
+from .events import events
+from .models import CustomUser, Transaction
+from .serializers import TransactionSerializer
+
+
+class MempoolError(Exception):
+    """
+    A transaction the mempool refuses to admit.
+    """
+
+
+class NonceConflict(MempoolError):
+    """
+    The sender already used the transaction's nonce.
+    """
+
+
+class PoolEntry:
+    """
+    What the mempool keeps of a pending transaction.
+    """
+    __slots__ = ('id', 'sender', 'nonce', 'fee', 'amount', 'sequence')
+
+    def __init__(self, id, sender, nonce, fee, amount, sequence):
+        self.id = id
+        self.sender = sender
+        self.nonce = nonce
+        self.fee = fee
+        self.amount = amount
+        self.sequence = sequence  # Admission order, breaks ties between equal fees
+
+
+class Mempool:
+    """
+    In-memory index of the pending transactions, ordered by the fee they offer.
+    A (sender, nonce) pair is admitted once and a nonce below the sender's mined ones is stale,
+    so a conflicting resubmission is refused without a query. A sender cannot have more pending
+    than their balance. When the pool is full the lowest fee transaction is evicted and deleted.
+    Blocks are filled highest fee first while keeping each sender's transactions in nonce order.
+    The pending rows are loaded on first use; transactions must then be added through the pool.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.lock = threading.RLock()
+        self.loaded = False
+        self.entries = {}  # (sender, nonce) -> entry
+        self.pending_nonces = {}  # Sender -> sorted nonces of their pending transactions
+        self.pending_spend = defaultdict(float)  # Sender -> total amount pending
+        self.account_nonces = {}  # Sender -> lowest nonce not mined yet, loaded on demand
+        # Min-heap of (fee, -sequence, key) to find the entry to evict; removed entries are skipped lazily
+        self.eviction_heap = []
+        self.sequence = count()
+        self.version = 0  # Bumped after every change of the pending set, once it is in the database
+
+    def __len__(self):
+        with self.lock:
+            self.load()
+            return len(self.entries)
+
+    def load(self):
+        """
+        Indexes the pending transactions already in the database.
+        Transactions from before nonces existed are keyed by their negated id, which orders them
+        before any real nonce of their sender and never conflicts with one.
+        """
+        if self.loaded:
+            return
+        pending = Transaction.objects.filter(block__isnull=True).order_by('id')
+        for id, sender, nonce, fee, amount in pending.values_list('id', 'sender_address', 'nonce', 'fee', 'amount'):
+            self.insert(PoolEntry(id, sender, -id if nonce is None else nonce, fee, amount, next(self.sequence)))
+        self.loaded = True
+
+    def account_nonce(self, sender):
+        nonce = self.account_nonces.get(sender)
+        if nonce is None:
+            mined = Transaction.objects.filter(sender_address=sender, block__isnull=False).aggregate(nonce=Max('nonce'))
+            nonce = self.account_nonces[sender] = 0 if mined['nonce'] is None else mined['nonce'] + 1
+        return nonce
+
+    def next_nonce(self, sender):
+        """
+        The nonce the next transaction of `sender` should use: the first one missing from their
+        pending run, so a transaction fills the place of one that was evicted or discarded.
+        """
+        with self.lock:
+            self.load()
+            nonce = self.account_nonce(sender)
+            nonces = [pending for pending in self.pending_nonces.get(sender, ()) if pending >= 0]
+            if nonces and nonces[0] == nonce and nonces[-1] - nonce == len(nonces) - 1:
+                return nonces[-1] + 1
+            for pending in nonces:
+                if pending != nonce:
+                    break
+                nonce += 1
+            return nonce
+
+    def add(self, transaction):
+        """
+        Admits a signed transaction and saves it.
+        Raises NonceConflict if its nonce is used, MempoolError if the sender cannot afford it
+        on top of their pending transactions, either party is unknown or the pool is full of higher fees.
+        """
+        error = self.add_many([transaction])[0]
+        if error is not None:
+            raise error
+
+    def add_many(self, transactions):
+        """
+        Admits signed transactions in order and saves the admitted ones with one bulk insert.
+        Each transaction is checked as add() does, against the pool and the transactions before it.
+        Returns one entry per transaction: None if it was admitted, otherwise the MempoolError refusing it.
+        """
+        for transaction in transactions:
+            transaction.fill_addresses()
+        addresses = {tx.sender_address for tx in transactions} | {tx.recipient_address for tx in transactions}
+
+        errors = [None] * len(transactions)
+        with self.lock:
+            self.load()
+            # Read under the lock, so the balances and the pending spend come from the same side of a block
+            balances = dict(CustomUser.objects.filter(address__in=addresses).values_list('address', 'currency'))
+            admitted = []  # (position, transaction, entry)
+            evicted = []
+            for position, transaction in enumerate(transactions):
+                try:
+                    entry = self.admit(transaction, balances, evicted)
+                except MempoolError as error:
+                    errors[position] = error
+                    continue
+                admitted.append((position, transaction, entry))
+
+            # Entries of this batch evicted by later, higher fee transactions of the same batch
+            for position, transaction, entry in admitted:
+                if self.entries.get((entry.sender, entry.nonce)) is not entry:
+                    errors[position] = MempoolError("Mempool is full.")
+            admitted = [item for item in admitted if errors[item[0]] is None]
+            evicted_ids = [entry.id for entry in evicted if entry.id is not None]
+            if evicted_ids:
+                Transaction.objects.filter(id__in=evicted_ids).delete()
+
+            try:
+                self.save(admitted, errors)
+            finally:
+                for position, transaction, entry in admitted:
+                    entry.id = transaction.id
+                if admitted or evicted:
+                    self.version += 1
+
+        saved = [transaction for position, transaction, _ in admitted if errors[position] is None]
+        if saved:
+            events.publish('transactions', TransactionSerializer(saved, many=True).data)
+        return errors
+
+    def save(self, admitted, errors):
+        """
+        Saves the admitted transactions with one bulk insert. If another process used one of the nonces,
+        they are saved one at a time and those whose nonce is used are refused in `errors`.
+        Any other integrity error is raised, after dropping the entries of the transactions left unsaved.
+        """
+        try:
+            with db_transaction.atomic():
+                Transaction.objects.bulk_create([transaction for _, transaction, _ in admitted])
+            return
+        except IntegrityError:
+            pass
+
+        for number, (position, transaction, entry) in enumerate(admitted):
+            try:
+                with db_transaction.atomic():
+                    transaction.save()
+            except IntegrityError:
+                used = Transaction.objects.filter(sender_address=transaction.sender_address, nonce=transaction.nonce)
+                if not used.exists():
+                    for _, _, unsaved in admitted[number:]:
+                        if self.entries.get((unsaved.sender, unsaved.nonce)) is unsaved:
+                            self.remove(unsaved)
+                    raise
+                self.remove(entry)
+                errors[position] = NonceConflict(f"Nonce {transaction.nonce} is already used.")
+
+    def admit(self, transaction, balances, evicted):
+        """
+        Checks a transaction against the pool and reserves its entry, appending the entries
+        it evicts to `evicted`. The entry gets the transaction's id once it is saved.
+        """
+        sender = transaction.sender_address
+        if sender not in balances:
+            raise MempoolError("Sender is not a registered user.")
+        if transaction.recipient_address not in balances:
+            raise MempoolError("Recipient is not a registered user.")
+        if transaction.nonce < self.account_nonce(sender):
+            raise NonceConflict(f"Nonce {transaction.nonce} is already mined.")
+        if (sender, transaction.nonce) in self.entries:
+            raise NonceConflict(f"Nonce {transaction.nonce} is already pending.")
+        if self.pending_spend[sender] + transaction.amount > balances[sender]:
+            raise MempoolError("Insufficient balance for the pending transactions.")
+        if len(self.entries) >= self.max_size:
+            lowest = self.lowest()
+            if lowest is None or lowest.fee >= transaction.fee:
+                raise MempoolError("Mempool is full.")
+            self.remove(lowest)
+            evicted.append(lowest)
+
+        entry = PoolEntry(None, sender, transaction.nonce, transaction.fee, transaction.amount, next(self.sequence))
+        self.insert(entry)
+        return entry
+
+    def insert(self, entry):
+        self.entries[(entry.sender, entry.nonce)] = entry
+        insort(self.pending_nonces.setdefault(entry.sender, []), entry.nonce)
+        self.pending_spend[entry.sender] += entry.amount
+        heapq.heappush(self.eviction_heap, (entry.fee, -entry.sequence, (entry.sender, entry.nonce)))
+
+    def lowest(self):
+        """
+        The entry evicted first: the lowest fee, the newest among equal fees. None when the pool is empty.
+        """
+        heap = self.eviction_heap
+        while heap:
+            fee, sequence, key = heap[0]
+            entry = self.entries.get(key)
+            if entry is not None and entry.sequence == -sequence:
+                return entry
+            heapq.heappop(heap)
+
+    def remove(self, entry):
+        del self.entries[(entry.sender, entry.nonce)]
+        nonces = self.pending_nonces[entry.sender]
+        nonces.remove(entry.nonce)
+        if not nonces:
+            del self.pending_nonces[entry.sender]
+            del self.pending_spend[entry.sender]
+        else:
+            self.pending_spend[entry.sender] -= entry.amount
+
+        # Rebuild the eviction heap once it is mostly removed entries
+        if len(self.eviction_heap) > 2 * len(self.entries) + 64:
+            self.eviction_heap = [(e.fee, -e.sequence, key) for key, e in self.entries.items()]
+            heapq.heapify(self.eviction_heap)
+
+    def select(self, limit):
+        """
+        The best entries for the next block, in O(S + limit log S) for S senders.
+        Only the lowest pending nonce of each sender is a candidate, so a sender's transactions
+        are taken in order, and a sender's run stops at a missing nonce: an evicted or discarded
+        transaction leaves the ones after it waiting for its nonce to be used again.
+        Transactions from before nonces existed need no run.
+        """
+        with self.lock:
+            self.load()
+            candidates = []
+            for sender, nonces in self.pending_nonces.items():
+                if self.follows(sender, nonces, 0):
+                    entry = self.entries[(sender, nonces[0])]
+                    candidates.append((-entry.fee, entry.sequence, sender, 0))
+            heapq.heapify(candidates)
+
+            selected = []
+            while candidates and len(selected) < limit:
+                _, _, sender, position = heapq.heappop(candidates)
+                nonces = self.pending_nonces[sender]
+                selected.append(self.entries[(sender, nonces[position])])
+                if position + 1 < len(nonces) and self.follows(sender, nonces, position + 1):
+                    entry = self.entries[(sender, nonces[position + 1])]
+                    heapq.heappush(candidates, (-entry.fee, entry.sequence, sender, position + 1))
+            return selected
+
+    def follows(self, sender, nonces, position):
+        """
+        Whether the pending nonce at `position` can be mined right after the ones before it.
+        """
+        nonce = nonces[position]
+        if nonce < 0:
+            return True
+        if position == 0 or nonces[position - 1] < 0:
+            return nonce == self.account_nonce(sender)
+        return nonce == nonces[position - 1] + 1
+
+    def confirm(self, entries):
+        """
+        Removes entries mined into a committed block and retires their nonces.
+        """
+        with self.lock:
+            for entry in entries:
+                if self.entries.get((entry.sender, entry.nonce)) is entry:
+                    self.remove(entry)
+                if entry.nonce >= 0:
+                    self.account_nonces[entry.sender] = max(self.account_nonce(entry.sender), entry.nonce + 1)
+            self.version += 1
+
+    def discard(self, entries):
+        """
+        Removes entries that will never be mined, leaving their nonces free.
+        """
+        with self.lock:
+            for entry in entries:
+                if self.entries.get((entry.sender, entry.nonce)) is entry:
+                    self.remove(entry)
+            self.version += 1
+
+
+mempool = Mempool(settings.BLOCKCHAIN_MEMPOOL_MAX_SIZE)
@@ -0,0 +1,59 @@
+from hashlib import sha256
+
+
+def merkle_parent(left, right):
+    """
+    Hash of an inner node. Leaves and inner nodes use different prefixes
+    so an inner node can never be passed off as a transaction.
+    """
+    return sha256(b'\x01' + left + right).digest()
+
+
+def merkle_levels(leaves):
+    """
+    Builds the Merkle tree over a list of leaf hashes, from the leaves up to the root.
+    A node without a sibling is carried up to the next level unchanged.
+    """
+    level = list(leaves)
+    levels = [level]
+    while len(level) > 1:
+        level = [
+            merkle_parent(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+            for i in range(0, len(level), 2)
+        ]
+        levels.append(level)
+    return levels
+
+
+def merkle_root(leaves):
+    """
+    Merkle root of a list of leaf hashes, the hash of the empty string when there are none.
+    """
+    if not leaves:
+        return sha256(b'').hexdigest()
+    return merkle_levels(leaves)[-1][0].hex()
+
+
+def merkle_proof(leaves, position):
+    """
+    Inclusion proof for the leaf at `position`: the [sibling hash, 'left' or 'right'] pairs
+    on the path to the root, from the leaf upwards.
+    """
+    proof = []
+    for level in merkle_levels(leaves)[:-1]:
+        sibling = position ^ 1
+        if sibling < len(level):
+            proof.append([level[sibling].hex(), 'left' if sibling < position else 'right'])
+        position //= 2
+    return proof
+
+
+def verify_merkle_proof(leaf, proof, root):
+    """
+    Checks an inclusion proof from merkle_proof for a leaf hash against a Merkle root.
+    """
+    node = leaf
+    for sibling, side in proof:
+        sibling = bytes.fromhex(sibling)
+        node = merkle_parent(sibling, node) if side == 'left' else merkle_parent(node, sibling)
+    return node.hex() == root
@@ -0,0 +1,214 @@
+import math
+import queue
+import threading
+import uuid
+from collections import OrderedDict
+from time import monotonic
+
+from django.conf import settings
+from django.db import close_old_connections, transaction as db_transaction
+from django.utils import timezone
+
+from .events import events
+from .ledger import take_snapshot
+from .mempool import mempool
+from .models import Block, CustomUser, Transaction
+from .proof import ProofHasher
+from .serializers import BlockHeaderSerializer, BlockSerializer
+from .settlement import settle_transactions
+from .signatures import verify_transactions
+
+# Nonces tried between two progress updates of a running job
+PROGRESS_STEP = 10_000
+
+
+class MiningJob:
+    """
+    A request to mine the pending transactions on top of a chain tip.
+    Moves from queued to running to done, or to failed with an error message.
+    """
+
+    def __init__(self, tip):
+        self.id = uuid.uuid4().hex
+        self.tip = tip
+        self.status = 'queued'
+        self.attempts = 0  # Nonces tried so far
+        self.block = None
+        self.error = None
+        self.created = timezone.now()
+        self.finished = None
+        self.reported = None  # When the job's state was last published
+
+    def as_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "tip": self.tip,
+            "attempts": self.attempts,
+            "block": self.block,
+            "error": self.error,
+            "created": self.created.isoformat(),
+            "finished": self.finished.isoformat() if self.finished else None,
+        }
+
+    def report(self, progress=False):
+        """
+        Publishes the job's state as a mining event. Progress while running is published
+        at most every BLOCKCHAIN_EVENT_PROGRESS_INTERVAL seconds.
+        """
+        now = monotonic()
+        if progress and self.reported is not None and now - self.reported < settings.BLOCKCHAIN_EVENT_PROGRESS_INTERVAL:
+            return
+        self.reported = now
+        events.publish('mining', self.as_dict())
+
+
+def mine_pending_block(job=None):
+    """
+    Mines the best pending transactions of the mempool into a new block and settles them.
+    Reports the nonces tried to `job` while searching.
+    Transactions whose signature does not verify can never be mined and are deleted.
+    Returns None when there is nothing to mine. Raises CustomUser.DoesNotExist if a transaction
+    involves an unknown user, in which case nothing is written.
+    """
+    if not mempool:
+        return None
+
+    last_block = Block.objects.last()
+    last_proof = last_block.proof if last_block else 0
+    index = last_block.index + 1 if last_block else 1
+    previous_hash = last_block.current_hash if last_block else '1'
+    difficulty = last_block.next_difficulty() if last_block else settings.BLOCKCHAIN_DIFFICULTY
+
+    hasher = ProofHasher(last_proof, difficulty)
+    start = 0
+    proof = None
+    while proof is None:
+        proof = hasher.search(start, start + PROGRESS_STEP)
+        start += PROGRESS_STEP
+        if job:
+            job.attempts = start if proof is None else proof + 1
+            job.report(progress=True)
+
+    # Settle the block all at once, or not at all
+    with db_transaction.atomic():
+        entries = {entry.id: entry for entry in mempool.select(settings.BLOCKCHAIN_BLOCK_MAX_TRANSACTIONS)}
+        pending_transactions = list(Transaction.objects.filter(id__in=entries, block__isnull=True).order_by('id'))
+        verified = verify_transactions(pending_transactions)
+        invalid = [tx.id for tx, valid in zip(pending_transactions, verified) if not valid]
+        if invalid:
+            Transaction.objects.filter(id__in=invalid).delete()
+            # A sender's transactions after an invalid one stay pending, mining them would skip its nonce
+            gaps = {}
+            for tx, valid in zip(pending_transactions, verified):
+                nonce = entries[tx.id].nonce
+                if not valid and nonce >= 0 and nonce < gaps.get(tx.sender_address, math.inf):
+                    gaps[tx.sender_address] = nonce
+            pending_transactions = [tx for tx, valid in zip(pending_transactions, verified) if valid]
+            for tx in pending_transactions:
+                if entries[tx.id].nonce > gaps.get(tx.sender_address, math.inf):
+                    del entries[tx.id]
+            pending_transactions = [tx for tx in pending_transactions if tx.id in entries]
+        mined = [entries.pop(tx.id) for tx in pending_transactions]
+        # Whatever is left was invalid, or was mined or deleted behind the pool's back.
+        # The pool only changes once the block is committed, so a rollback leaves it matching the rows
+        leftover = list(entries.values())
+        db_transaction.on_commit(lambda: mempool.discard(leftover))
+        db_transaction.on_commit(lambda: mempool.confirm(mined))
+        if not pending_transactions:
+            return None
+
+        block = Block.objects.create(
+            index=index,
+            proof=proof,
+            previous_hash=previous_hash,
+            difficulty=difficulty,
+        )
+        settle_transactions(block, pending_transactions)
+
+        block.merkle_root = block.compute_merkle_root(pending_transactions)
+        block.current_hash = block.hash_block()
+        block.save()
+        take_snapshot(block)
+
+    events.publish('block', dict(BlockHeaderSerializer(block).data, transaction_count=len(pending_transactions)))
+    return block
+
+
+class MiningQueue:
+    """
+    Runs mining jobs on background threads fed by a local queue, so requests return at once.
+    There is at most one queued or running job per chain tip: asking to mine a tip that
+    already has a job returns that job. Finished jobs are kept for polling up to `history` jobs.
+    """
+
+    def __init__(self, workers, history):
+        self.workers = workers
+        self.history = history
+        self.jobs = OrderedDict()  # Job id -> job, oldest first
+        self.active = {}  # Chain tip -> its queued or running job
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        # Held while a block is mined and written, so two workers never extend the same tip
+        self.tip_lock = threading.Lock()
+        self.threads = []
+
+    def submit(self, tip):
+        with self.lock:
+            job = self.active.get(tip)
+            if job:
+                return job
+
+            job = MiningJob(tip)
+            self.active[tip] = job
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.history:
+                self.jobs.popitem(last=False)
+
+            self.start_workers()
+            self.queue.put(job)
+        job.report()
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def start_workers(self):
+        while len(self.threads) < self.workers:
+            thread = threading.Thread(target=self.work, name=f'miner-{len(self.threads)}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def work(self):
+        while True:
+            job = self.queue.get()
+            try:
+                self.run(job)
+            finally:
+                close_old_connections()
+                self.queue.task_done()
+
+    def run(self, job):
+        with self.tip_lock:
+            job.status = 'running'
+            job.report()
+            try:
+                block = mine_pending_block(job)
+                job.block = BlockSerializer(block).data if block else None
+                status = 'done'
+            except CustomUser.DoesNotExist:
+                job.error = "Transaction involves an invalid user."
+                status = 'failed'
+            except Exception as error:
+                job.error = str(error)
+                status = 'failed'
+
+        job.finished = timezone.now()
+        job.status = status
+        with self.lock:
+            self.active.pop(job.tip, None)
+        job.report()
+
+
+mining_queue = MiningQueue(settings.BLOCKCHAIN_MINING_WORKERS, settings.BLOCKCHAIN_MINING_JOB_HISTORY)
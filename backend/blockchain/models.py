@@ -1,35 +1,52 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
-from cryptography.hazmat.primitives.asymmetric import rsa, padding
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import serialization, hashes
+from cryptography.hazmat.primitives import serialization
 from django.contrib.auth import get_user_model
+from django.conf import settings
+from .proof import next_difficulty
+from .merkle import merkle_root
+from .schemes import scheme_of
+from .keypool import key_pool
+from functools import lru_cache
 import hashlib
 
+
+@lru_cache(maxsize=10_000)
+def public_key_address(pem):
+    """
+    Fixed-length address of a PEM public key: the SHA-256 fingerprint of its DER SubjectPublicKeyInfo.
+    Returns None if the PEM is not a valid public key.
+    """
+    try:
+        public_key = serialization.load_pem_public_key(pem.encode())
+    except (ValueError, AttributeError):
+        return None
+    der = public_key.public_bytes(
+        encoding=serialization.Encoding.DER,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return hashlib.sha256(der).hexdigest()
+
+
 class CustomUser(AbstractUser):
     public_key = models.TextField(blank=True, null=True)
+    address = models.CharField(max_length=64, blank=True, null=True, unique=True) # Fingerprint of public_key
     currency = models.FloatField(default=1000.00)
 
     def generate_keys(self):
-
-        private_key = rsa.generate_private_key(
-            public_exponent=65537,
-            key_size=2048,
-            backend=default_backend()
-        )
-        public_key = private_key.public_key()
-
-        self.public_key = public_key.public_bytes(
-            encoding=serialization.Encoding.PEM,
-            format=serialization.PublicFormat.SubjectPublicKeyInfo
-        ).decode('utf-8')
-
-        return private_key.private_bytes(
-            encoding=serialization.Encoding.PEM,
-            format=serialization.PrivateFormat.TraditionalOpenSSL,
-            encryption_algorithm=serialization.NoEncryption()
-        ).decode('utf-8')
+        """
+        Gives the user a key pair of the configured signature scheme, taken from the key pool,
+        and returns the private key as PEM.
+        """
+        self.public_key, private_key_pem = key_pool.take()
+        self.address = public_key_address(self.public_key)
+        return private_key_pem
     
+    def save(self, *args, **kwargs):
+        if self.public_key and not self.address:
+            self.address = public_key_address(self.public_key)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.username
     
@@ -38,41 +55,63 @@ User = get_user_model()
 class Transaction(models.Model):
     sender = models.TextField()  # Public key of the sender
     recipient_public_key = models.TextField()  # Recipient's public key
+    sender_address = models.CharField(max_length=64, blank=True, null=True, db_index=True)
+    recipient_address = models.CharField(max_length=64, blank=True, null=True, db_index=True)
     amount = models.FloatField()
+    fee = models.FloatField(default=0.0) # Offered to be mined sooner, higher fees are mined first
+    nonce = models.PositiveIntegerField(blank=True, null=True) # Position in the sender's sequence of transactions
     timestamp = models.DateTimeField(auto_now_add=True)
     signature = models.TextField(blank=True, null=True)  # Field to store the signature
 
+    class Meta:
+        constraints = [
+            # A sender cannot spend the same nonce twice
+            models.UniqueConstraint(fields=['sender_address', 'nonce'], name='unique_sender_nonce'),
+        ]
+
+    def signed_data(self):
+        """
+        The bytes covered by the signature.
+        Transactions from before nonces existed keep their original signed data.
+        """
+        data = f"{self.sender}|{self.recipient_public_key}|{self.amount}"
+        if self.nonce is not None:
+            data += f"|{self.nonce}|{self.fee}"
+        return data.encode()
+
     def sign_transaction(self, private_key):
         """
-        Signs the transaction using the sender's private key.
+        Signs the transaction using the sender's private key, with the scheme the key belongs to.
+        """
+        self.signature = scheme_of(private_key).sign(private_key, self.signed_data()).hex()  # Convert the signature to a hex string
+
+    def leaf_hash(self):
+        """
+        Merkle leaf of the transaction: the signed data and the signature, prefixed so a leaf
+        can never be confused with an inner node of the tree.
+        """
+        return hashlib.sha256(b'\x00' + self.signed_data() + f"|{self.signature}".encode()).digest()
+
+    def fill_addresses(self):
+        """
+        Derives the sender and recipient addresses from their public keys when they are missing.
         """
-        transaction_data = f"{self.sender}|{self.recipient_public_key}|{self.amount}".encode()
-        self.signature = private_key.sign(
-            transaction_data,
-            padding.PSS(
-                mgf=padding.MGF1(hashes.SHA256()),
-                salt_length=padding.PSS.MAX_LENGTH
-            ),
-            hashes.SHA256()
-        ).hex()  # Convert the signature to a hex string
+        if not self.sender_address:
+            self.sender_address = public_key_address(self.sender)
+        if not self.recipient_address:
+            self.recipient_address = public_key_address(self.recipient_public_key)
+
+    def save(self, *args, **kwargs):
+        self.fill_addresses()
+        super().save(*args, **kwargs)
 
     def is_valid(self, public_key):
         """
-        Verifies the signature of the transaction.
+        Verifies the signature of the transaction, with the scheme the sender's key belongs to.
         """
-        transaction_data = f"{self.sender}|{self.recipient_public_key}|{self.amount}".encode()
         try:
-            public_key.verify(
-                bytes.fromhex(self.signature),  # Convert hex string back to bytes
-                transaction_data,
-                padding.PSS(
-                    mgf=padding.MGF1(hashes.SHA256()),
-                    salt_length=padding.PSS.MAX_LENGTH
-                ),
-                hashes.SHA256()
-            )
-            return True
-        except Exception:
+            return scheme_of(public_key).verify(public_key, bytes.fromhex(self.signature), self.signed_data())
+        except (ValueError, TypeError):
             return False
         
     def __str__(self):
@@ -80,18 +119,59 @@ class Transaction(models.Model):
 
 
 class Block(models.Model):
-    index = models.IntegerField()
+    index = models.IntegerField(db_index=True)
     proof = models.IntegerField() # Nonce
-    previous_hash = models.CharField(max_length=64)
-    current_hash = models.CharField(max_length=64, blank=True, null=True)
+    previous_hash = models.CharField(max_length=64, db_index=True)
+    current_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True)
     transactions = models.ManyToManyField('Transaction', blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
+    difficulty = models.PositiveSmallIntegerField(default=8) # Leading zero bits of the proof
+    merkle_root = models.CharField(max_length=64, blank=True, null=True) # Root of the transactions' Merkle tree
 
     def hash_block(self):
 
-        block_string = f'{self.index}{self.proof}{self.previous_hash}{self.timestamp}'
+        # Blocks mined before Merkle roots were recorded keep their original hash
+        block_string = f'{self.index}{self.proof}{self.previous_hash}{self.timestamp}{self.merkle_root or ""}'
         return hashlib.sha256(block_string.encode()).hexdigest()
+
+    def ordered_transactions(self):
+        """
+        Transactions in the order their Merkle leaves are laid out
+        """
+        return self.transactions.order_by('id')
+
+    def compute_merkle_root(self, transactions=None):
+        """
+        Merkle root over the block's transactions, or over `transactions` when they are
+        already loaded, in which case they must be in ordered_transactions() order.
+        """
+        if transactions is None:
+            transactions = self.ordered_transactions()
+        return merkle_root([transaction.leaf_hash() for transaction in transactions])
+
+    def next_difficulty(self):
+        """
+        Returns the difficulty required for the block mined on top of this one.
+        """
+        index = self.index + 1
+        interval = settings.BLOCKCHAIN_RETARGET_INTERVAL
+        timestamps = []
+        if interval and index % interval == 0:
+            timestamps = list(
+                Block.objects.filter(index__gte=index - interval, index__lt=index)
+                .order_by('index')
+                .values_list('timestamp', flat=True)
+            )
+        return next_difficulty(index, self.difficulty, timestamps)
     
     def __str__(self):
         return "Block " + str(self.index)
-    
\ No newline at end of file
+    
+
+class BalanceSnapshot(models.Model):
+    height = models.IntegerField(unique=True) # Index of the last block applied
+    block_hash = models.CharField(max_length=64) # Hash of that block, to detect it was replaced
+    balances = models.JSONField(default=dict) # Address -> balance, for every address a transaction touched
+
+    def __str__(self):
+        return "Snapshot at " + str(self.height)
@@ -0,0 +1,74 @@
+import math
+from hashlib import sha256
+
+from django.conf import settings
+
+MAX_DIFFICULTY = 256
+
+# Retargeting moves the difficulty by at most this many bits at a time (a factor of 4 in work)
+MAX_RETARGET_STEP = 2
+
+
+def difficulty_target(difficulty):
+    """
+    Returns the largest digest that has `difficulty` leading zero bits, as 32 big-endian bytes.
+    """
+    return ((1 << (MAX_DIFFICULTY - difficulty)) - 1).to_bytes(32, 'big')
+
+
+def retarget(difficulty, actual_time, expected_time):
+    """
+    Moves the difficulty by log2(expected / actual) bits, since each bit doubles the work,
+    bounded by MAX_RETARGET_STEP in either direction.
+    """
+    step = MAX_RETARGET_STEP
+    if actual_time > 0:
+        step = round(math.log2(expected_time / actual_time))
+    step = max(-MAX_RETARGET_STEP, min(MAX_RETARGET_STEP, step))
+    return max(0, min(MAX_DIFFICULTY, difficulty + step))
+
+
+def next_difficulty(index, previous_difficulty, timestamps):
+    """
+    Returns the difficulty required for the block at `index`.
+    `timestamps` are the timestamps of the retarget interval blocks before it, oldest first;
+    they are only read when `index` starts a new retarget period.
+    """
+    interval = settings.BLOCKCHAIN_RETARGET_INTERVAL
+    if not interval or interval < 2 or index % interval != 0 or len(timestamps) < interval:
+        return previous_difficulty
+
+    actual_time = (timestamps[-1] - timestamps[0]).total_seconds()
+    return retarget(previous_difficulty, actual_time, settings.BLOCKCHAIN_BLOCK_TIME * (interval - 1))
+
+
+class ProofHasher:
+    """
+    Fast path for the proof of work.
+    The fixed prefix is hashed once and its SHA-256 state is copied for every nonce,
+    so each attempt only feeds the nonce bytes. The target is checked on the raw digest.
+    """
+
+    def __init__(self, prefix, difficulty):
+        self.midstate = sha256(str(prefix).encode())
+        self.target = difficulty_target(difficulty)
+
+    def check(self, proof):
+        guess = self.midstate.copy()
+        guess.update(b'%d' % proof)
+        return guess.digest() <= self.target
+
+    def search(self, start=0, stop=None):
+        """
+        Returns the lowest valid proof from `start` on, or None if there is none below `stop`.
+        """
+        copy = self.midstate.copy
+        target = self.target
+        proof = start
+        while stop is None or proof < stop:
+            guess = copy()
+            guess.update(b'%d' % proof)
+            if guess.digest() <= target:
+                return proof
+            proof += 1
+        return None
@@ -0,0 +1,101 @@
+import hashlib
+import time
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction as db_transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+from .mempool import mempool
+from .models import Block
+
+# Counter moved on by every committed change to the blocks, which versions the chain's responses
+CHAIN_GENERATION_KEY = 'blockchain:chain-generation'
+RESPONSE_KEY_PREFIX = 'blockchain:response'
+
+# The mempool version restarts with the process, so it is only meaningful alongside this
+PROCESS_TOKEN = uuid.uuid4().hex[:12]
+
+
+def chain_version():
+    """
+    Identifies the state of the chain by a generation counter, which costs no database read.
+    A missing counter starts from the clock, so a cleared cache never hands out an old generation again.
+    """
+    generation = cache.get(CHAIN_GENERATION_KEY)
+    if generation is None:
+        start = time.time_ns()
+        cache.add(CHAIN_GENERATION_KEY, start, None)
+        generation = cache.get(CHAIN_GENERATION_KEY, start)
+    return str(generation)
+
+
+def next_chain_generation():
+    try:
+        cache.incr(CHAIN_GENERATION_KEY)
+    except ValueError:
+        cache.add(CHAIN_GENERATION_KEY, time.time_ns(), None)
+
+
+def mempool_version():
+    """
+    Identifies the set of pending transactions.
+    """
+    return f"{PROCESS_TOKEN}-{mempool.version}"
+
+
+def cached_response(*versions):
+    """
+    Caches the body of a GET view under the request path and the given versions, e.g. chain_version,
+    and answers with an ETag derived from them. A request whose If-None-Match holds that ETag gets
+    a 304 without the view running; otherwise a cached body is served until a version changes.
+    Streaming and error responses are not cached.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            # Read before the view runs: a change made meanwhile moves to a new version and is refetched
+            version = ':'.join(current() for current in versions)
+            key = f"{RESPONSE_KEY_PREFIX}:{view.__name__}:{version}:{request.get_full_path()}"
+            etag = f'"{hashlib.sha256(key.encode()).hexdigest()[:32]}"'
+
+            etags = parse_etags(request.headers.get('If-None-Match', ''))
+            if etag in etags or '*' in etags:
+                response = HttpResponseNotModified()
+            else:
+                cached = cache.get(key)
+                if cached is not None:
+                    status, headers, content = cached
+                    response = HttpResponse(content, status=status)
+                    for header, value in headers:
+                        response[header] = value
+                else:
+                    response = view(request, *args, **kwargs)
+                    if response.status_code != 200:
+                        return response
+                    if not response.streaming:
+                        cache.set(key, (response.status_code, list(response.items()), response.content),
+                                  settings.BLOCKCHAIN_RESPONSE_CACHE_TIMEOUT)
+
+            response['ETag'] = etag
+            # Let clients keep the body but revalidate it on every poll
+            response['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
+
+
+@receiver(post_save, sender=Block)
+@receiver(post_delete, sender=Block)
+def invalidate_chain(sender, instance, **kwargs):
+    """
+    Moves the chain to a new generation once the change is committed. Responses are versioned
+    by the generation read before the view runs, so a body read during the change is never
+    served under the generation that follows it.
+    """
+    db_transaction.on_commit(next_chain_generation)
@@ -0,0 +1,129 @@
+from abc import ABC, abstractmethod
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, padding, rsa
+
+
+class SignatureScheme(ABC):
+    """
+    A signature algorithm: how its keys are generated and serialised and how it signs and verifies.
+    The scheme of a key follows from the key's type, so rows keep the scheme they were signed with.
+    """
+    name = None
+    private_key_types = ()
+    public_key_types = ()
+
+    @abstractmethod
+    def generate(self):
+        """
+        Returns a new private key.
+        """
+
+    @abstractmethod
+    def private_pem(self, private_key):
+        """
+        Returns the private key as an unencrypted PEM string.
+        """
+
+    @abstractmethod
+    def sign(self, private_key, data):
+        """
+        Returns the signature of `data` as bytes.
+        """
+
+    @abstractmethod
+    def verify(self, public_key, signature, data):
+        """
+        Returns True if `signature` over `data` verifies with `public_key`.
+        """
+
+
+class Ed25519Scheme(SignatureScheme):
+    """
+    Ed25519: fast key generation and signing, 64-byte signatures.
+    """
+    name = 'ed25519'
+    private_key_types = (ed25519.Ed25519PrivateKey,)
+    public_key_types = (ed25519.Ed25519PublicKey,)
+
+    def generate(self):
+        return ed25519.Ed25519PrivateKey.generate()
+
+    def private_pem(self, private_key):
+        return private_key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption()
+        ).decode('utf-8')
+
+    def sign(self, private_key, data):
+        return private_key.sign(data)
+
+    def verify(self, public_key, signature, data):
+        try:
+            public_key.verify(signature, data)
+            return True
+        except InvalidSignature:
+            return False
+
+
+class RSAPSSScheme(SignatureScheme):
+    """
+    RSA-2048 with PSS padding and SHA-256, the original scheme, kept for existing keys and rows.
+    """
+    name = 'rsa-pss'
+    private_key_types = (rsa.RSAPrivateKey,)
+    public_key_types = (rsa.RSAPublicKey,)
+
+    def generate(self):
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    def private_pem(self, private_key):
+        return private_key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.TraditionalOpenSSL,
+            encryption_algorithm=serialization.NoEncryption()
+        ).decode('utf-8')
+
+    def padding(self):
+        return padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH)
+
+    def sign(self, private_key, data):
+        return private_key.sign(data, self.padding(), hashes.SHA256())
+
+    def verify(self, public_key, signature, data):
+        try:
+            public_key.verify(signature, data, self.padding(), hashes.SHA256())
+            return True
+        except InvalidSignature:
+            return False
+
+
+SCHEMES = {scheme.name: scheme for scheme in (Ed25519Scheme(), RSAPSSScheme())}
+
+
+def scheme_of(key):
+    """
+    The scheme a private or public key belongs to. Raises ValueError for an unsupported key type.
+    """
+    for scheme in SCHEMES.values():
+        if isinstance(key, scheme.private_key_types + scheme.public_key_types):
+            return scheme
+    raise ValueError(f"Unsupported key type {type(key).__name__}")
+
+
+def public_pem(private_key):
+    return private_key.public_key().public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode('utf-8')
+
+
+def generate_key_pair(name):
+    """
+    A new key pair of the named scheme, as (public PEM, private PEM).
+    """
+    scheme = SCHEMES[name]
+    private_key = scheme.generate()
+    return public_pem(private_key), scheme.private_pem(private_key)
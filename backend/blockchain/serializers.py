@@ -4,7 +4,7 @@ from .models import Block, Transaction
 class TransactionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Transaction
-        fields = ['id', 'sender', 'recipient_public_key', 'amount', 'timestamp', 'signature']
+        fields = ['id', 'sender', 'recipient_public_key', 'sender_address', 'recipient_address', 'amount', 'fee', 'nonce', 'timestamp', 'signature']
 
 
 class BlockSerializer(serializers.ModelSerializer):
@@ -12,4 +12,10 @@ class BlockSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Block
-        fields = ['index', 'timestamp', 'transactions', 'previous_hash', 'current_hash', 'proof']
+        fields = ['index', 'timestamp', 'transactions', 'previous_hash', 'current_hash', 'proof', 'difficulty', 'merkle_root']
+
+
+class BlockHeaderSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Block
+        fields = ['index', 'timestamp', 'previous_hash', 'current_hash', 'proof', 'difficulty', 'merkle_root']
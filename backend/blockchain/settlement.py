@@ -0,0 +1,39 @@
+from collections import defaultdict
+
+from django.db.models import F
+
+from .models import Block, CustomUser
+
+
+def settle_transactions(block, transactions):
+    """
+    Applies the balance changes of `transactions` and attaches them to `block`.
+    Uses a fixed number of queries whatever the number of transactions: one to load every
+    involved user, one to update their balances and one to link the transactions to the block.
+    Meant to run inside transaction.atomic() so a failure leaves no partial settlement.
+    Raises CustomUser.DoesNotExist if a transaction involves an unknown address.
+    """
+    for tx in transactions:
+        tx.fill_addresses()
+
+    addresses = {tx.sender_address for tx in transactions} | {tx.recipient_address for tx in transactions}
+    users = {user.address: user for user in CustomUser.objects.filter(address__in=addresses)}
+    if len(users) < len(addresses):
+        raise CustomUser.DoesNotExist("Transaction involves an invalid user.")
+
+    # Net balance change per user, so each user is written once
+    deltas = defaultdict(float)
+    for tx in transactions:
+        deltas[tx.sender_address] -= tx.amount
+        deltas[tx.recipient_address] += tx.amount
+
+    changed = []
+    for address, delta in deltas.items():
+        user = users[address]
+        # Relative update, so concurrent balance changes are not overwritten
+        user.currency = F('currency') + delta
+        changed.append(user)
+    CustomUser.objects.bulk_update(changed, ['currency'])
+
+    Through = Block.transactions.through
+    Through.objects.bulk_create([Through(block_id=block.id, transaction_id=tx.id) for tx in transactions])
@@ -0,0 +1,84 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from cryptography.hazmat.primitives import serialization
+from django.conf import settings
+
+
+class LRUCache:
+    """
+    Thread-safe mapping that keeps at most `size` entries, dropping the least recently used.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.entries:
+                return default
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+# Parsed public keys by SHA-256 of their PEM, and verification results by (signed data hash, signature)
+public_keys = LRUCache(settings.BLOCKCHAIN_PUBLIC_KEY_CACHE_SIZE)
+verified_signatures = LRUCache(settings.BLOCKCHAIN_SIGNATURE_CACHE_SIZE)
+
+verify_pool = ThreadPoolExecutor(max_workers=settings.BLOCKCHAIN_VERIFY_THREADS, thread_name_prefix='verify')
+
+
+def load_public_key(pem):
+    """
+    Parses a PEM public key, reusing the parsed key when the same PEM was seen before.
+    Returns None if the PEM is not a valid public key.
+    """
+    digest = hashlib.sha256(pem.encode()).digest()
+    public_key = public_keys.get(digest)
+    if public_key is None:
+        try:
+            public_key = serialization.load_pem_public_key(pem.encode())
+        except ValueError:
+            return None
+        public_keys.set(digest, public_key)
+    return public_key
+
+
+def verify_transaction(transaction):
+    """
+    Checks the sender's signature on a transaction. The result is memoised, so a transaction
+    verified when it was submitted is not verified again when it is mined.
+    """
+    if not transaction.signature:
+        return False
+
+    key = (hashlib.sha256(transaction.signed_data()).digest(), transaction.signature)
+    result = verified_signatures.get(key)
+    if result is None:
+        public_key = load_public_key(transaction.sender)
+        result = public_key is not None and transaction.is_valid(public_key)
+        verified_signatures.set(key, result)
+    return result
+
+
+def verify_transactions(transactions):
+    """
+    Verifies many transactions across the verification thread pool.
+    Returns one bool per transaction, in order.
+    """
+    return list(verify_pool.map(verify_transaction, transactions))
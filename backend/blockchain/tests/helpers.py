@@ -0,0 +1,21 @@
+from cryptography.hazmat.primitives import serialization
+
+from ..models import CustomUser, Transaction
+
+
+def create_user(username, currency=100.0):
+    """
+    A registered user with a key pair, returned with their private key.
+    """
+    user = CustomUser.objects.create_user(username=username, password='password')
+    private_key_pem = user.generate_keys()
+    user.currency = currency
+    user.save()
+    return user, serialization.load_pem_private_key(private_key_pem.encode(), password=None)
+
+
+def signed(sender, private_key, recipient, amount, nonce, fee=0.0):
+    transaction = Transaction(sender=sender.public_key, recipient_public_key=recipient.public_key,
+                              amount=amount, fee=fee, nonce=nonce)
+    transaction.sign_transaction(private_key)
+    return transaction
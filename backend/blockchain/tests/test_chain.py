@@ -0,0 +1,57 @@
+import json
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from .. import mining
+from ..mempool import Mempool
+from ..models import Block
+from .helpers import create_user, signed
+
+
+class ChainPagingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        sender, private_key = create_user('sender')
+        recipient, _ = create_user('recipient')
+        pool = Mempool(max_size=10)
+        pool.loaded = True
+        with mock.patch.object(mining, 'mempool', pool):
+            for nonce in range(5):
+                pool.add(signed(sender, private_key, recipient, 1.0, nonce))
+                with self.captureOnCommitCallbacks(execute=True):
+                    mining.mine_pending_block()
+        self.indexes = list(Block.objects.order_by('index').values_list('index', flat=True))
+
+    def test_cursor_walks_every_page(self):
+        seen, after = [], None
+        while True:
+            path = '/api/chain/?limit=2' + (f'&after={after}' if after is not None else '')
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            self.assertLessEqual(len(page), 2)
+            seen.extend(block['index'] for block in page)
+            after = response.get('X-Next-Cursor')
+            if after is None:
+                break
+        self.assertEqual(seen, self.indexes)
+
+    def test_invalid_paging_is_refused(self):
+        self.assertEqual(self.client.get('/api/chain/?limit=0').status_code, 400)
+        self.assertEqual(self.client.get('/api/chain/?after=tip').status_code, 400)
+
+    @override_settings(BLOCKCHAIN_CHAIN_MAX_PAGE_SIZE=2)
+    def test_stream_holds_every_block_after_the_cursor(self):
+        response = self.client.get(f'/api/chain/?stream=1&after={self.indexes[0]}')
+        self.assertFalse(response.is_async)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['index'] for line in lines], self.indexes[1:])
+
+    @override_settings(BLOCKCHAIN_CHAIN_MAX_PAGE_SIZE=2)
+    async def test_stream_is_asynchronous_under_asgi(self):
+        response = await self.async_client.get('/api/chain/?stream=1')
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertEqual([json.loads(line)['index'] for line in content.splitlines()], self.indexes)
@@ -0,0 +1,61 @@
+import asyncio
+import threading
+
+from django.test import SimpleTestCase
+
+from ..events import EventBroker
+
+
+class EventBrokerTests(SimpleTestCase):
+    def setUp(self):
+        self.broker = EventBroker(queue_size=2, replay_size=3)
+
+    async def open(self, last_event_id=None, heartbeat=None):
+        """
+        Starts a stream and reads its opening retry line, which registers the subscriber.
+        """
+        stream = self.broker.stream(last_event_id, heartbeat)
+        self.assertEqual(await stream.__anext__(), b"retry: 3000\n\n")
+        return stream
+
+    async def test_event_published_from_another_thread_reaches_every_stream(self):
+        streams = [await self.open(), await self.open()]
+        self.assertEqual(len(self.broker), 2)
+        thread = threading.Thread(target=self.broker.publish, args=('block', {'index': 1}))
+        thread.start()
+        thread.join()
+
+        for stream in streams:
+            message = await asyncio.wait_for(stream.__anext__(), 1)
+            self.assertEqual(message, f"id: {self.broker.epoch}-1\nevent: block\ndata: {{\"index\": 1}}\n\n".encode())
+            await stream.aclose()
+        self.assertEqual(len(self.broker), 0)
+
+    async def test_reconnecting_client_is_sent_what_it_missed(self):
+        for index in range(4):
+            self.broker.publish('block', {'index': index})
+        epoch = self.broker.epoch
+
+        stream = await self.open(f'{epoch}-2')
+        self.assertEqual([await stream.__anext__() for _ in range(2)], [message for _, message in list(self.broker.recent)[1:]])
+        await stream.aclose()
+
+        # Older than the replayed events, or from another process
+        for last_event_id in (f'{epoch}-0', 'other-3', 'garbage'):
+            stream = await self.open(last_event_id)
+            self.assertEqual(await stream.__anext__(), b"event: resync\ndata: {}\n\n")
+            await stream.aclose()
+
+    async def test_subscriber_falling_behind_is_disconnected(self):
+        stream = await self.open()
+        for index in range(3):
+            self.broker.publish('block', {'index': index})
+        await asyncio.sleep(0)
+        with self.assertRaises(StopAsyncIteration):
+            await asyncio.wait_for(stream.__anext__(), 1)
+        self.assertEqual(len(self.broker), 0)
+
+    async def test_idle_stream_is_kept_alive(self):
+        stream = await self.open(heartbeat=0.01)
+        self.assertEqual(await asyncio.wait_for(stream.__anext__(), 1), b": keepalive\n\n")
+        await stream.aclose()
@@ -0,0 +1,64 @@
+from django.test import TestCase
+
+from ..mempool import Mempool, MempoolError, NonceConflict
+from ..models import Transaction
+from .helpers import create_user, signed
+
+
+class MempoolTests(TestCase):
+    def setUp(self):
+        self.sender, self.private_key = create_user('sender')
+        self.recipient, _ = create_user('recipient')
+        self.pool = Mempool(max_size=2)
+        self.pool.loaded = True
+
+    def add(self, nonce, fee=0.0):
+        transaction = signed(self.sender, self.private_key, self.recipient, 1.0, nonce, fee)
+        self.pool.add(transaction)
+        return transaction
+
+    def test_pending_and_mined_nonces_conflict(self):
+        self.add(nonce=0)
+        with self.assertRaisesRegex(NonceConflict, 'already pending'):
+            self.add(nonce=0)
+
+        self.pool.confirm(self.pool.select(1))
+        with self.assertRaisesRegex(NonceConflict, 'already mined'):
+            self.add(nonce=0)
+        self.assertEqual(self.pool.next_nonce(self.sender.address), 1)
+
+    def test_full_pool_evicts_the_lowest_fee(self):
+        cheapest = self.add(nonce=0, fee=1.0)
+        self.add(nonce=1, fee=2.0)
+        with self.assertRaisesRegex(MempoolError, 'full'):
+            self.add(nonce=2, fee=0.5)
+
+        self.add(nonce=2, fee=3.0)
+        self.assertEqual(sorted(entry.fee for entry in self.pool.entries.values()), [2.0, 3.0])
+        self.assertFalse(Transaction.objects.filter(id=cheapest.id).exists())
+
+    def test_selection_stops_at_an_evicted_nonce(self):
+        self.pool.max_size = 3
+        for nonce, fee in enumerate((2.0, 1.0, 3.0)):
+            self.add(nonce, fee)
+        self.add(nonce=3, fee=4.0)
+
+        # Nonce 1 was evicted: mining 2 and 3 after 0 would retire 1 unmined
+        self.assertEqual([entry.nonce for entry in self.pool.select(3)], [0])
+        self.assertEqual(self.pool.next_nonce(self.sender.address), 1)
+
+        self.pool.max_size = 4
+        self.add(nonce=1, fee=1.0)
+        self.assertEqual(sorted(entry.nonce for entry in self.pool.select(4)), [0, 1, 2, 3])
+        self.assertEqual(self.pool.next_nonce(self.sender.address), 4)
+
+    def test_selection_waits_for_the_account_nonce(self):
+        self.add(nonce=1)
+        self.assertEqual(self.pool.select(2), [])
+        self.assertEqual(self.pool.next_nonce(self.sender.address), 0)
+
+    def test_pool_without_room_refuses_every_transaction(self):
+        self.pool.max_size = 0
+        with self.assertRaisesRegex(MempoolError, 'full'):
+            self.add(nonce=0, fee=1.0)
+        self.assertEqual(len(self.pool), 0)
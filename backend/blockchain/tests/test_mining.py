@@ -0,0 +1,106 @@
+from unittest import mock
+
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from .. import mining, views
+from ..mempool import Mempool
+from ..models import Transaction
+from .helpers import create_user, signed
+
+
+class MiningTests(TestCase):
+    def setUp(self):
+        self.sender, self.private_key = create_user('sender')
+        self.recipient, _ = create_user('recipient')
+        self.pool = Mempool(max_size=10)
+        patcher = mock.patch.object(mining, 'mempool', self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_rolled_back_block_leaves_the_pool_unchanged(self):
+        self.pool.add(signed(self.sender, self.private_key, self.recipient, 1.0, nonce=0))
+        forged = signed(self.sender, self.private_key, self.recipient, 2.0, nonce=1)
+        forged.signature = '00' * 64
+        self.pool.add(forged)
+
+        with mock.patch.object(mining, 'settle_transactions', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                mining.mine_pending_block()
+        self.assertEqual(len(self.pool), 2)
+        self.assertEqual(Transaction.objects.filter(block__isnull=True).count(), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            block = mining.mine_pending_block()
+        self.assertEqual([tx.nonce for tx in block.transactions.all()], [0])
+        self.assertEqual(len(self.pool), 0)
+
+    def test_transactions_after_a_forged_one_stay_pending(self):
+        self.pool.add(signed(self.sender, self.private_key, self.recipient, 1.0, nonce=0))
+        forged = signed(self.sender, self.private_key, self.recipient, 2.0, nonce=1)
+        forged.signature = '00' * 64
+        self.pool.add(forged)
+        self.pool.add(signed(self.sender, self.private_key, self.recipient, 3.0, nonce=2))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            block = mining.mine_pending_block()
+        self.assertEqual([tx.nonce for tx in block.transactions.all()], [0])
+        # Nonce 1 is free again, and nonce 2 waits for it
+        self.assertEqual(self.pool.next_nonce(self.sender.address), 1)
+        self.assertEqual([entry.nonce for entry in self.pool.entries.values()], [2])
+        self.assertEqual(list(Transaction.objects.filter(block__isnull=True).values_list('nonce', flat=True)), [2])
+
+
+class MiningJobTests(TestCase):
+    def setUp(self):
+        self.sender, self.private_key = create_user('sender')
+        self.recipient, _ = create_user('recipient')
+        self.client = APIClient()
+        self.client.force_authenticate(self.sender)
+        self.pool = Mempool(max_size=10)
+        self.pool.loaded = True
+        # Jobs are run here rather than on worker threads, which would not see the test's transaction
+        self.queue = mining.MiningQueue(workers=0, history=10)
+        for module, name, value in ((mining, 'mempool', self.pool), (views, 'mempool', self.pool),
+                                    (views, 'mining_queue', self.queue)):
+            patcher = mock.patch.object(module, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def run_next_job(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.queue.run(self.queue.queue.get_nowait())
+
+    def test_nothing_to_mine(self):
+        response = self.client.post('/api/mine/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"message": "No transactions to mine"})
+
+    def test_job_is_polled_until_its_block_is_mined(self):
+        self.pool.add(signed(self.sender, self.private_key, self.recipient, 1.0, nonce=0))
+        response = self.client.post('/api/mine/')
+        self.assertEqual(response.status_code, 202)
+        job = response.json()
+        self.assertEqual(job['status'], 'queued')
+        # A second request for the same tip joins the queued job
+        self.assertEqual(self.client.post('/api/mine/').json()['job_id'], job['job_id'])
+
+        self.run_next_job()
+        status = self.client.get(f"/api/mine/{job['job_id']}/").json()
+        self.assertEqual(status['status'], 'done')
+        self.assertEqual(status['attempts'], status['block']['proof'] + 1)
+        self.assertEqual([tx['nonce'] for tx in status['block']['transactions']], [0])
+        self.assertIsNotNone(status['finished'])
+        self.assertEqual(len(self.pool), 0)
+
+    def test_failed_job_reports_its_error(self):
+        self.pool.add(signed(self.sender, self.private_key, self.recipient, 1.0, nonce=0))
+        job_id = self.client.post('/api/mine/').json()['job_id']
+        with mock.patch.object(mining, 'settle_transactions', side_effect=RuntimeError('disk full')):
+            self.run_next_job()
+        status = self.client.get(f'/api/mine/{job_id}/').json()
+        self.assertEqual((status['status'], status['error']), ('failed', 'disk full'))
+        self.assertEqual(len(self.pool), 1)
+
+    def test_unknown_job(self):
+        self.assertEqual(self.client.get('/api/mine/unknown/').status_code, 404)
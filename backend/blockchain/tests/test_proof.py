@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+from hashlib import sha256
+
+from django.test import SimpleTestCase, override_settings
+
+from ..proof import MAX_RETARGET_STEP, ProofHasher, next_difficulty
+
+
+def leading_zero_bits(data):
+    return 256 - int.from_bytes(sha256(data).digest(), 'big').bit_length()
+
+
+class ProofHasherTests(SimpleTestCase):
+    def test_check_matches_hashing_the_whole_guess(self):
+        for difficulty in (0, 4, 8, 12):
+            hasher = ProofHasher(12345, difficulty)
+            for proof in range(2_000):
+                valid = leading_zero_bits(f'12345{proof}'.encode()) >= difficulty
+                self.assertEqual(hasher.check(proof), valid, (difficulty, proof))
+
+    def test_search_returns_the_lowest_valid_proof_in_range(self):
+        hasher = ProofHasher(12345, 8)
+        proof = hasher.search()
+        self.assertEqual(proof, next(p for p in range(100_000) if hasher.check(p)))
+        self.assertIsNone(hasher.search(0, proof))
+        self.assertEqual(hasher.search(proof), proof)
+
+
+@override_settings(BLOCKCHAIN_RETARGET_INTERVAL=4, BLOCKCHAIN_BLOCK_TIME=10)
+class RetargetTests(SimpleTestCase):
+    def timestamps(self, seconds_apart):
+        start = datetime(2024, 1, 1)
+        return [start + timedelta(seconds=seconds_apart * i) for i in range(4)]
+
+    def test_difficulty_changes_only_at_the_interval(self):
+        fast = self.timestamps(1)
+        self.assertEqual(next_difficulty(8, 10, fast), 10 + MAX_RETARGET_STEP)
+        self.assertEqual(next_difficulty(9, 10, fast), 10)
+        # Too few blocks to measure the period
+        self.assertEqual(next_difficulty(4, 10, fast[:2]), 10)
+
+    def test_difficulty_follows_the_block_time(self):
+        self.assertEqual(next_difficulty(8, 10, self.timestamps(10)), 10)
+        self.assertEqual(next_difficulty(8, 10, self.timestamps(20)), 9)
+        self.assertEqual(next_difficulty(8, 10, self.timestamps(1_000)), 10 - MAX_RETARGET_STEP)
+
+    @override_settings(BLOCKCHAIN_RETARGET_INTERVAL=None)
+    def test_difficulty_is_fixed_without_an_interval(self):
+        self.assertEqual(next_difficulty(8, 10, self.timestamps(1)), 10)
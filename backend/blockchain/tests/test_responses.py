@@ -0,0 +1,61 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from .. import mining
+from ..mempool import Mempool
+from ..models import Block
+from ..responses import chain_version
+from .helpers import create_user, signed
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.sender, self.private_key = create_user('sender')
+        self.recipient, _ = create_user('recipient')
+        self.pool = Mempool(max_size=10)
+        self.pool.loaded = True
+        patcher = mock.patch.object(mining, 'mempool', self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mine(0)
+
+    def mine(self, nonce):
+        self.pool.add(signed(self.sender, self.private_key, self.recipient, 1.0, nonce))
+        with self.captureOnCommitCallbacks(execute=True):
+            return mining.mine_pending_block()
+
+    def test_matching_etag_is_not_modified(self):
+        response = self.client.get('/api/latest-block/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+
+        response = self.client.get('/api/latest-block/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_committed_block_changes_the_etag_and_the_body(self):
+        first = self.client.get('/api/latest-block/')
+        block = self.mine(1)
+
+        response = self.client.get('/api/latest-block/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertEqual(response.json()['current_hash'], block.current_hash)
+
+    def test_generation_moves_only_once_the_change_commits(self):
+        version = chain_version()
+        block = Block.objects.order_by('-index').first()
+        with self.captureOnCommitCallbacks() as callbacks:
+            block.save()
+            self.assertEqual(chain_version(), version)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(chain_version(), version)
+
+    def test_cleared_cache_does_not_reuse_a_generation(self):
+        version = chain_version()
+        cache.clear()
+        self.assertNotEqual(chain_version(), version)
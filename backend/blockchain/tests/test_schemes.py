@@ -0,0 +1,68 @@
+import time
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from django.test import SimpleTestCase, TestCase
+
+from ..keypool import KeyPool
+from ..models import Transaction
+from ..schemes import SCHEMES, public_pem, scheme_of
+from ..signatures import verify_transaction
+from .helpers import create_user
+
+
+def matching(pair):
+    public_key, private_key_pem = pair
+    return public_pem(serialization.load_pem_private_key(private_key_pem.encode(), password=None)) == public_key
+
+
+class SchemeTests(SimpleTestCase):
+    def test_each_scheme_signs_and_verifies_its_own_keys(self):
+        for name, scheme in SCHEMES.items():
+            private_key = scheme.generate()
+            public_key = private_key.public_key()
+            self.assertIs(scheme_of(private_key), scheme, name)
+            self.assertIs(scheme_of(public_key), scheme, name)
+
+            signature = scheme.sign(private_key, b'data')
+            self.assertTrue(scheme.verify(public_key, signature, b'data'), name)
+            self.assertFalse(scheme.verify(public_key, signature, b'other data'), name)
+            # A PEM written by the scheme reads back as the same key
+            loaded = serialization.load_pem_private_key(scheme.private_pem(private_key).encode(), password=None)
+            self.assertEqual(public_pem(loaded), public_pem(private_key), name)
+
+    def test_unsupported_key_type_is_refused(self):
+        with self.assertRaises(ValueError):
+            scheme_of(ec.generate_private_key(ec.SECP256R1()))
+
+
+class MixedSchemeTests(TestCase):
+    def test_rows_verify_with_the_scheme_of_their_sender(self):
+        ed25519_user, ed25519_key = create_user('ed25519')
+        rsa_key = SCHEMES['rsa-pss'].generate()
+        recipient, _ = create_user('recipient')
+
+        for sender_pem, private_key in ((ed25519_user.public_key, ed25519_key), (public_pem(rsa_key), rsa_key)):
+            transaction = Transaction(sender=sender_pem, recipient_public_key=recipient.public_key, amount=1.0, nonce=0)
+            transaction.sign_transaction(private_key)
+            self.assertTrue(verify_transaction(transaction))
+        self.assertIs(scheme_of(ed25519_key), SCHEMES['ed25519'])
+
+
+class KeyPoolTests(SimpleTestCase):
+    def test_pool_is_filled_ahead_of_registrations(self):
+        pool = KeyPool('ed25519', 2)
+        self.assertTrue(matching(pool.take()))
+        deadline = time.monotonic() + 5
+        while pool.pairs.qsize() < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(pool.pairs.qsize(), 2)
+
+        pairs = [pool.take(), pool.take()]
+        self.assertTrue(all(matching(pair) for pair in pairs))
+        self.assertNotEqual(pairs[0], pairs[1])
+
+    def test_empty_pool_generates_on_demand(self):
+        pool = KeyPool('ed25519', 0)
+        self.assertTrue(matching(pool.take()))
+        self.assertIsNone(pool.thread)
@@ -0,0 +1,44 @@
+from django.test import TestCase
+
+from ..models import Block, CustomUser, Transaction
+from ..settlement import settle_transactions
+from .helpers import create_user
+
+
+class SettlementTests(TestCase):
+    def setUp(self):
+        self.users = [create_user(f'user-{number}')[0] for number in range(4)]
+
+    def pending(self, count):
+        transactions = []
+        for nonce in range(count):
+            sender, recipient = self.users[nonce % 2], self.users[2 + nonce % 2]
+            transaction = Transaction(sender=sender.public_key, recipient_public_key=recipient.public_key,
+                                      amount=1.0, nonce=nonce)
+            transaction.fill_addresses()
+            transaction.save()
+            transactions.append(transaction)
+        return transactions
+
+    def block(self):
+        return Block.objects.create(index=Block.objects.count(), proof=0, previous_hash='1')
+
+    def test_query_count_does_not_grow_with_the_transactions(self):
+        for count in (2, 40):
+            transactions = self.pending(count)
+            block = self.block()
+            # Load the users, update their balances, link the transactions
+            with self.assertNumQueries(3):
+                settle_transactions(block, transactions)
+            self.assertEqual(block.transactions.count(), count)
+            Transaction.objects.all().delete()
+
+        balances = dict(CustomUser.objects.filter(id__in=[user.id for user in self.users]).values_list('id', 'currency'))
+        self.assertEqual([balances[user.id] for user in self.users], [79.0, 79.0, 121.0, 121.0])
+
+    def test_unknown_user_settles_nothing(self):
+        transactions = self.pending(2)
+        transactions[1].recipient_address = 'unknown'
+        with self.assertRaises(CustomUser.DoesNotExist):
+            settle_transactions(self.block(), transactions)
+        self.assertEqual(set(CustomUser.objects.values_list('currency', flat=True)), {100.0})
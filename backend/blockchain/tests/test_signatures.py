@@ -0,0 +1,49 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+from .. import signatures
+from ..models import Transaction
+from ..signatures import LRUCache, load_public_key, verify_transaction, verify_transactions
+from .helpers import create_user, signed
+
+
+class LRUCacheTests(SimpleTestCase):
+    def test_least_recently_used_entry_is_dropped(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+
+
+class SignatureCacheTests(TestCase):
+    def setUp(self):
+        signatures.public_keys.clear()
+        signatures.verified_signatures.clear()
+        self.sender, self.private_key = create_user('sender')
+        self.recipient, _ = create_user('recipient')
+
+    def test_verification_is_memoised(self):
+        transaction = signed(self.sender, self.private_key, self.recipient, 1.0, nonce=0)
+        with mock.patch.object(Transaction, 'is_valid', autospec=True, side_effect=Transaction.is_valid) as is_valid:
+            self.assertTrue(verify_transaction(transaction))
+            self.assertTrue(verify_transaction(transaction))
+            self.assertEqual(is_valid.call_count, 1)
+
+            # Other signed data is a different entry, and does not verify under the old signature
+            transaction.amount = 2.0
+            self.assertFalse(verify_transaction(transaction))
+            self.assertEqual(is_valid.call_count, 2)
+
+    def test_parsed_public_key_is_reused(self):
+        self.assertIs(load_public_key(self.sender.public_key), load_public_key(self.sender.public_key))
+        self.assertIsNone(load_public_key('not a key'))
+
+    def test_batch_keeps_the_order_of_the_transactions(self):
+        transactions = [signed(self.sender, self.private_key, self.recipient, 1.0, nonce) for nonce in range(6)]
+        for transaction in transactions[1::2]:
+            transaction.signature = '00' * 64
+        transactions[4].signature = ''
+        self.assertEqual(verify_transactions(transactions), [True, False, True, False, False, False])
@@ -0,0 +1,98 @@
+from unittest import mock
+
+from cryptography.hazmat.primitives import serialization
+from django.db import IntegrityError
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from .. import views
+from ..mempool import Mempool, NonceConflict
+from ..models import Transaction
+from .helpers import create_user, signed
+
+
+class AddTransactionTests(TestCase):
+    def setUp(self):
+        self.sender, self.private_key = create_user('sender')
+        self.recipient, _ = create_user('recipient')
+        self.client = APIClient()
+        self.client.force_authenticate(self.sender)
+        self.pool = Mempool(max_size=10)
+        patcher = mock.patch.object(views, 'mempool', self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, **data):
+        private_key_pem = self.private_key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption(),
+        ).decode()
+        data = {'recipient_public_key': self.recipient.public_key, 'private_key': private_key_pem, **data}
+        return self.client.post('/api/transaction/', data, format='json')
+
+    def item(self, nonce, amount=1.0, fee=0.0):
+        """
+        A transaction as a client signs it for the API.
+        """
+        transaction = signed(self.sender, self.private_key, self.recipient, amount, nonce, fee)
+        return {'recipient_public_key': self.recipient.public_key, 'amount': amount, 'fee': fee,
+                'nonce': nonce, 'signature': transaction.signature}
+
+    def test_batch_admits_each_valid_item(self):
+        forged = dict(self.item(3), amount=3.0)
+        items = [self.item(0), self.item(1, fee=0.5), self.item(2), forged, self.item(1)]
+        response = self.client.post('/api/transactions/batch/', {'transactions': items}, format='json')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['accepted'], data['rejected']), (3, 2))
+        self.assertEqual([result['status'] for result in data['results']],
+                         ['accepted', 'accepted', 'accepted', 'rejected', 'rejected'])
+        self.assertEqual(data['results'][3]['error'], "Invalid signature")
+        self.assertIn('already pending', data['results'][4]['error'])
+        self.assertEqual(data['results'][1]['transaction']['fee'], 0.5)
+
+        saved = Transaction.objects.order_by('nonce')
+        self.assertEqual(list(saved.values_list('nonce', flat=True)), [0, 1, 2])
+        self.assertEqual(len(self.pool), 3)
+
+    def test_signed_transaction_is_admitted_without_a_private_key(self):
+        response = self.client.post('/api/transaction/', self.item(0), format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(Transaction.objects.get().signature, self.item(0)['signature'])
+
+    def test_non_finite_amount_or_fee_is_rejected(self):
+        for data in ({'amount': 'nan'}, {'amount': 'inf'}, {'amount': 1, 'fee': 'nan'}):
+            response = self.post(**data)
+            self.assertEqual(response.status_code, 400, data)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_non_finite_signed_transactions_are_rejected(self):
+        item = {'recipient_public_key': self.recipient.public_key, 'nonce': 0, 'signature': '00'}
+        for data in ({'amount': 'nan'}, {'amount': '-inf'}, {'amount': 1, 'fee': 'inf'}):
+            response = self.client.post('/api/transaction/', dict(item, **data), format='json')
+            self.assertEqual(response.status_code, 400, data)
+            response = self.client.post('/api/transactions/batch/', {'transactions': [dict(item, **data)]}, format='json')
+            self.assertEqual(response.json()['results'][0]['error'], "Amount and fee must be finite")
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_non_nonce_integrity_error_is_raised_not_retried(self):
+        # NaN is stored as NULL, which the NOT NULL amount refuses
+        transaction = signed(self.sender, self.private_key, self.recipient, float('nan'), nonce=0)
+        with self.assertRaises(IntegrityError):
+            self.pool.add(transaction)
+        self.assertEqual(len(self.pool), 0)
+
+    def test_nonce_taken_by_another_process_is_a_conflict(self):
+        signed(self.sender, self.private_key, self.recipient, 1.0, nonce=0).save()
+        transaction = signed(self.sender, self.private_key, self.recipient, 2.0, nonce=0)
+        # The pool loaded before the row was saved does not know the nonce is used
+        self.pool.loaded = True
+        errors = self.pool.add_many([transaction])
+        self.assertIsInstance(errors[0], NonceConflict)
+        self.assertEqual(len(self.pool), 0)
+
+    def test_retries_give_up(self):
+        with mock.patch.object(self.pool, 'next_nonce', return_value=0):
+            self.assertEqual(self.post(amount=1).status_code, 201)
+            self.assertEqual(self.post(amount=1).status_code, 409)
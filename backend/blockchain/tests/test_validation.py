@@ -0,0 +1,83 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from .. import mining
+from ..mempool import Mempool
+from ..merkle import verify_merkle_proof
+from ..models import Block, Transaction
+from ..validation import VALIDATED_TIP_KEY, validate_blocks
+from .helpers import create_user, signed
+
+
+class ValidationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        sender, private_key = create_user('sender')
+        recipient, _ = create_user('recipient')
+        pool = Mempool(max_size=10)
+        pool.loaded = True
+        with mock.patch.object(mining, 'mempool', pool):
+            for nonce in range(3):
+                pool.add(signed(sender, private_key, recipient, 1.0, nonce))
+                with self.captureOnCommitCallbacks(execute=True):
+                    mining.mine_pending_block()
+
+    def test_checkpoint_skips_verified_blocks(self):
+        self.assertTrue(validate_blocks())
+        tip = Block.objects.order_by('-index').first()
+        self.assertEqual(cache.get(VALIDATED_TIP_KEY), {'index': tip.index, 'hash': tip.current_hash})
+
+        # A block the checkpoint covers is not checked again
+        Block.objects.filter(index=tip.index - 1).update(proof=-1)
+        self.assertTrue(validate_blocks())
+
+    def test_saving_a_verified_block_drops_the_checkpoint(self):
+        self.assertTrue(validate_blocks())
+        block = Block.objects.order_by('index')[1]
+        block.proof = -1
+        block.save()
+        self.assertIsNone(cache.get(VALIDATED_TIP_KEY))
+        self.assertFalse(validate_blocks())
+
+    def test_rewritten_transaction_breaks_the_merkle_root(self):
+        block = Block.objects.order_by('index')[2]
+        Transaction.objects.filter(block=block).update(amount=50.0)
+        self.assertFalse(validate_blocks())
+
+    def test_header_not_matching_its_hash_is_invalid(self):
+        # QuerySet.update() keeps the proof and the link valid, only the hash no longer matches
+        Block.objects.filter(index=Block.objects.order_by('index')[2].index).update(merkle_root='00' * 32)
+        self.assertFalse(validate_blocks())
+
+
+class MerkleProofTests(TestCase):
+    def setUp(self):
+        sender, private_key = create_user('sender')
+        recipient, _ = create_user('recipient')
+        self.pool = Mempool(max_size=10)
+        self.pool.loaded = True
+        with mock.patch.object(mining, 'mempool', self.pool):
+            for nonce in range(5):
+                self.pool.add(signed(sender, private_key, recipient, 1.0, nonce))
+            with self.captureOnCommitCallbacks(execute=True):
+                self.block = mining.mine_pending_block()
+
+    def test_every_transaction_proves_its_inclusion(self):
+        transactions = list(self.block.ordered_transactions())
+        self.assertEqual(len(transactions), 5)
+        for transaction in transactions:
+            response = self.client.get(f'/api/transaction/{transaction.id}/proof/')
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertEqual(data['merkle_root'], self.block.merkle_root)
+            self.assertEqual(data['leaf'], transaction.leaf_hash().hex())
+            self.assertTrue(verify_merkle_proof(transaction.leaf_hash(), data['proof'], data['merkle_root']))
+            # The proof does not hold for another transaction's leaf
+            other = transactions[transactions.index(transaction) - 1]
+            self.assertFalse(verify_merkle_proof(other.leaf_hash(), data['proof'], data['merkle_root']))
+
+    def test_pending_transaction_has_no_proof(self):
+        pending = Transaction.objects.create(sender='sender', recipient_public_key='recipient', amount=1.0, nonce=99)
+        self.assertEqual(self.client.get(f'/api/transaction/{pending.id}/proof/').status_code, 404)
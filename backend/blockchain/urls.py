@@ -12,9 +12,16 @@ urlpatterns = [
 
     # Blockchain
     path('transaction/', add_transaction, name='add_transaction'),
+    path('transactions/batch/', add_transaction_batch, name='add_transaction_batch'),
     path('mine/', mine_block, name='mine_block'),
+    path('mine/<str:job_id>/', mining_status, name='mining_status'),
     path('chain/', display_chain, name='display_chain'),
     path('validate/', validate_chain, name='validate_chain'),
     path('latest-block/', display_latest_block, name='display_latest_block'),
     path('pending-transactions/', display_pending_transactions, name='display_pending_transactions'),
+    path('transaction/<int:pk>/', display_transaction, name='display_transaction'),
+    path('transaction/<int:pk>/proof/', transaction_proof, name='transaction_proof'),
+    path('block/<str:block_hash>/', display_block, name='display_block'),
+    path('balance/<str:address>/', account_balance, name='account_balance'),
+    path('events/', event_stream, name='event_stream'),
 ]
@@ -0,0 +1,73 @@
+from collections import deque
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Block, Transaction
+from .proof import ProofHasher, next_difficulty
+
+# Cache entry holding the index and hash of the highest block validated so far
+VALIDATED_TIP_KEY = 'blockchain:validated-tip'
+
+
+def validate_blocks():
+    """
+    Checks the chain in index order and returns True if it is valid: each block's hash is
+    recomputed, as is its Merkle root from its transactions, and each block must link to the
+    previous one at the expected difficulty with a valid proof.
+    Blocks up to the validated checkpoint are only reloaded when a retarget needs their timestamps,
+    so each call only checks the blocks appended since the previous one.
+    The checkpoint is dropped by the post_save and post_delete signals of Block. QuerySet.update(),
+    bulk_update() and raw SQL send no signals, so code rewriting blocks that way must delete
+    VALIDATED_TIP_KEY itself; the checkpoint holds no digest of the blocks below it, as reading
+    them back to compare would cost as much as checking them again.
+    """
+    interval = settings.BLOCKCHAIN_RETARGET_INTERVAL or 1
+    blocks = Block.objects.order_by('index').prefetch_related(
+        Prefetch('transactions', queryset=Transaction.objects.order_by('id')))
+    verified_index = None
+
+    checkpoint = cache.get(VALIDATED_TIP_KEY)
+    if checkpoint and Block.objects.filter(index=checkpoint['index'], current_hash=checkpoint['hash']).exists():
+        verified_index = checkpoint['index']
+        blocks = blocks.filter(index__gte=verified_index - interval + 1)
+
+    previous_block = None
+    # Timestamps of the most recent blocks, enough to recompute a retarget
+    timestamps = deque(maxlen=interval)
+
+    for block in blocks.iterator(chunk_size=settings.BLOCKCHAIN_CHAIN_MAX_PAGE_SIZE):
+        if verified_index is None or block.index > verified_index:
+            if block.current_hash != block.hash_block():
+                return False
+            # Blocks mined before Merkle roots were recorded have none to check
+            if block.merkle_root is not None and block.merkle_root != block.compute_merkle_root(block.transactions.all()):
+                return False
+        if previous_block and (verified_index is None or block.index > verified_index):
+            if block.previous_hash != previous_block.current_hash:
+                return False
+            if block.difficulty != next_difficulty(block.index, previous_block.difficulty, timestamps):
+                return False
+            if not ProofHasher(previous_block.proof, block.difficulty).check(block.proof):
+                return False
+        previous_block = block
+        timestamps.append(block.timestamp)
+
+    if previous_block:
+        cache.set(VALIDATED_TIP_KEY, {'index': previous_block.index, 'hash': previous_block.current_hash}, None)
+    return True
+
+
+@receiver(post_save, sender=Block)
+@receiver(post_delete, sender=Block)
+def invalidate_checkpoint(sender, instance, **kwargs):
+    """
+    Drops the checkpoint when a block at or below it is saved or deleted, forcing a full re-check.
+    Bulk updates bypass this, see validate_blocks.
+    """
+    checkpoint = cache.get(VALIDATED_TIP_KEY)
+    if checkpoint and instance.index <= checkpoint['index']:
+        cache.delete(VALIDATED_TIP_KEY)
@@ -3,10 +3,24 @@ from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.contrib.auth import get_user_model
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
+import json
+import math
 from .models import *
 from .serializers import *
-from hashlib import sha256
+from .merkle import merkle_proof
+from .validation import validate_blocks
+from .mining import mining_queue
+from .mempool import mempool, MempoolError, NonceConflict
+from .events import events
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
+from .schemes import scheme_of
+from .signatures import verify_transaction, verify_transactions
+from .ledger import balance_at, tip_height
+from .responses import cached_response, chain_version, mempool_version
+from django.conf import settings
 from cryptography.hazmat.primitives import serialization
 
 User = get_user_model()
@@ -18,6 +32,7 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
         token['username'] = user.username
         token['is_staff'] = user.is_staff
         token['public_key'] = user.public_key
+        token['address'] = user.address
         token['email'] = user.email
         token['currency'] = user.currency
         return token
@@ -45,7 +60,8 @@ def initialize_genesis_block(request):
         genesis_block = Block.objects.create(
             index=0,
             proof=1,
-            previous_hash='1'
+            previous_hash='1',
+            difficulty=settings.BLOCKCHAIN_DIFFICULTY
         )
         
         genesis_block.current_hash = genesis_block.hash_block()
@@ -76,91 +92,279 @@ def register_user(request):
     return JsonResponse({
         "Message": "User created successfully",
         "public_key": user.public_key,
+        "address": user.address,
         "private_key": private_key_pem
     }, status=201)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def add_transaction(request):
+    """
+    Adds a pending transaction, either signed here with the `private_key` sent by the client
+    or already signed by the client, in which case `signature` and `nonce` replace the private key.
+    See signed_transaction() for what a client signs.
+    """
+    if request.data.get("signature"):
+        try:
+            transaction = signed_transaction(request.data, request.user.public_key)
+        except ValueError as error:
+            return JsonResponse({"error": str(error)}, status=400)
+        if not verify_transaction(transaction):
+            return JsonResponse({"error": "Invalid signature"}, status=400)
+        try:
+            mempool.add(transaction)
+        except MempoolError as error:
+            return JsonResponse({"error": str(error)}, status=409)
+        return JsonResponse(TransactionSerializer(transaction).data, status=201)
+
     sender_public_key = request.user.public_key
     recipient_public_key = request.data.get("recipient_public_key")
     amount = request.data.get("amount")
+    fee = request.data.get("fee", 0)
+    nonce = request.data.get("nonce")
     private_key_pem = request.data.get("private_key")
 
     if not recipient_public_key or not amount or not private_key_pem:
-        return JsonResponse({"error": "Recipient public key, amount, and private key are required"}, status=400)
-
-    private_key = serialization.load_pem_private_key(
-        private_key_pem.encode(),
-        password=None,
-    )
+        return JsonResponse({"error": "Recipient public key, amount, and private key or signature are required"}, status=400)
+
+    try:
+        amount = float(amount)
+        fee = float(fee)
+        nonce = None if nonce is None else int(nonce)
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "Amount and fee must be numbers and nonce an integer"}, status=400)
+    if not (math.isfinite(amount) and math.isfinite(fee)):
+        return JsonResponse({"error": "Amount and fee must be finite"}, status=400)
+    if amount <= 0 or fee < 0 or (nonce is not None and nonce < 0):
+        return JsonResponse({"error": "Amount must be positive, fee and nonce not negative"}, status=400)
+
+    try:
+        private_key = serialization.load_pem_private_key(
+            private_key_pem.encode(),
+            password=None,
+        )
+        scheme_of(private_key)
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "Private key is not a supported PEM key"}, status=400)
+
+    # Without a nonce the sender's next one is taken; if a concurrent request takes it first, sign the next
+    for _ in range(settings.BLOCKCHAIN_NONCE_RETRIES):
+        # The amount is signed as a float, the way it is read back from the database at mining time
+        transaction = Transaction(
+            sender=sender_public_key,
+            recipient_public_key=recipient_public_key,
+            amount=amount,
+            fee=fee,
+            nonce=mempool.next_nonce(request.user.address) if nonce is None else nonce,
+        )
+        transaction.sign_transaction(private_key)
+        try:
+            mempool.add(transaction)
+            return JsonResponse(TransactionSerializer(transaction).data, status=201)
+        except NonceConflict as error:
+            if nonce is not None:
+                return JsonResponse({"error": str(error)}, status=409)
+        except MempoolError as error:
+            return JsonResponse({"error": str(error)}, status=409)
 
-    transaction = Transaction(sender=sender_public_key, recipient_public_key=recipient_public_key, amount=amount)
-    transaction.sign_transaction(private_key)
-    transaction.save()
+    return JsonResponse({"error": "No free nonce found, concurrent transactions took them all"}, status=409)
 
-    return JsonResponse(TransactionSerializer(transaction).data, status=201)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def add_transaction_batch(request):
+    """
+    Adds a batch of client-signed transactions, given as the `transactions` list.
+    Each item is what add_transaction() takes with a signature. The signatures are verified
+    across the verification threads and the admitted transactions saved with one bulk insert.
+    Items are admitted in order, so a sender's later nonces may follow earlier ones in the same batch.
+    Returns {index, status, transaction or error} for every item, and how many were accepted.
+    """
+    items = request.data.get("transactions") if isinstance(request.data, dict) else None
+    if not isinstance(items, list) or not items:
+        return JsonResponse({"error": "transactions must be a non-empty list"}, status=400)
+    if len(items) > settings.BLOCKCHAIN_BATCH_MAX_TRANSACTIONS:
+        return JsonResponse({"error": f"A batch holds at most {settings.BLOCKCHAIN_BATCH_MAX_TRANSACTIONS} transactions"}, status=400)
+
+    errors = [None] * len(items)
+    parsed = []  # (index, transaction)
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise ValueError("Transaction must be an object")
+            parsed.append((index, signed_transaction(item, request.user.public_key)))
+        except ValueError as error:
+            errors[index] = str(error)
+
+    valid = verify_transactions([transaction for _, transaction in parsed])
+    for (index, _), is_valid in zip(parsed, valid):
+        if not is_valid:
+            errors[index] = "Invalid signature"
+    parsed = [(index, transaction) for (index, transaction), is_valid in zip(parsed, valid) if is_valid]
+
+    for (index, _), error in zip(parsed, mempool.add_many([transaction for _, transaction in parsed])):
+        if error is not None:
+            errors[index] = str(error)
+
+    transactions = dict(parsed)
+    results = [
+        {"index": index, "status": "rejected", "error": error} if error is not None else
+        {"index": index, "status": "accepted", "transaction": TransactionSerializer(transactions[index]).data}
+        for index, error in enumerate(errors)
+    ]
+    accepted = sum(result["status"] == "accepted" for result in results)
+    return JsonResponse({"accepted": accepted, "rejected": len(results) - accepted, "results": results})
+
+def signed_transaction(data, sender_public_key):
+    """
+    Builds the unsaved transaction a client signed, without checking the signature.
+    `sender` defaults to `sender_public_key`; `recipient_public_key`, `amount`, `nonce` and
+    the hex `signature` are required and `fee` defaults to 0.
+    The client signs the UTF-8 bytes of "sender|recipient_public_key|amount|nonce|fee", with the
+    amount and fee written as Python writes a float (5.0, 0.25) and the nonce as an integer.
+    Raises ValueError describing the first problem found.
+    """
+    sender = data.get("sender") or sender_public_key
+    recipient_public_key = data.get("recipient_public_key")
+    signature = data.get("signature")
+    if not recipient_public_key or data.get("amount") is None or data.get("nonce") is None or not signature:
+        raise ValueError("Recipient public key, amount, nonce and signature are required")
+    if not all(isinstance(value, str) for value in (sender, recipient_public_key, signature)):
+        raise ValueError("Keys and signature must be strings")
+
+    try:
+        amount = float(data["amount"])
+        fee = float(data.get("fee", 0))
+        nonce = int(data["nonce"])
+    except (TypeError, ValueError):
+        raise ValueError("Amount and fee must be numbers and nonce an integer")
+    if not (math.isfinite(amount) and math.isfinite(fee)):
+        raise ValueError("Amount and fee must be finite")
+    if amount <= 0 or fee < 0 or nonce < 0:
+        raise ValueError("Amount must be positive, fee and nonce not negative")
+
+    return Transaction(
+        sender=sender,
+        recipient_public_key=recipient_public_key,
+        amount=amount,
+        fee=fee,
+        nonce=nonce,
+        signature=signature,
+    )
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def mine_block(request):
 
-    if not Transaction.objects.filter(block__isnull=True).exists():
+    if not mempool:
         return JsonResponse({"message": "No transactions to mine"}, status=200)
 
+    # Mining runs in the background; the client polls the job for the block
     last_block = Block.objects.last()
-    last_proof = last_block.proof if last_block else 0
-    index = last_block.index + 1 if last_block else 1
-    previous_hash = last_block.current_hash if last_block else '1'
-
-    proof = 0
-    while not sha256(f'{last_proof}{proof}'.encode()).hexdigest().startswith("00"):
-        proof += 1
-
-    block = Block.objects.create(
-        index=index,
-        proof=proof,
-        previous_hash=previous_hash,
-    )
-
-    pending_transactions = Transaction.objects.filter(block__isnull=True)
-
-    for transaction in pending_transactions:
-        try:
-            sender_user = CustomUser.objects.get(public_key=transaction.sender)
-            recipient_user = CustomUser.objects.get(public_key=transaction.recipient_public_key)
+    job = mining_queue.submit(last_block.current_hash if last_block else '1')
+    return JsonResponse(job.as_dict(), status=202)
 
-            # Update balances
-            sender_user.currency -= transaction.amount
-            recipient_user.currency += transaction.amount
-            
-            # Save changes
-            sender_user.save()
-            recipient_user.save()
-
-            # Optionally mark transaction as confirmed
-            transaction.block = block
-            transaction.save()
-
-        except CustomUser.DoesNotExist:
-            # Handle the case where the user does not exist
-            return JsonResponse({"message": "Transaction involves an invalid user."}, status=400)
-
-    block.transactions.set(pending_transactions)
-    block.current_hash = block.hash_block()
-    block.save()
-
-    return JsonResponse(BlockSerializer(block).data, status=201)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def mining_status(request, job_id):
+    job = mining_queue.get(job_id)
+    if job is None:
+        return JsonResponse({"error": "Mining job not found"}, status=404)
+    return JsonResponse(job.as_dict())
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@cached_response(chain_version)
 def display_chain(request):
-    chain = Block.objects.all()
-    serializer = BlockSerializer(chain, many=True)
-    return JsonResponse(serializer.data, safe=False)
+    """
+    Blocks in index order, after the block index given as the `after` cursor.
+    Returns one page of at most `limit` blocks as a JSON list, with the cursor of the next page
+    in the X-Next-Cursor header. With `stream=1` every block after the cursor is streamed as
+    NDJSON, one block per line, while it is read from the database.
+    """
+    try:
+        after = int(request.GET.get('after', -1))
+        limit = min(int(request.GET.get('limit', settings.BLOCKCHAIN_CHAIN_PAGE_SIZE)),
+                    settings.BLOCKCHAIN_CHAIN_MAX_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({"error": "after and limit must be integers"}, status=400)
+    if limit < 1:
+        return JsonResponse({"error": "limit must be positive"}, status=400)
+
+    if request.GET.get('stream'):
+        # ASGI buffers a synchronous iterator whole, so it is given one reading pages in a thread
+        pages = async_ndjson_pages if isinstance(request._request, ASGIRequest) else ndjson_pages
+        return StreamingHttpResponse(pages(after, settings.BLOCKCHAIN_CHAIN_MAX_PAGE_SIZE),
+                                     content_type='application/x-ndjson')
+
+    # Read one block past the page to know whether there is a next page
+    blocks = list(block_page(after, limit + 1))
+    response = JsonResponse(BlockSerializer(blocks[:limit], many=True).data, safe=False)
+    if len(blocks) > limit:
+        response['X-Next-Cursor'] = str(blocks[limit - 1].index)
+    return response
+
+def block_page(after, limit):
+    """
+    Up to `limit` blocks with an index above `after`, with their transactions prefetched.
+    """
+    return Block.objects.filter(index__gt=after).order_by('index').prefetch_related('transactions')[:limit]
+
+def ndjson_page(after, size):
+    """
+    The next page of blocks after the `after` index as NDJSON, one block per line,
+    with the index of its last block, or None past the tip.
+    """
+    page = list(block_page(after, size))
+    if not page:
+        return None, ''
+    lines = ''.join(json.dumps(BlockSerializer(block).data, cls=DjangoJSONEncoder) + '\n' for block in page)
+    return page[-1].index, lines
+
+def ndjson_pages(after, size):
+    """
+    Yields successive NDJSON pages of blocks after the `after` index until the tip,
+    so only one page is held in memory at a time.
+    """
+    while True:
+        after, lines = ndjson_page(after, size)
+        if after is None:
+            return
+        yield lines
+
+async def async_ndjson_pages(after, size):
+    """
+    ndjson_pages for the ASGI server, reading each page in the thread the ORM is used from.
+    """
+    read_page = sync_to_async(ndjson_page)
+    while True:
+        after, lines = await read_page(after, size)
+        if after is None:
+            return
+        yield lines
+
+async def event_stream(request):
+    """
+    Server-Sent Events stream of the chain: `block` with the header of each mined block,
+    `transactions` with the transactions admitted to the mempool, `mining` with the state and
+    progress of mining jobs, and `resync` when events were missed and the client should reload.
+    A client reconnecting with Last-Event-ID is sent the events it missed.
+    Only served under ASGI, where an idle stream does not hold a thread.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"error": "The event stream is only served by the ASGI application"}, status=501)
+
+    response = StreamingHttpResponse(
+        events.stream(request.headers.get('Last-Event-ID'), settings.BLOCKCHAIN_EVENT_HEARTBEAT),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Stops proxies such as nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@cached_response(chain_version)
 def display_latest_block(request):
     block = Block.objects.last()
     serializer = BlockSerializer(block)
@@ -168,35 +372,80 @@ def display_latest_block(request):
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@cached_response(mempool_version)
 def display_pending_transactions(request):
-    transactions = Transaction.objects.filter(block__isnull=True)
+    transactions = Transaction.objects.filter(block__isnull=True).order_by('-fee', 'id')
     serializer = TransactionSerializer(transactions, many=True)
     return JsonResponse(serializer.data, safe=False)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def validate_chain(request):
-    blocks = Block.objects.all().order_by('index')
-    is_valid = True
-    previous_block = None
-
-    for block in blocks:
-        if previous_block:
-            if block.previous_hash != previous_block.current_hash:
-                is_valid = False
-                break
-            if not sha256(f'{previous_block.proof}{block.proof}'.encode()).hexdigest().startswith("00"):
-                is_valid = False
-                break
-        previous_block = block
-
-    return JsonResponse({"is_valid": is_valid})
+    return JsonResponse({"is_valid": validate_blocks()})
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def display_block(request, block_hash):
+    block = Block.objects.filter(current_hash=block_hash).first()
+    if block is None:
+        return JsonResponse({"error": "Block not found"}, status=404)
+    return JsonResponse(BlockSerializer(block).data)
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def display_transaction(request, pk):
+    transaction = Transaction.objects.filter(pk=pk).first()
+    if transaction is None:
+        return JsonResponse({"error": "Transaction not found"}, status=404)
+
+    block = transaction.block_set.only('index', 'current_hash').first()
+    return JsonResponse({
+        "transaction": TransactionSerializer(transaction).data,
+        "block": block.index if block else None,
+        "block_hash": block.current_hash if block else None,
+    })
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def transaction_proof(request, pk):
+    transaction = Transaction.objects.filter(pk=pk).first()
+    block = transaction.block_set.first() if transaction else None
+    if block is None or block.merkle_root is None:
+        return JsonResponse({"error": "Transaction is not in a block with a Merkle root"}, status=404)
+
+    transactions = list(block.ordered_transactions())
+    position = [block_transaction.id for block_transaction in transactions].index(transaction.id)
+
+    return JsonResponse({
+        "transaction": TransactionSerializer(transaction).data,
+        "block": block.index,
+        "merkle_root": block.merkle_root,
+        "leaf": transaction.leaf_hash().hex(),
+        "proof": merkle_proof([block_transaction.leaf_hash() for block_transaction in transactions], position),
+    })
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def account_balance(request, address):
+    """
+    Balance of an address replayed from the chain, after the block at index `height`
+    (default: the tip).
+    """
+    tip = tip_height()
+    try:
+        height = int(request.GET.get('height', tip))
+    except ValueError:
+        return JsonResponse({"error": "height must be an integer"}, status=400)
+    if not 0 <= height <= tip:
+        return JsonResponse({"error": "height is not on the chain"}, status=404)
+
+    return JsonResponse({"address": address, "height": height, "balance": balance_at(address, height)})
 
 # Display transactions sent by a user
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def display_sent_transactions(request):
-    transactions = Transaction.objects.filter(sender=request.user.public_key)
+    transactions = Transaction.objects.filter(sender_address=request.user.address)
     serializer = TransactionSerializer(transactions, many=True)
     return JsonResponse(serializer.data, safe=False)
 
@@ -204,7 +453,7 @@ def display_sent_transactions(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def display_received_transactions(request):
-    transactions = Transaction.objects.filter(recipient_public_key=request.user.public_key)
+    transactions = Transaction.objects.filter(recipient_address=request.user.address)
     serializer = TransactionSerializer(transactions, many=True)
     return JsonResponse(serializer.data, safe=False)
 
@@ -212,8 +461,8 @@ def display_received_transactions(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def display_all_transactions(request):
-    sent_transactions = Transaction.objects.filter(sender=request.user.public_key)
-    received_transactions = Transaction.objects.filter(recipient_public_key=request.user.public_key)
+    sent_transactions = Transaction.objects.filter(sender_address=request.user.address)
+    received_transactions = Transaction.objects.filter(recipient_address=request.user.address)
     all_transactions = sent_transactions | received_transactions
     serializer = TransactionSerializer(all_transactions, many=True)
     return JsonResponse(serializer.data, safe=False)
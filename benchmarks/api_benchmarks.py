@@ -0,0 +1,141 @@
+"""
+Benchmarks of the Django API against a fresh SQLite database in a temporary directory:
+latency and queries per request of POST /api/transaction/, POST /api/mine/, GET /api/chain/
+with and without its response cache and GET /api/validate/, and of mining a block.
+
+The backend app is also called blockchain, so this runs in its own process apart from
+chain_benchmarks.py. Prints the results as JSON: {name: {"value", "unit", "better"}}.
+
+Usage: python benchmarks/api_benchmarks.py [--quick]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+
+def result(value, unit, better):
+    return {"value": value, "unit": unit, "better": better}
+
+
+def setup(directory):
+    """
+    Points Django at an empty database in `directory` and creates the tables.
+    """
+    import django
+    from django.conf import settings
+
+    settings.DATABASES['default']['NAME'] = os.path.join(directory, 'benchmark.sqlite3')
+    settings.ALLOWED_HOSTS = ['testserver']
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', run_syncdb=True, verbosity=0)
+
+
+def measure(results, name, request, repeat):
+    """
+    Records the median latency and the queries of `repeat` calls of `request`,
+    which may return a response to check for an error status.
+    """
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    latencies = []
+    queries = []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as captured:
+            start = perf_counter()
+            response = request()
+            latencies.append(perf_counter() - start)
+        status = getattr(response, 'status_code', None)
+        if status is not None and status >= 400:
+            raise RuntimeError(f"{name} failed with {status}: {response.content[:200]}")
+        queries.append(len(captured.captured_queries))
+
+    results[f"{name}.latency"] = result(statistics.median(latencies) * 1000, "ms", "lower")
+    results[f"{name}.queries"] = result(max(queries), "queries", "lower")
+
+
+def run(quick=False):
+    from django.core.cache import cache
+    from rest_framework.test import APIClient
+
+    from blockchain.mining import mine_pending_block, mining_queue
+    from blockchain.models import Block
+    from blockchain.validation import VALIDATED_TIP_KEY
+
+    blocks = 10 if quick else 50
+    per_block = 10 if quick else 20
+    repeat = 5 if quick else 20
+
+    client = APIClient()
+    sender = client.post('/api/register/', {'username': 'sender', 'password': 'benchmark'}, format='json').json()
+    recipient = client.post('/api/register/', {'username': 'recipient', 'password': 'benchmark'}, format='json').json()
+    token = client.post('/api/token/', {'username': 'sender', 'password': 'benchmark'}, format='json').json()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {token['access']}")
+    transaction = {'recipient_public_key': recipient['public_key'], 'amount': 0.01, 'private_key': sender['private_key']}
+
+    results = {}
+
+    def add_transactions(count):
+        for _ in range(count):
+            response = client.post('/api/transaction/', transaction, format='json')
+            if response.status_code != 201:
+                raise RuntimeError(f"Adding a transaction failed with {response.status_code}")
+
+    measure(results, "api.transaction", lambda: client.post('/api/transaction/', transaction, format='json'), repeat)
+
+    # Mining a block synchronously, as a mining job does
+    mine_pending_block()
+    add_transactions(per_block)
+    measure(results, f"mine_pending_block.transactions_{per_block}", mine_pending_block, 1)
+    while Block.objects.count() < blocks:
+        add_transactions(per_block)
+        mine_pending_block()
+
+    # The endpoint only queues a job; time how long the job takes as well
+    add_transactions(per_block)
+    measure(results, "api.mine", lambda: client.post('/api/mine/'), 1)
+    start = perf_counter()
+    mining_queue.queue.join()
+    results["api.mine.job"] = result((perf_counter() - start) * 1000, "ms", "lower")
+
+    # Emptying the cache first builds the body each time, as the first request after a new block does
+    measure(results, f"api.chain.blocks_{blocks}", lambda: cache.clear() or client.get('/api/chain/'), repeat)
+    measure(results, f"api.chain.cached.blocks_{blocks}", lambda: client.get('/api/chain/'), repeat)
+    measure(results, f"api.chain.stream.blocks_{blocks}",
+            lambda: consume(client.get('/api/chain/', {'stream': 1})), repeat)
+
+    measure(results, f"api.validate.cold.blocks_{blocks}",
+            lambda: cache.delete(VALIDATED_TIP_KEY) or client.get('/api/validate/'), repeat)
+    measure(results, f"api.validate.warm.blocks_{blocks}", lambda: client.get('/api/validate/'), repeat)
+    return results
+
+
+def consume(response):
+    """
+    Reads a streaming response to the end, so the queries it runs are counted.
+    """
+    b''.join(response.streaming_content)
+    return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of the Django API")
+    parser.add_argument('--quick', action='store_true', help="A shorter chain and fewer repeats, for a fast check")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        setup(directory)
+        print(json.dumps(run(args.quick), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Benchmarks of the standalone chain in blockchain.py:
+- proof of work hashes per second, serially and mining through Blockchain.proof_of_work's process pool
+- valid_chain blocks per second at several chain heights
+- Blockchain.hash and merkle_root cost by transaction count
+
+Prints the results as JSON: {name: {"value", "unit", "better"}}.
+
+Usage: python benchmarks/chain_benchmarks.py [--quick] [--workers 4]
+"""
+import argparse
+import io
+import json
+import os
+import sys
+from contextlib import redirect_stdout
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from blockchain import (  # noqa: E402
+    MAX_DIFFICULTY, Block, Blockchain, ProofHasher, Transaction, merkle_root,
+)
+
+
+def result(value, unit, better):
+    return {"value": value, "unit": unit, "better": better}
+
+
+def best_of(repeat, function):
+    """
+    Shortest time of `repeat` calls, the least disturbed by the rest of the machine
+    """
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        function()
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+def proof_of_work_rate(nonces, workers):
+    """
+    Nonces tried per second. Serially at a difficulty no nonce meets, so every nonce is hashed;
+    with workers through Blockchain.proof_of_work and its process pool, finding the proofs of a
+    few blocks at a difficulty needing about `nonces` tries in all, each proof p counting p + 1 nonces
+    """
+    last_hash = '0' * 64
+    if workers > 1:
+        parents = [Block(index, 0.0, [], merkle_root([]), last_hash, None, 0, 8) for index in range(4)]
+        difficulty = max(1, (nonces // len(parents)).bit_length() - 1)
+        with redirect_stdout(io.StringIO()):
+            blockchain = Blockchain(workers=workers, difficulty=1)
+        try:
+            # Start the processes before timing
+            blockchain.proof_of_work(parents[0], difficulty)
+            proofs = [blockchain.proof_of_work(parent, difficulty) for parent in parents]
+            elapsed = best_of(3, lambda: [blockchain.proof_of_work(parent, difficulty) for parent in parents])
+        finally:
+            blockchain.close()
+        return sum(proof + 1 for proof in proofs) / elapsed
+
+    hasher = ProofHasher(last_hash, MAX_DIFFICULTY)
+    return nonces / best_of(3, lambda: hasher.search(0, nonces))
+
+
+def build_chain(height, per_block):
+    """
+    A chain of `height` blocks at the lowest difficulty, so building it costs little next to validating it
+    """
+    with redirect_stdout(io.StringIO()):
+        blockchain = Blockchain(difficulty=1)
+        for index in range(height - 1):
+            for position in range(per_block):
+                blockchain.new_transaction(f'sender-{index}', f'recipient-{position}', float(position))
+            blockchain.mine_block()
+    return blockchain
+
+
+def validation_rate(height, per_block):
+    blockchain = build_chain(height, per_block)
+    with redirect_stdout(io.StringIO()):
+        elapsed = best_of(3, lambda: blockchain.valid_chain(full=True))
+    return (height - 1) / elapsed
+
+
+def hash_cost(transactions, repeat):
+    """
+    Microseconds per Blockchain.hash and per merkle_root for a block of `transactions` transactions
+    """
+    block_transactions = [Transaction(f'sender-{i}', f'recipient-{i}', float(i)) for i in range(transactions)]
+    block = Block(1, 0.0, block_transactions, merkle_root(block_transactions), '0' * 64, None, 0, 8)
+    hashing = best_of(3, lambda: [Blockchain.hash(block) for _ in range(repeat)]) / repeat
+    merkle = best_of(3, lambda: merkle_root(block_transactions))
+    return hashing * 1e6, merkle * 1e6
+
+
+def run(quick=False, workers=os.cpu_count()):
+    nonces = 50_000 if quick else 500_000
+    heights = (100, 1_000) if quick else (100, 1_000, 5_000)
+    sizes = (1, 100, 1_000) if quick else (1, 100, 1_000, 10_000)
+
+    results = {"proof_of_work.serial": result(proof_of_work_rate(nonces, 1), "hashes/s", "higher")}
+    if workers > 1:
+        results[f"proof_of_work.workers_{workers}"] = result(proof_of_work_rate(nonces, workers), "hashes/s", "higher")
+    for height in heights:
+        results[f"valid_chain.height_{height}"] = result(validation_rate(height, 10), "blocks/s", "higher")
+    for size in sizes:
+        hashing, merkle = hash_cost(size, 1_000)
+        results[f"hash.transactions_{size}"] = result(hashing, "us", "lower")
+        results[f"merkle_root.transactions_{size}"] = result(merkle, "us", "lower")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of the standalone chain")
+    parser.add_argument('--quick', action='store_true', help="Smaller sizes, for a fast check")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="Processes for the parallel proof of work, 1 skips it (default: every core)")
+    args = parser.parse_args()
+    print(json.dumps(run(args.quick, args.workers), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Compares the memory used by the in-memory chain when blocks and transactions are
+dicts (the old layout) and when they are the __slots__ Block and Transaction records.
+
+Usage: python benchmarks/memory_layout.py [--transactions 1000000] [--per-block 100]
+"""
+import argparse
+import os
+import sys
+import tracemalloc
+from time import perf_counter, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from blockchain import Block, Transaction  # noqa: E402
+
+
+def build_dicts(transactions, per_block):
+    chain = []
+    for index in range(transactions // per_block):
+        chain.append({
+            'index': index + 1,
+            'timestamp': time(),
+            'transactions': [
+                {'sender': f'sender-{i}', 'recipient': f'recipient-{i}', 'amount': float(i), 'fee': 0.0, 'nonce': i}
+                for i in range(index * per_block, (index + 1) * per_block)
+            ],
+            'merkle_root': '0' * 64,
+            'previous_hash': '0' * 64,
+            'current_hash': '0' * 64,
+            'proof': index,
+            'difficulty': 8,
+        })
+    return chain
+
+
+def build_records(transactions, per_block):
+    chain = []
+    for index in range(transactions // per_block):
+        chain.append(Block(
+            index=index + 1,
+            timestamp=time(),
+            transactions=[
+                Transaction(f'sender-{i}', f'recipient-{i}', float(i), 0.0, i)
+                for i in range(index * per_block, (index + 1) * per_block)
+            ],
+            merkle_root='0' * 64,
+            previous_hash='0' * 64,
+            current_hash='0' * 64,
+            proof=index,
+            difficulty=8,
+        ))
+    return chain
+
+
+def walk_dicts(chain):
+    total = 0.0
+    for block in chain:
+        for transaction in block['transactions']:
+            total += transaction['amount']
+    return total
+
+
+def walk_records(chain):
+    total = 0.0
+    for block in chain:
+        for transaction in block.transactions:
+            total += transaction.amount
+    return total
+
+
+def measure(build, walk, transactions, per_block):
+    tracemalloc.start()
+    chain = build(transactions, per_block)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = perf_counter()
+    walk(chain)
+    return size, perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory per layout of the in-memory chain")
+    parser.add_argument('--transactions', type=int, default=1_000_000)
+    parser.add_argument('--per-block', type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"{args.transactions} transactions, {args.per_block} per block")
+    for name, build, walk in (('dict', build_dicts, walk_dicts), ('slots', build_records, walk_records)):
+        size, elapsed = measure(build, walk, args.transactions, args.per_block)
+        print(f"{name:>6}: {size / 2 ** 20:8.1f} MiB, {size / args.transactions:6.1f} B/transaction, "
+              f"walk {elapsed * 1000:7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
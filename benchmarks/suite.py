@@ -0,0 +1,158 @@
+"""
+Runs the chain and API benchmarks, stores the results as JSON and flags regressions
+against the committed baseline.
+
+A timing regresses when it is worse than the baseline by more than --tolerance (a fraction);
+a query count regresses as soon as it grows. Exits with status 1 when anything regressed.
+Benchmarks missing from either side are listed but not flagged.
+
+Timings depend on the machine, so every run also times a fixed calibration loop before and
+after the benchmarks (machine.calibration, the slower of the two), and the baseline's timings
+are scaled by how much faster or slower this machine runs it before they are compared; --absolute
+turns the scaling off. It evens out the speed of a core, not the number of cores or other load:
+proof_of_work.workers_N only exists for the --workers it ran with. To regenerate the baseline,
+check out a commit known to be good on the machine that will check against it, run the suite
+with --update-baseline and the same --quick and --workers as the checks, and commit
+benchmarks/baseline.json.
+
+Usage: python benchmarks/suite.py [--quick] [--output results.json] [--update-baseline] [--absolute]
+"""
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+from time import perf_counter
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(BENCHMARKS_DIR, 'baseline.json')
+SCRIPTS = ('chain_benchmarks.py', 'api_benchmarks.py')
+CALIBRATION = 'machine.calibration'
+
+
+def run_benchmarks(quick, workers):
+    """
+    Runs every benchmark script in its own process and merges their results.
+    """
+    results = {}
+    for script in SCRIPTS:
+        command = [sys.executable, os.path.join(BENCHMARKS_DIR, script)]
+        if quick:
+            command.append('--quick')
+        if script == 'chain_benchmarks.py' and workers:
+            command += ['--workers', str(workers)]
+        print(f"Running {script}...", file=sys.stderr)
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        results.update(json.loads(output))
+    return results
+
+
+def calibrate(loops=200_000):
+    """
+    Loops per second of a fixed mix of interpreter work and hashing, the best of five runs
+    """
+    def loop():
+        for i in range(loops):
+            hashlib.sha256(b'%d' % i).digest()
+
+    times = []
+    for _ in range(5):
+        start = perf_counter()
+        loop()
+        times.append(perf_counter() - start)
+    return loops / min(times)
+
+
+def machine_speed(results, baseline):
+    """
+    :return: <float> How much faster this machine ran the calibration loop than the baseline's, None if either did not
+    """
+    if CALIBRATION not in results or CALIBRATION not in baseline:
+        return None
+    return results[CALIBRATION]['value'] / baseline[CALIBRATION]['value']
+
+
+def compare(results, baseline, tolerance, speed=1.0):
+    """
+    :param speed: <float> Factor the baseline's timings are scaled by, see machine_speed
+    :return: <list> (name, baseline value, value, relative change, regressed) for every benchmark
+    """
+    rows = []
+    for name in sorted(set(results) | set(baseline)):
+        if name not in results or name not in baseline:
+            rows.append((name, baseline.get(name, {}).get('value'), results.get(name, {}).get('value'), None, False))
+            continue
+        if name == CALIBRATION:
+            continue
+
+        old, new = baseline[name]['value'], results[name]['value']
+        if results[name]['unit'] != 'queries':
+            old = old * speed if results[name]['better'] == 'higher' else old / speed
+        change = (new - old) / old if old else 0.0
+        # Positive when the benchmark got worse
+        worse = change if results[name]['better'] == 'lower' else -change
+        allowed = 0.0 if results[name]['unit'] == 'queries' else tolerance
+        rows.append((name, old, new, change, worse > allowed))
+    return rows
+
+
+def print_report(rows, speed=None):
+    if speed is not None:
+        print(f"This machine runs the calibration loop {speed:.2f}x as fast as the baseline's; "
+              f"baseline timings are scaled by it")
+    print(f"{'benchmark':<48} {'baseline':>14} {'current':>14} {'change':>9}")
+    for name, old, new, change, regressed in rows:
+        old_text = '-' if old is None else f"{old:14.4g}"
+        new_text = '-' if new is None else f"{new:14.4g}"
+        change_text = '-' if change is None else f"{change:+8.1%}"
+        print(f"{name:<48} {old_text:>14} {new_text:>14} {change_text:>9}{'  REGRESSION' if regressed else ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark suite with a regression baseline")
+    parser.add_argument('--quick', action='store_true', help="Smaller sizes, for a fast check")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Processes for the parallel proof of work benchmark (default: every core)")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Slowdown tolerated before a timing is flagged (default: 0.25)")
+    parser.add_argument('--output', default=None, help="Write the results to this JSON file")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="Baseline JSON to compare with")
+    parser.add_argument('--update-baseline', action='store_true', help="Replace the baseline with these results")
+    parser.add_argument('--absolute', action='store_true',
+                        help="Compare timings as measured, without scaling them to this machine's speed")
+    args = parser.parse_args()
+
+    # Calibrated on both sides of the run, so a machine slowed down meanwhile shows in the slower one
+    before = calibrate()
+    results = run_benchmarks(args.quick, args.workers)
+    results[CALIBRATION] = {"value": min(before, calibrate()), "unit": "loops/s", "better": "higher"}
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as baseline:
+            json.dump(results, baseline, indent=2, sort_keys=True)
+            baseline.write('\n')
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --update-baseline to create one")
+        return
+
+    with open(args.baseline) as baseline:
+        baseline = json.load(baseline)
+    speed = None if args.absolute else machine_speed(results, baseline)
+    rows = compare(results, baseline, args.tolerance, speed or 1.0)
+    print_report(rows, speed)
+
+    regressions = [row[0] for row in rows if row[4]]
+    if regressions:
+        print(f"\n{len(regressions)} regressions: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,57 +1,1124 @@
+import argparse
 import hashlib
 import json
+import math
+import mmap
+import os
+import struct
+import zlib
+from array import array
+import heapq
+from bisect import bisect_right, insort
+from collections import defaultdict
+from itertools import count
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from time import time
 
+# Number of nonces handed to a worker process at a time by the parallel proof of work
+PROOF_CHUNK_SIZE = 50_000
+
+# Chains with fewer blocks left to validate than this are checked serially even with several workers
+PARALLEL_VALIDATION_MIN_BLOCKS = 1_000
+
+# Messages printed for the first invalid block found by valid_chain, keyed by the failed check
+INVALID_BLOCK_MESSAGES = {
+    'previous_hash': "Invalid block at index {}: Previous hash does not match.",
+    'transactions': "Invalid transactions at block {}: Merkle root does not match.",
+    'difficulty': "Invalid difficulty at block {}.",
+    'proof': "Invalid proof of work at block {}.",
+}
+
+# Difficulty is the number of leading zero bits hash(last_hash + proof) must have (8 bits is '00' in hex)
+DEFAULT_DIFFICULTY = 8
+MAX_DIFFICULTY = 256
+
+# Retargeting moves the difficulty by at most this many bits at a time (a factor of 4 in work)
+MAX_RETARGET_STEP = 2
+
+# previous_hash of the genesis block, also the hash its proof is mined against
+GENESIS_PREVIOUS_HASH = '1'
+
+# Fixed-width part of the binary block header: index, timestamp, proof, difficulty
+BLOCK_HEADER = struct.Struct('>QdQH')
+# Fixed-width part of an encoded transaction: amount, fee, nonce
+TRANSACTION_TERMS = struct.Struct('>ddQ')
+# Length prefix of encoded strings
+STRING_LENGTH = struct.Struct('>I')
+
+# Entry of the block store index: offset of the block's record in the segment, block hash
+STORE_INDEX_ENTRY = struct.Struct('>Q32s')
+# Bytes a segment record adds around the encoded block: length prefix and CRC32
+STORE_RECORD_OVERHEAD = 2 * STRING_LENGTH.size
+
+# The account ledger keeps a copy of every balance once every this many blocks
+SNAPSHOT_INTERVAL = 100
+
+# Most transactions the mempool holds before evicting the lowest fee ones
+MEMPOOL_MAX_SIZE = 100_000
+# Most transactions mined into one block
+MAX_BLOCK_TRANSACTIONS = 1_000
+# Most blocks held while their parent is unknown, the oldest are dropped beyond it
+MAX_ORPHANS = 100
+
+
+class Record:
+    """
+    Base of the compact chain records. Fields live in __slots__ instead of a per-object dict,
+    and can still be read and written with record['field'] like the dicts they replace.
+    """
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __eq__(self, other):
+        if not isinstance(other, type(self)):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+class Transaction(Record):
+    __slots__ = ('sender', 'recipient', 'amount', 'fee', 'nonce')
+
+    def __init__(self, sender, recipient, amount, fee=0.0, nonce=0):
+        self.sender = sender
+        self.recipient = recipient
+        self.amount = amount
+        self.fee = fee
+        self.nonce = nonce  # Position in the sender's sequence, a (sender, nonce) pair is mined once
+
+
+class MempoolEntry(Record):
+    """
+    A pending transaction, with the fee and nonce it carries at hand for the pool's orderings
+    """
+    __slots__ = ('transaction', 'fee', 'nonce', 'sequence')
+
+    def __init__(self, transaction, fee, nonce, sequence):
+        self.transaction = transaction
+        self.fee = fee
+        self.nonce = nonce
+        self.sequence = sequence  # Admission order, breaks ties between equal fees
+
+
+class SideBlock(Record):
+    """
+    A block off the active chain, with its height and the cumulative work of its branch
+    """
+    __slots__ = ('block', 'height', 'work')
+
+    def __init__(self, block, height, work):
+        self.block = block
+        self.height = height
+        self.work = work
+
+
+class MempoolError(Exception):
+    """
+    A transaction the mempool refuses to admit
+    """
+
+
+class Block(Record):
+    __slots__ = ('index', 'timestamp', 'transactions', 'merkle_root', 'previous_hash', 'current_hash', 'proof',
+                 'difficulty')
+
+    def __init__(self, index, timestamp, transactions, merkle_root, previous_hash, current_hash, proof, difficulty):
+        self.index = index
+        self.timestamp = timestamp
+        self.transactions = transactions
+        self.merkle_root = merkle_root
+        self.previous_hash = previous_hash
+        self.current_hash = current_hash
+        self.proof = proof  # This is the nonce
+        self.difficulty = difficulty  # Leading zero bits
+
+    def to_dict(self):
+        """
+        JSON-ready copy of the block, with its transactions as dicts
+        """
+        data = super().to_dict()
+        data['transactions'] = [transaction.to_dict() for transaction in self.transactions]
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data, transactions=[Transaction.from_dict(transaction) for transaction in data['transactions']])
+        return cls(**data)
+
+
+def encode_string(value):
+    """
+    Encodes a string as its UTF-8 bytes prefixed with their length
+    """
+    data = value.encode()
+    return STRING_LENGTH.pack(len(data)) + data
+
+
+def encode_transaction(transaction):
+    """
+    Canonical binary encoding of a transaction: sender, recipient, amount, fee, nonce
+    :param transaction: <Transaction> Transaction
+    :return: <bytes> Encoded transaction
+    """
+    return (
+        encode_string(transaction.sender)
+        + encode_string(transaction.recipient)
+        + TRANSACTION_TERMS.pack(transaction.amount, transaction.fee, transaction.nonce)
+    )
+
+
+def merkle_leaf(transaction):
+    """
+    Leaf hash of a transaction. Leaves and inner nodes are hashed with different prefixes
+    so an inner node can never be passed off as a transaction.
+    :param transaction: <Transaction> Transaction
+    :return: <bytes> Leaf hash
+    """
+    return hashlib.sha256(b'\x00' + encode_transaction(transaction)).digest()
+
+
+def transaction_id(transaction):
+    """
+    Identifier of a transaction: its Merkle leaf hash in hex
+    :param transaction: <Transaction> Transaction
+    :return: <str> Transaction id
+    """
+    return merkle_leaf(transaction).hex()
+
+
+def merkle_parent(left, right):
+    """
+    Hash of an inner node of the Merkle tree
+    """
+    return hashlib.sha256(b'\x01' + left + right).digest()
+
+
+def merkle_levels(transactions):
+    """
+    Builds the Merkle tree over a list of transactions.
+    A node without a sibling is carried up to the next level unchanged.
+    :param transactions: <list> Transactions
+    :return: <list> Levels of the tree, from the leaves up to the root
+    """
+    level = [merkle_leaf(transaction) for transaction in transactions]
+    levels = [level]
+    while len(level) > 1:
+        level = [
+            merkle_parent(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+            for i in range(0, len(level), 2)
+        ]
+        levels.append(level)
+    return levels
+
+
+def merkle_root(transactions):
+    """
+    Merkle root of a list of transactions, which the block header commits to
+    :param transactions: <list> Transactions
+    :return: <str> Hex digest, the hash of the empty string for a block without transactions
+    """
+    if not transactions:
+        return hashlib.sha256(b'').hexdigest()
+    return merkle_levels(transactions)[-1][0].hex()
+
+
+def merkle_proof(transactions, position):
+    """
+    Inclusion proof for one transaction of a block: the sibling hashes on the path to the root
+    :param transactions: <list> Transactions of the block
+    :param position: <int> Position of the transaction in the block
+    :return: <list> [sibling hash, 'left' or 'right'] pairs, from the leaf upwards
+    """
+    proof = []
+    for level in merkle_levels(transactions)[:-1]:
+        sibling = position ^ 1
+        if sibling < len(level):
+            proof.append([level[sibling].hex(), 'left' if sibling < position else 'right'])
+        position //= 2
+    return proof
+
+
+def verify_merkle_proof(transaction, proof, root):
+    """
+    Checks an inclusion proof from merkle_proof against a Merkle root
+    :param transaction: <Transaction> The transaction
+    :param proof: <list> [sibling hash, side] pairs
+    :param root: <str> Merkle root of the block
+    :return: <bool> True if the transaction is in the block
+    """
+    node = merkle_leaf(transaction)
+    for sibling, side in proof:
+        sibling = bytes.fromhex(sibling)
+        node = merkle_parent(sibling, node) if side == 'left' else merkle_parent(node, sibling)
+    return node.hex() == root
+
+
+def encode_header(block):
+    """
+    Canonical binary encoding of a block header: the fixed-width fields, then previous_hash and the
+    Merkle root of the transactions. current_hash and the transactions themselves are not part of the header.
+    :param block: <Block> Block
+    :return: <bytes> Encoded header
+    """
+    return (
+        BLOCK_HEADER.pack(block.index, block.timestamp, block.proof, block.difficulty)
+        + encode_string(block.previous_hash)
+        + bytes.fromhex(block.merkle_root)
+    )
+
+
+def decode_string(data, offset):
+    """
+    Reads a length-prefixed string written by encode_string
+    :return: <tuple> The string and the offset just after it
+    """
+    (length,) = STRING_LENGTH.unpack_from(data, offset)
+    offset += STRING_LENGTH.size
+    return bytes(data[offset:offset + length]).decode(), offset + length
+
+
+def encode_block(block):
+    """
+    Binary encoding of a whole block for storage: the header, current_hash and the transactions
+    :param block: <Block> Block
+    :return: <bytes> Encoded block
+    """
+    parts = [encode_header(block), encode_string(block.current_hash), STRING_LENGTH.pack(len(block.transactions))]
+    parts.extend(encode_transaction(transaction) for transaction in block.transactions)
+    return b''.join(parts)
+
+
+def decode_block(data):
+    """
+    Rebuilds a block from encode_block output
+    :param data: <bytes> Encoded block, any buffer
+    :return: <Block> Block
+    """
+    index, timestamp, proof, difficulty = BLOCK_HEADER.unpack_from(data, 0)
+    previous_hash, offset = decode_string(data, BLOCK_HEADER.size)
+    root = bytes(data[offset:offset + 32]).hex()
+    current_hash, offset = decode_string(data, offset + 32)
+    (count,) = STRING_LENGTH.unpack_from(data, offset)
+    offset += STRING_LENGTH.size
+
+    transactions = []
+    for _ in range(count):
+        sender, offset = decode_string(data, offset)
+        recipient, offset = decode_string(data, offset)
+        amount, fee, nonce = TRANSACTION_TERMS.unpack_from(data, offset)
+        offset += TRANSACTION_TERMS.size
+        transactions.append(Transaction(sender, recipient, amount, fee, nonce))
+
+    return Block(index, timestamp, transactions, root, previous_hash, current_hash, proof, difficulty)
+
+
+def difficulty_target(difficulty):
+    """
+    Returns the largest digest that satisfies a difficulty, as 32 big-endian bytes.
+    A digest meets the difficulty when it compares <= the target.
+    :param difficulty: <int> Number of leading zero bits
+    :return: <bytes> The target
+    """
+    return ((1 << (MAX_DIFFICULTY - difficulty)) - 1).to_bytes(32, 'big')
+
+
+def retarget(difficulty, actual_time, expected_time):
+    """
+    Adjusts the difficulty so blocks are found in expected_time again.
+    Each bit doubles the work, so the difficulty moves by log2(expected / actual) bits,
+    at most MAX_RETARGET_STEP bits in either direction.
+    :param difficulty: <int> The difficulty of the period that just ended
+    :param actual_time: <float> Seconds the period took
+    :param expected_time: <float> Seconds the period should have taken
+    :return: <int> The difficulty of the next period
+    """
+    step = MAX_RETARGET_STEP
+    if actual_time > 0:
+        step = round(math.log2(expected_time / actual_time))
+    step = max(-MAX_RETARGET_STEP, min(MAX_RETARGET_STEP, step))
+    return max(0, min(MAX_DIFFICULTY, difficulty + step))
+
+
+class ProofHasher:
+    """
+    Fast path for checking proofs against a fixed last_hash.
+    The last_hash prefix is hashed once and its SHA-256 state is copied for every nonce,
+    so each attempt only feeds the nonce bytes. The target is checked on the raw digest.
+    """
+
+    def __init__(self, last_hash, difficulty=DEFAULT_DIFFICULTY):
+        self.midstate = hashlib.sha256(last_hash.encode())
+        self.target = difficulty_target(difficulty)
+
+    def check(self, proof):
+        """
+        :param proof: <int> The proof to check
+        :return: <bool> True if hash(last_hash + proof) meets the target
+        """
+        guess = self.midstate.copy()
+        guess.update(b'%d' % proof)
+        return guess.digest() <= self.target
+
+    def search(self, start=0, stop=None):
+        """
+        Scans nonces upwards from start for a valid proof.
+        :param start: <int> First nonce to try
+        :param stop: <int> Nonce to stop at (exclusive), None searches until a proof is found
+        :return: <int> The lowest valid proof in the range, or None if there is none
+        """
+        copy = self.midstate.copy
+        target = self.target
+        proof = start
+        while stop is None or proof < stop:
+            guess = copy()
+            guess.update(b'%d' % proof)
+            if guess.digest() <= target:
+                return proof
+            proof += 1
+        return None
+
+
+def search_proof_range(last_hash, difficulty, start, stop):
+    """
+    Scans the nonces in [start, stop) for a valid proof. Runs inside a worker process.
+    :param last_hash: <str> The hash of the last block
+    :param difficulty: <int> Number of leading zero bits required
+    :param start: <int> First nonce to try
+    :param stop: <int> Nonce to stop at (exclusive)
+    :return: <int> The lowest valid proof in the range, or None if there is none
+    """
+    return ProofHasher(last_hash, difficulty).search(start, stop)
+
+
+def parallel_proof_of_work(last_hash, workers, difficulty=DEFAULT_DIFFICULTY, chunk_size=PROOF_CHUNK_SIZE, pool=None):
+    """
+    Parallel Proof of Work:
+    - The nonce space is cut into consecutive chunks of chunk_size nonces which are handed out to a process pool
+    - Once a worker finds a proof no chunk above it is started, and the search only waits for the chunks below it
+    - Returns the lowest valid proof, which is the same proof the serial search finds
+    :param last_hash: <str> The hash of the last block
+    :param workers: <int> Number of worker processes
+    :param difficulty: <int> Number of leading zero bits required
+    :param chunk_size: <int> Number of nonces per chunk
+    :param pool: <ProcessPoolExecutor> Pool of at least `workers` processes to reuse, None starts one for this search
+    :return: <int> The proof
+    """
+    own_pool = pool is None
+    if own_pool:
+        pool = ProcessPoolExecutor(max_workers=workers)
+    in_flight = {}
+    try:
+        next_start = 0
+        best = None
+
+        while True:
+            # Keep every worker busy with chunks below the best proof found so far
+            while len(in_flight) < workers * 2 and (best is None or next_start < best):
+                future = pool.submit(search_proof_range, last_hash, difficulty, next_start, next_start + chunk_size)
+                in_flight[future] = next_start
+                next_start += chunk_size
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                del in_flight[future]
+                proof = future.result()
+                if proof is not None and (best is None or proof < best):
+                    best = proof
+
+            if best is not None:
+                # Chunks starting above the best proof cannot improve on it
+                for future, start in list(in_flight.items()):
+                    if start > best:
+                        future.cancel()
+                        del in_flight[future]
+                if not in_flight:
+                    return best
+    finally:
+        for future in in_flight:
+            future.cancel()
+        if own_pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+def validate_block_range(blocks, start):
+    """
+    Checks the hash links and proofs of a run of consecutive blocks. Runs inside a worker process.
+    The first block's proof is checked against its own previous_hash; the caller stitches that
+    link to the hash of the block before the run.
+    :param blocks: <list> The blocks of the run
+    :param start: <int> Chain index of the first block
+    :return: <tuple> (index, check) of the first invalid block or None, and the hash of the last block
+    """
+    last_hash = blocks[0].previous_hash
+    for offset, block in enumerate(blocks):
+        if offset and block.previous_hash != last_hash:
+            return (start + offset, 'previous_hash'), None
+        if block.merkle_root != merkle_root(block.transactions):
+            return (start + offset, 'transactions'), None
+        if not Blockchain.valid_proof(last_hash, block.proof, block.difficulty):
+            return (start + offset, 'proof'), None
+        last_hash = Blockchain.hash(block)
+    return None, last_hash
+
+
+class BlockStore:
+    """
+    Append-only on-disk storage for the chain, usable in place of the chain list.
+    - blocks.dat is a segment of records: length, encode_block output, CRC32 of the encoded block
+    - blocks.idx holds one fixed-width entry per block: record offset and block hash
+    Reads go through a memory map of the segment. Opening the store only loads the index,
+    and repairs a torn write at the tail left by a crash. Blocks are only ever appended,
+    or cut off the tail when the chain reorganises.
+    """
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.segment_path = os.path.join(directory, 'blocks.dat')
+        self.index_path = os.path.join(directory, 'blocks.idx')
+        self.offsets = array('Q')
+        self.heights = {}  # Block hash -> height
+        self.map = None
+
+        for path in (self.segment_path, self.index_path):
+            if not os.path.exists(path):
+                open(path, 'wb').close()
+
+        self.load_index()
+        self.recover()
+        self.segment = open(self.segment_path, 'ab')
+        self.index = open(self.index_path, 'ab')
+
+    def load_index(self):
+        """
+        Reads the index entries, ignoring a partly written last entry
+        """
+        with open(self.index_path, 'rb') as index:
+            data = index.read()
+        count = len(data) // STORE_INDEX_ENTRY.size
+        for height in range(count):
+            offset, block_hash = STORE_INDEX_ENTRY.unpack_from(data, height * STORE_INDEX_ENTRY.size)
+            self.offsets.append(offset)
+            self.heights[block_hash.hex()] = height
+
+    def recover(self):
+        """
+        Brings the index and the segment back in line after a crash.
+        Indexed records that did not fully reach the segment are dropped, complete records
+        that are missing from the index are indexed, and anything after the last complete record is cut off.
+        """
+        segment_size = os.path.getsize(self.segment_path)
+        with open(self.segment_path, 'rb') as segment:
+            while self.offsets and self.read_record(segment, self.offsets[-1], segment_size) is None:
+                self.offsets.pop()
+            if len(self.heights) > len(self.offsets):
+                self.heights = {block_hash: height for block_hash, height in self.heights.items()
+                                if height < len(self.offsets)}
+
+            end = 0
+            if self.offsets:
+                end = self.offsets[-1] + STORE_RECORD_OVERHEAD + len(self.read_record(segment, self.offsets[-1], segment_size))
+
+            recovered = []
+            while True:
+                payload = self.read_record(segment, end, segment_size)
+                if payload is None:
+                    break
+                recovered.append((end, decode_block(payload).current_hash))
+                end += STORE_RECORD_OVERHEAD + len(payload)
+
+        with open(self.segment_path, 'r+b') as segment:
+            segment.truncate(end)
+        with open(self.index_path, 'r+b') as index:
+            index.truncate(len(self.offsets) * STORE_INDEX_ENTRY.size)
+            index.seek(0, os.SEEK_END)
+            for offset, block_hash in recovered:
+                index.write(STORE_INDEX_ENTRY.pack(offset, bytes.fromhex(block_hash)))
+                self.heights[block_hash] = len(self.offsets)
+                self.offsets.append(offset)
+            index.flush()
+            os.fsync(index.fileno())
+
+    @staticmethod
+    def read_record(segment, offset, segment_size):
+        """
+        Reads the record at offset from an open segment file
+        :return: <bytes> The encoded block, or None if the record is incomplete or corrupt
+        """
+        if offset + STORE_RECORD_OVERHEAD > segment_size:
+            return None
+        segment.seek(offset)
+        (length,) = STRING_LENGTH.unpack(segment.read(STRING_LENGTH.size))
+        if offset + STORE_RECORD_OVERHEAD + length > segment_size:
+            return None
+        payload = segment.read(length)
+        (checksum,) = STRING_LENGTH.unpack(segment.read(STRING_LENGTH.size))
+        return payload if zlib.crc32(payload) == checksum else None
+
+    def append(self, block):
+        """
+        Appends a block. The record is flushed to disk before its index entry is written,
+        so the index never points at data that is not on disk.
+        :param block: <Block> Block
+        """
+        payload = encode_block(block)
+        offset = self.segment.tell()
+        self.segment.write(STRING_LENGTH.pack(len(payload)) + payload + STRING_LENGTH.pack(zlib.crc32(payload)))
+        self.segment.flush()
+        os.fsync(self.segment.fileno())
+
+        self.index.write(STORE_INDEX_ENTRY.pack(offset, bytes.fromhex(block.current_hash)))
+        self.index.flush()
+        os.fsync(self.index.fileno())
+
+        self.heights[block.current_hash] = len(self.offsets)
+        self.offsets.append(offset)
+
+    def block_at(self, height):
+        """
+        Reads the block at a height through the memory map
+        :param height: <int> Position of the block in the chain
+        :return: <Block> Block
+        """
+        offset = self.offsets[height]
+        if self.map is None or offset + STORE_RECORD_OVERHEAD > len(self.map):
+            self.remap()
+        (length,) = STRING_LENGTH.unpack_from(self.map, offset)
+        start = offset + STRING_LENGTH.size
+        return decode_block(memoryview(self.map)[start:start + length])
+
+    def get_by_hash(self, block_hash):
+        """
+        :param block_hash: <str> Hash of the block
+        :return: <Block> The block, or None if it is not stored
+        """
+        height = self.heights.get(block_hash)
+        return None if height is None else self.block_at(height)
+
+    def remap(self):
+        """
+        Maps the segment again after it has grown
+        """
+        if self.map is not None:
+            self.map.close()
+        with open(self.segment_path, 'rb') as segment:
+            self.map = mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def truncate(self, height):
+        """
+        Drops the blocks from a height to the tip. The index is cut before the segment,
+        so the index never points at data that is not on disk.
+        :param height: <int> Number of blocks to keep
+        """
+        if height >= len(self.offsets):
+            return
+        with open(self.index_path, 'rb') as index:
+            index.seek(height * STORE_INDEX_ENTRY.size)
+            removed = index.read((len(self.offsets) - height) * STORE_INDEX_ENTRY.size)
+        for position in range(0, len(removed), STORE_INDEX_ENTRY.size):
+            _, block_hash = STORE_INDEX_ENTRY.unpack_from(removed, position)
+            self.heights.pop(block_hash.hex(), None)
+
+        self.index.truncate(height * STORE_INDEX_ENTRY.size)
+        self.index.flush()
+        os.fsync(self.index.fileno())
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.segment.truncate(self.offsets[height])
+        self.segment.seek(self.offsets[height])  # Appends take their offset from the file position
+        self.segment.flush()
+        os.fsync(self.segment.fileno())
+        del self.offsets[height:]
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.segment.close()
+        self.index.close()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self.block_at(height) for height in range(*key.indices(len(self)))]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("block height out of range")
+        return self.block_at(key)
+
+    def __setitem__(self, key, value):
+        raise TypeError("BlockStore is append-only")
+
+    def __delitem__(self, key):
+        if not isinstance(key, slice) or key.stop is not None or key.step is not None:
+            raise TypeError("BlockStore can only drop blocks up to the tip")
+        self.truncate(range(len(self))[key].start if key.start is not None else 0)
+
+    def __iter__(self):
+        for height in range(len(self)):
+            yield self.block_at(height)
+
+
+class AccountLedger:
+    """
+    Account balances derived from the transactions of a chain, applied block by block.
+    Every snapshot_interval blocks a copy of the balances is kept along with the hash of the block
+    it was taken at, so the balance at any height is the nearest snapshot below it plus a replay of
+    at most snapshot_interval blocks. When blocks below the tip are replaced, the ledger rolls back
+    to the newest snapshot still on the chain instead of replaying it from genesis.
+    Accounts start at initial_balance, so senders in this simulation can go negative.
+    """
+
+    def __init__(self, blocks, snapshot_interval=SNAPSHOT_INTERVAL, initial_balance=0.0):
+        """
+        :param blocks: The chain, a list of blocks or a BlockStore
+        :param snapshot_interval: <int> Blocks between two snapshots
+        :param initial_balance: <float> Balance of an account no transaction has touched
+        """
+        self.blocks = blocks
+        self.snapshot_interval = snapshot_interval
+        self.initial_balance = initial_balance
+        self.balances = defaultdict(lambda: initial_balance)
+        self.height = 0  # Number of blocks applied to balances
+        self.tip_hash = None  # Hash of the last block applied
+        # Snapshots in height order, with the block hash each was taken at
+        self.snapshot_heights = [0]
+        self.snapshots = {0: (None, {})}
+
+    @staticmethod
+    def apply_transactions(balances, transactions):
+        """
+        Moves the amount of every transaction from its sender to its recipient
+        :param balances: <defaultdict> Balances by address, updated in place
+        :param transactions: <list> Transactions
+        """
+        for transaction in transactions:
+            balances[transaction.sender] -= transaction.amount
+            balances[transaction.recipient] += transaction.amount
+
+    def apply_block(self, block):
+        """
+        Applies the next block of the chain and takes a snapshot when one is due
+        :param block: <Block> Block at height self.height
+        """
+        self.apply_transactions(self.balances, block.transactions)
+        self.height += 1
+        self.tip_hash = block.current_hash
+        if self.height % self.snapshot_interval == 0:
+            self.snapshot_heights.append(self.height)
+            self.snapshots[self.height] = (block.current_hash, dict(self.balances))
+
+    def restore(self, height):
+        """
+        Loads the balances of the newest snapshot at or below height
+        :param height: <int> Height to restore at or below
+        """
+        snapshot_height = self.snapshot_heights[bisect_right(self.snapshot_heights, height) - 1]
+        self.tip_hash, balances = self.snapshots[snapshot_height]
+        self.balances = defaultdict(lambda: self.initial_balance, balances)
+        self.height = snapshot_height
+
+    def rewind(self, height):
+        """
+        Drops the state above height, e.g. when the blocks above it were replaced
+        :param height: <int> Number of blocks to keep
+        """
+        while self.snapshot_heights[-1] > height:
+            del self.snapshots[self.snapshot_heights.pop()]
+        if height < self.height:
+            self.restore(height)
+
+    def on_chain(self, height, block_hash):
+        """
+        Whether the block the ledger saw at this height is still the chain's block there
+        """
+        return height == 0 or (height <= len(self.blocks) and self.blocks[height - 1].current_hash == block_hash)
+
+    def sync(self):
+        """
+        Catches the balances up with the chain.
+        Rolls back to the newest snapshot still on the chain first when blocks were replaced.
+        """
+        if not self.on_chain(self.height, self.tip_hash):
+            while not self.on_chain(self.snapshot_heights[-1], self.snapshots[self.snapshot_heights[-1]][0]):
+                del self.snapshots[self.snapshot_heights.pop()]
+            self.restore(self.snapshot_heights[-1])
+        for height in range(self.height, len(self.blocks)):
+            self.apply_block(self.blocks[height])
+
+    def balances_at(self, height=None):
+        """
+        Every balance after the first height blocks, by replaying from the nearest snapshot
+        :param height: <int> Number of blocks, None for the whole chain
+        :return: <dict> Balances by address of every account a transaction has touched
+        """
+        self.sync()
+        if height is None or height == self.height:
+            return dict(self.balances)
+        if not 0 <= height <= self.height:
+            raise ValueError(f"Height {height} is not on the chain")
+
+        snapshot_height = self.snapshot_heights[bisect_right(self.snapshot_heights, height) - 1]
+        balances = defaultdict(lambda: self.initial_balance, self.snapshots[snapshot_height][1])
+        for block_height in range(snapshot_height, height):
+            self.apply_transactions(balances, self.blocks[block_height].transactions)
+        return dict(balances)
+
+    def balance(self, address, height=None):
+        """
+        Balance of an account after the first height blocks
+        :param address: Address of the account
+        :param height: <int> Number of blocks, None for the whole chain
+        :return: <float> Balance
+        """
+        if height is None:
+            self.sync()
+            return self.balances.get(address, self.initial_balance)
+        return self.balances_at(height).get(address, self.initial_balance)
+
+
+class Mempool:
+    """
+    Pending transactions waiting to be mined, ordered by the fee they offer.
+    Every transaction of a sender has a nonce; a (sender, nonce) pair is admitted once and a
+    nonce below the sender's mined ones is stale, so a conflicting resubmission is refused.
+    When balance_of is given, a sender cannot have more pending than their balance.
+    Admission is O(log n). When the pool is full the lowest fee entry is evicted to make room.
+    Blocks are filled highest fee first while keeping each sender's transactions in nonce order.
+    """
+
+    def __init__(self, max_size=MEMPOOL_MAX_SIZE, balance_of=None):
+        """
+        :param max_size: <int> Most transactions held at once
+        :param balance_of: Callable returning the confirmed balance of an address, None skips balance checks
+        """
+        self.max_size = max_size
+        self.balance_of = balance_of
+        self.entries = {}  # (sender, nonce) -> entry
+        self.pending_nonces = {}  # Sender -> sorted nonces of their pending transactions
+        self.pending_spend = defaultdict(float)  # Sender -> total amount pending
+        self.account_nonces = {}  # Sender -> lowest nonce not mined yet
+        # Min-heap of (fee, -sequence, key) to find the entry to evict; removed entries are skipped lazily
+        self.eviction_heap = []
+        self.sequence = count()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def next_nonce(self, sender):
+        """
+        The nonce the next transaction of sender should use: the first one missing from their
+        pending run, so a transaction fills the place of one that was evicted
+        """
+        nonces = self.pending_nonces.get(sender)
+        if not nonces:
+            return self.account_nonces.get(sender, 0)
+        nonce = self.account_nonces.get(sender, nonces[0])
+        if nonces[0] == nonce and nonces[-1] - nonce == len(nonces) - 1:
+            return nonces[-1] + 1
+        for pending in nonces:
+            if pending != nonce:
+                break
+            nonce += 1
+        return nonce
+
+    def add(self, transaction):
+        """
+        Admits a transaction at the fee and nonce it carries; higher fees are mined first
+        :param transaction: <Transaction> Transaction
+        :return: <MempoolEntry> The new entry
+        :raise MempoolError: The nonce is used, the sender cannot afford it or the pool is full of higher fees
+        """
+        sender = transaction.sender
+        fee = transaction.fee
+        nonce = transaction.nonce
+        key = (sender, nonce)
+        if nonce < self.account_nonces.get(sender, 0):
+            raise MempoolError(f"Nonce {nonce} of {sender} is already mined.")
+        if key in self.entries:
+            raise MempoolError(f"Nonce {nonce} of {sender} is already pending.")
+        if self.balance_of is not None and self.pending_spend[sender] + transaction.amount > self.balance_of(sender):
+            raise MempoolError(f"{sender} cannot afford {transaction.amount} on top of the pending transactions.")
+        if len(self.entries) >= self.max_size:
+            lowest = self.lowest()
+            if lowest is None or lowest.fee >= fee:
+                raise MempoolError("Mempool is full.")
+            self.remove(lowest)
+
+        entry = MempoolEntry(transaction, fee, nonce, next(self.sequence))
+        self.entries[key] = entry
+        insort(self.pending_nonces.setdefault(sender, []), nonce)
+        self.pending_spend[sender] += transaction.amount
+        heapq.heappush(self.eviction_heap, (fee, -entry.sequence, key))
+        return entry
+
+    def lowest(self):
+        """
+        The entry evicted first: the lowest fee, the newest among equal fees, None when the pool is empty
+        """
+        heap = self.eviction_heap
+        while heap:
+            fee, sequence, key = heap[0]
+            entry = self.entries.get(key)
+            if entry is not None and entry.sequence == -sequence:
+                return entry
+            heapq.heappop(heap)
+
+    def remove(self, entry):
+        """
+        Drops an entry from the pool
+        """
+        sender = entry.transaction.sender
+        del self.entries[(sender, entry.nonce)]
+        nonces = self.pending_nonces[sender]
+        nonces.remove(entry.nonce)
+        if not nonces:
+            del self.pending_nonces[sender]
+            del self.pending_spend[sender]
+        else:
+            self.pending_spend[sender] -= entry.transaction.amount
+
+        # Rebuild the eviction heap once it is mostly removed entries
+        if len(self.eviction_heap) > 2 * len(self.entries) + 64:
+            self.eviction_heap = [(e.fee, -e.sequence, k) for k, e in self.entries.items()]
+            heapq.heapify(self.eviction_heap)
+
+    def select(self, limit=MAX_BLOCK_TRANSACTIONS):
+        """
+        The best entries for the next block, in O(S + limit log S) for S senders.
+        Only the lowest pending nonce of each sender is a candidate, so a sender's transactions
+        are taken in order, and a sender's run stops at a missing nonce: an evicted transaction
+        leaves the ones after it waiting for its nonce to be used again.
+        :param limit: <int> Most entries to return
+        :return: <list> Entries, highest fee first
+        """
+        candidates = []
+        for sender, nonces in self.pending_nonces.items():
+            # A sender with no nonce mined since the pool started runs from their lowest pending one
+            if nonces[0] == self.account_nonces.get(sender, nonces[0]):
+                entry = self.entries[(sender, nonces[0])]
+                candidates.append((-entry.fee, entry.sequence, sender, 0))
+        heapq.heapify(candidates)
+
+        selected = []
+        while candidates and len(selected) < limit:
+            _, _, sender, position = heapq.heappop(candidates)
+            nonces = self.pending_nonces[sender]
+            selected.append(self.entries[(sender, nonces[position])])
+            if position + 1 < len(nonces) and nonces[position + 1] == nonces[position] + 1:
+                entry = self.entries[(sender, nonces[position + 1])]
+                heapq.heappush(candidates, (-entry.fee, entry.sequence, sender, position + 1))
+        return selected
+
+    def confirm(self, entries):
+        """
+        Removes mined entries and retires their nonces
+        :param entries: <list> Entries mined into a block
+        """
+        for entry in entries:
+            sender = entry.transaction.sender
+            self.remove(entry)
+            self.account_nonces[sender] = max(self.account_nonces.get(sender, 0), entry.nonce + 1)
+
+    def settle(self, transactions):
+        """
+        Takes the transactions of a block that joined the active chain out of the pool and retires
+        their nonces, dropping any other pending transaction of the same sender and nonce
+        :param transactions: <list> Transactions of the block
+        """
+        for transaction in transactions:
+            sender = transaction.sender
+            entry = self.entries.get((sender, transaction.nonce))
+            if entry is not None:
+                self.remove(entry)
+            self.account_nonces[sender] = max(self.account_nonces.get(sender, 0), transaction.nonce + 1)
+
+    def reorganize(self, disconnected, connected):
+        """
+        Follows a reorganisation of the chain. The nonces of the disconnected transactions are no
+        longer mined and those of the connected ones are; the disconnected transactions the new
+        branch does not hold are admitted again while their nonce is free and the sender can pay.
+        :param disconnected: <list> Transactions of the blocks that left the active chain
+        :param connected: <list> Transactions of the blocks that joined it
+        :return: <list> The transactions admitted again
+        """
+        for transaction in disconnected:
+            sender = transaction.sender
+            if transaction.nonce < self.account_nonces.get(sender, 0):
+                self.account_nonces[sender] = transaction.nonce
+        self.settle(connected)
+
+        readmitted = []
+        for transaction in disconnected:
+            try:
+                self.add(transaction)
+            except MempoolError:
+                continue
+            readmitted.append(transaction)
+        return readmitted
+
+
 class Blockchain:
-    def __init__(self):
-        self.current_transactions = []
-        self.chain = []
+    def __init__(self, workers=1, difficulty=DEFAULT_DIFFICULTY, retarget_interval=None, block_time=10, store=None,
+                 genesis=None):
+        """
+        :param workers: Number of processes used for the proof of work, 1 mines serially on a single core
+        :param difficulty: Difficulty of the genesis block in leading zero bits
+        :param retarget_interval: Retarget the difficulty every this many blocks, None keeps it fixed
+        :param block_time: Target seconds between blocks used by retargeting
+        :param store: BlockStore to keep the chain on disk, None keeps it in memory
+        :param genesis: Genesis block shared with other nodes, None mines a new one
+        """
+        self.workers = workers
+        self.pool = None  # Worker processes for mining and validation, started on first use
+        self.difficulty = difficulty
+        self.retarget_interval = retarget_interval
+        self.block_time = block_time
+        self.mempool = Mempool()
+        self.chain = store if store is not None else []
+
+        # Checkpoint of the last valid_chain call: the first verified_height blocks are valid
+        # and the block at the tip of that prefix hashed to verified_hash
+        self.verified_height = 0
+        self.verified_hash = None
+
+        # Lookup indexes: block hash -> height, and transaction id -> (height, position in the block).
+        # A stored chain brings its hash index along; its transactions are indexed on first lookup.
+        self.block_heights = dict(store.heights) if store is not None else {}
+        self.transaction_locations = {} if len(self.chain) == 0 else None
 
-        # Create the genesis block
-        self.new_block(proof=self.proof_of_work({'index': 0, 'previous_hash': '1'}), previous_hash='1')
+        # Block tree: the active chain plus every competing branch seen, keyed by block hash.
+        # Cumulative work of the active chain by height, extended lazily as it is needed
+        self.chain_work = []
+        self.side_blocks = {}  # Hash -> SideBlock, for blocks off the active chain
+        self.orphans = defaultdict(list)  # Unknown parent hash -> blocks waiting for it
 
-    def new_block(self, proof, previous_hash=None):
+        # Balances derived from the chain, brought up to date whenever they are read
+        self.ledger = AccountLedger(self.chain)
+
+        # Create the genesis block, unless the store already holds a chain
+        if len(self.chain) == 0 and genesis is not None:
+            self.chain.append(genesis)
+            self.index_block(0, genesis)
+        elif len(self.chain) == 0:
+            self.new_block(proof=self.proof_of_work(None), previous_hash=GENESIS_PREVIOUS_HASH)
+
+    def new_block(self, proof, previous_hash=None, difficulty=None):
         """
-        Create a new Block in the Blockchain
+        Create a new Block in the Blockchain holding the best transactions of the mempool
         :param proof: The proof given by the Proof of Work algorithm (nonce)
         :param previous_hash: Hash of previous Block
+        :param difficulty: Difficulty the proof was mined at, defaults to the next difficulty of the chain
         :return: New Block
         """
-        block = {
-            'index': len(self.chain) + 1,
-            'timestamp': time(),
-            'transactions': self.current_transactions,
-            'previous_hash': previous_hash or self.hash(self.chain[-1]),  # Hash of the previous block
-            'current_hash': None,  # Placeholder for the current hash
-            'proof': proof  # This is the nonce
-        }
+        entries = self.mempool.select()
+        transactions = [entry.transaction for entry in entries]
+        block = Block(
+            index=len(self.chain) + 1,
+            timestamp=time(),
+            transactions=transactions,
+            merkle_root=merkle_root(transactions),
+            previous_hash=previous_hash or self.hash(self.chain[-1]),  # Hash of the previous block
+            current_hash=None,  # Placeholder for the current hash
+            proof=proof,
+            difficulty=self.next_difficulty() if difficulty is None else difficulty,
+        )
 
         # Calculate and store the current block's hash
-        block['current_hash'] = self.hash(block)
+        block.current_hash = self.hash(block)
 
-        # Reset the current list of transactions
-        self.current_transactions = []
+        # The mined transactions leave the mempool
+        self.mempool.confirm(entries)
 
         # Add the new block to the chain
         self.chain.append(block)
+        self.index_block(len(self.chain) - 1, block)
         return block
 
-    def new_transaction(self, sender, recipient, amount):
+    def index_block(self, height, block):
+        """
+        Adds a block and its transactions to the lookup indexes
+        :param height: <int> Position of the block in the chain
+        :param block: <Block> Block
+        """
+        self.block_heights[block.current_hash] = height
+        if self.transaction_locations is not None:
+            for position, transaction in enumerate(block.transactions):
+                self.transaction_locations[transaction_id(transaction)] = (height, position)
+
+    def block_by_hash(self, block_hash):
+        """
+        Finds a block by its hash without scanning the chain
+        :param block_hash: <str> Hash of the block
+        :return: <Block> The block, or None if it is not in the chain
+        """
+        height = self.block_heights.get(block_hash)
+        if height is None or height >= len(self.chain):
+            return None
+        block = self.chain[height]
+        return block if block.current_hash == block_hash else None
+
+    def transaction_by_id(self, txid):
+        """
+        Finds a mined transaction by its id without scanning the chain.
+        Identical transactions, nonce included, share an id, in which case the latest one is returned.
+        :param txid: <str> Transaction id, see transaction_id
+        :return: <tuple> The block holding the transaction and its position in the block, or None
+        """
+        if self.transaction_locations is None:
+            self.transaction_locations = {}
+            for height, block in enumerate(self.chain):
+                self.index_block(height, block)
+
+        location = self.transaction_locations.get(txid)
+        if location is None or location[0] >= len(self.chain):
+            return None
+        height, position = location
+        block = self.chain[height]
+        if position >= len(block.transactions) or transaction_id(block.transactions[position]) != txid:
+            return None
+        return block, position
+
+    def new_transaction(self, sender, recipient, amount, fee=0.0, nonce=None):
         """
-        Creates a new transaction to go into the next mined Block
+        Creates a new transaction and adds it to the mempool to go into a mined Block
         :param sender: Address of the Sender
         :param recipient: Address of the Recipient
         :param amount: Amount
-        :return: The index of the Block that will hold this transaction
+        :param fee: Fee offered, higher fees are mined first
+        :param nonce: Position in the sender's sequence, None takes the next one
+        :return: The index of the next Block to be mined
+        :raise MempoolError: The mempool refuses the transaction
         """
-        self.current_transactions.append({
-            'sender': sender,
-            'recipient': recipient,
-            'amount': amount,
-        })
+        if nonce is None:
+            nonce = self.mempool.next_nonce(sender)
+        self.mempool.add(Transaction(sender, recipient, amount, fee, nonce))
 
         print(f"Transaction added: {sender} -> {recipient} : {amount}")
-        return self.last_block['index'] + 1
+        return self.last_block.index + 1
 
     @property
     def last_block(self):
@@ -60,77 +1127,433 @@ class Blockchain:
         """
         return self.chain[-1]
 
+    def next_difficulty(self):
+        """
+        Returns the difficulty the next block has to be mined at
+        """
+        return self.difficulty_at(len(self.chain))
+
+    def difficulty_at(self, height, parent_hash=None):
+        """
+        Returns the difficulty required for the block that follows the first `height` blocks of the chain.
+        Every retarget_interval blocks the difficulty is retargeted from the time the last interval took,
+        otherwise the block inherits the difficulty of the block before it.
+        :param height: <int> Number of blocks before the block
+        :param parent_hash: <str> Hash of the block before it on a competing branch, None for the active chain
+        :return: <int> Difficulty in leading zero bits
+        """
+        if height == 0:
+            return self.difficulty
+
+        previous = self.ancestor(parent_hash, height - 1)
+        interval = self.retarget_interval
+        if not interval or interval < 2 or height % interval != 0:
+            return previous.difficulty
+
+        first = self.ancestor(parent_hash, height - interval)
+        actual_time = previous.timestamp - first.timestamp
+        return retarget(previous.difficulty, actual_time, self.block_time * (interval - 1))
+
+    def ancestor(self, block_hash, height):
+        """
+        Finds the block at a height on the branch ending at block_hash, in O(depth of the branch)
+        :param block_hash: <str> Hash of the branch tip, None for the active chain
+        :param height: <int> Height at or below the branch tip
+        :return: <Block> Block
+        """
+        while block_hash in self.side_blocks:
+            node = self.side_blocks[block_hash]
+            if node.height == height:
+                return node.block
+            block_hash = node.block.previous_hash
+        return self.chain[height]
+
+    @staticmethod
+    def block_work(block):
+        """
+        Expected number of hashes needed to mine a block at its difficulty
+        """
+        return 1 << block.difficulty
+
+    def work_at(self, height):
+        """
+        Cumulative work of the active chain up to and including the block at a height
+        """
+        while len(self.chain_work) <= height:
+            previous = self.chain_work[-1] if self.chain_work else 0
+            self.chain_work.append(previous + self.block_work(self.chain[len(self.chain_work)]))
+        return self.chain_work[height]
+
+    def locate(self, block_hash):
+        """
+        Height and cumulative work of a block on the active chain or a competing branch
+        :return: <tuple> (height, work), or None for an unknown block
+        """
+        node = self.side_blocks.get(block_hash)
+        if node is not None:
+            return node.height, node.work
+        block = self.block_by_hash(block_hash)
+        if block is None:
+            return None
+        height = self.block_heights[block_hash]
+        return height, self.work_at(height)
+
+    def build_block(self, parent_hash, transactions):
+        """
+        Mines a block with the given transactions on top of any known block, without adding it.
+        Used to produce competing blocks; the mempool is left untouched.
+        :param parent_hash: <str> Hash of the block to build on
+        :param transactions: <list> Transactions of the block
+        :return: <Block> The mined block, to be passed to add_block
+        """
+        height = self.locate(parent_hash)[0] + 1
+        parent = self.ancestor(parent_hash, height - 1)
+        difficulty = self.difficulty_at(height, parent_hash)
+        block = Block(
+            index=height + 1,
+            timestamp=time(),
+            transactions=transactions,
+            merkle_root=merkle_root(transactions),
+            previous_hash=parent_hash,
+            current_hash=None,
+            proof=self.proof_of_work(parent, difficulty),
+            difficulty=difficulty,
+        )
+        block.current_hash = self.hash(block)
+        return block
+
+    def add_block(self, block):
+        """
+        Adds a block mined elsewhere to the block tree.
+        Fork choice is by most cumulative work, the first block seen wins a tie. A block whose
+        branch overtakes the active chain triggers a reorganisation. A block whose parent is
+        unknown is held until the parent arrives.
+        :param block: <Block> Block
+        :return: <bool> False if the block is invalid, True otherwise
+        """
+        valid = self.connect_block(block)
+        # Blocks that were waiting for this one can be connected now, and then their own children
+        waiting = self.orphans.pop(block.current_hash, []) if valid else []
+        while waiting:
+            orphan = waiting.pop()
+            if self.connect_block(orphan):
+                waiting.extend(self.orphans.pop(orphan.current_hash, []))
+        return valid
+
+    def connect_block(self, block):
+        """
+        Validates a block against its parent and links it into the block tree
+        :param block: <Block> Block
+        :return: <bool> False if the block is invalid, True otherwise
+        """
+        if block.current_hash in self.side_blocks or self.block_by_hash(block.current_hash) is not None:
+            return True
+        location = self.locate(block.previous_hash)
+        if location is None:
+            return self.hold_orphan(block)
+
+        parent_height, parent_work = location
+        height = parent_height + 1
+        if (block.index != height + 1
+                or block.current_hash != self.hash(block)
+                or block.merkle_root != merkle_root(block.transactions)
+                or block.difficulty != self.difficulty_at(height, block.previous_hash)
+                or not self.valid_proof(block.previous_hash, block.proof, block.difficulty)):
+            return False
+
+        if block.previous_hash == self.last_block.current_hash:
+            self.chain.append(block)
+            self.index_block(height, block)
+            self.mempool.settle(block.transactions)
+            return True
+
+        work = parent_work + self.block_work(block)
+        self.side_blocks[block.current_hash] = SideBlock(block, height, work)
+        if work > self.work_at(len(self.chain) - 1):
+            self.reorganize(block.current_hash)
+        return True
+
+    def hold_orphan(self, block):
+        """
+        Keeps a block whose parent is unknown until the parent arrives.
+        Its difficulty can only be checked against the parent, so the proof is checked against the
+        difficulty it claims, which may not be below what a retarget allows from the active tip.
+        Beyond MAX_ORPHANS blocks the oldest are dropped.
+        :param block: <Block> Block
+        :return: <bool> False if the block is invalid, True otherwise
+        """
+        if (block.current_hash != self.hash(block)
+                or block.merkle_root != merkle_root(block.transactions)
+                or block.difficulty < self.last_block.difficulty - MAX_RETARGET_STEP
+                or not self.valid_proof(block.previous_hash, block.proof, block.difficulty)):
+            return False
+
+        waiting = self.orphans[block.previous_hash]
+        if any(orphan.current_hash == block.current_hash for orphan in waiting):
+            return True
+        waiting.append(block)
+        if sum(map(len, self.orphans.values())) > MAX_ORPHANS:
+            oldest = next(iter(self.orphans))
+            self.orphans[oldest].pop(0)
+            if not self.orphans[oldest]:
+                del self.orphans[oldest]
+        return True
+
+    def reorganize(self, tip_hash):
+        """
+        Makes the branch ending at tip_hash the active chain.
+        Only the blocks between the fork point and the two tips are moved: the active blocks above
+        the fork point become a side branch, and the branch's blocks are appended in their place.
+        The mempool drops the transactions of the branch and takes back those only in the
+        abandoned blocks, so a payment is not lost because the block holding it lost a race.
+        :param tip_hash: <str> Hash of a block on a competing branch
+        :return: <tuple> The blocks disconnected and the blocks connected, both in height order
+        """
+        connected = []
+        block_hash = tip_hash
+        while block_hash in self.side_blocks:
+            node = self.side_blocks.pop(block_hash)
+            connected.append(node.block)
+            block_hash = node.block.previous_hash
+        connected.reverse()
+        fork_height = self.block_heights[block_hash] + 1
+
+        disconnected = self.chain[fork_height:]
+        self.work_at(len(self.chain) - 1)
+        for height, block in enumerate(disconnected, fork_height):
+            self.side_blocks[block.current_hash] = SideBlock(block, height, self.chain_work[height])
+            del self.block_heights[block.current_hash]
+            if self.transaction_locations is not None:
+                for transaction in block.transactions:
+                    txid = transaction_id(transaction)
+                    if self.transaction_locations.get(txid, (None,))[0] == height:
+                        del self.transaction_locations[txid]
+        del self.chain[fork_height:]
+        del self.chain_work[fork_height:]
+
+        for height, block in enumerate(connected, fork_height):
+            self.chain.append(block)
+            self.index_block(height, block)
+
+        # Balances and snapshots above the fork point came from the disconnected blocks
+        self.ledger.rewind(fork_height)
+        self.mempool.reorganize(
+            [transaction for block in disconnected for transaction in block.transactions],
+            [transaction for block in connected for transaction in block.transactions],
+        )
+        # The validation checkpoint cannot be above the fork point any more
+        if self.verified_height > fork_height:
+            self.verified_height = fork_height
+            self.verified_hash = self.hash(self.chain[fork_height - 1])
+        return disconnected, connected
+
     @staticmethod
     def hash(block):
         """
-        Creates a SHA-256 hash of a Block
+        Creates a SHA-256 hash of a Block header.
+        The header commits to the transactions through their Merkle root, so the cost does not grow with the block.
         :param block: Block
         :return: <str> Hash of the block
         """
-        block_string = json.dumps(block, sort_keys=True).encode()
-        return hashlib.sha256(block_string).hexdigest()
+        return hashlib.sha256(encode_header(block)).hexdigest()
+
+    def transaction_proof(self, block_index, position):
+        """
+        Returns an inclusion proof for a transaction, which can be checked with verify_merkle_proof
+        against the block's merkle_root without the rest of the block.
+        :param block_index: <int> Position of the block in the chain
+        :param position: <int> Position of the transaction in the block
+        :return: <dict> The transaction, the block's Merkle root and the proof
+        """
+        block = self.chain[block_index]
+        return {
+            'transaction': block.transactions[position],
+            'merkle_root': block.merkle_root,
+            'proof': merkle_proof(block.transactions, position),
+        }
 
-    def proof_of_work(self, last_block):
+    def proof_of_work(self, last_block, difficulty=None):
         """
         Proof of Work Algorithm:
-        - Find a number p' (nonce) such that hash(last_block + p') contains leading 2 zeros
+        - Find a number p' (nonce) such that hash(last_block + p') has `difficulty` leading zero bits
         - p is the previous proof, and p' is the new proof
+        - With more than one worker the search is spread over a process pool
+        :param last_block: The block to mine on top of, None for the genesis block
+        :param difficulty: Leading zero bits required, defaults to the next difficulty of the chain
         """
-        last_hash = self.hash(last_block)
-        proof = 0
+        last_hash = self.hash(last_block) if last_block else GENESIS_PREVIOUS_HASH
+        if difficulty is None:
+            difficulty = self.next_difficulty()
+        if self.workers > 1:
+            return parallel_proof_of_work(last_hash, self.workers, difficulty, pool=self.process_pool())
 
-        while not self.valid_proof(last_hash, proof):
-            proof += 1
+        return ProofHasher(last_hash, difficulty).search()
+
+    def process_pool(self):
+        """
+        The pool of self.workers processes, started on first use and kept until close()
+        so each proof and validation run does not pay for starting processes
+        :return: <ProcessPoolExecutor> The pool
+        """
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self.pool
 
-        return proof
+    def close(self):
+        """
+        Stops the worker processes, if they were started
+        """
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
 
     @staticmethod
-    def valid_proof(last_hash, proof):
+    def valid_proof(last_hash, proof, difficulty=DEFAULT_DIFFICULTY):
         """
-        Validates the Proof by checking if hash(last_hash + proof) starts with '00'.
+        Validates the Proof by checking if hash(last_hash + proof) has `difficulty` leading zero bits.
         :param last_hash: <str> The hash of the last block
         :param proof: <int> The current proof
+        :param difficulty: <int> Number of leading zero bits required
         :return: <bool> True if correct, False if not.
         """
-        guess = f'{last_hash}{proof}'.encode()
-        guess_hash = hashlib.sha256(guess).hexdigest()
-        return guess_hash[:2] == "00"
+        return ProofHasher(last_hash, difficulty).check(proof)
 
-    def valid_chain(self):
+    def valid_chain(self, full=False):
         """
         Determine if the current blockchain is valid by checking:
         1. The previous_hash of each block matches the hash of the previous block.
-        2. The proof of work for each block is valid.
+        2. The transactions of each block match the Merkle root in its header.
+        3. Each block records the difficulty the retargeting rules require for it.
+        4. The proof of work for each block is valid at the difficulty recorded in the block.
+        Blocks up to the verified checkpoint are skipped as long as their headers are unchanged,
+        so repeated calls only fully check the blocks appended since the last call.
+        :param full: Re-check the whole chain and ignore the checkpoint
         :return: True if the chain is valid, False otherwise
         """
-        last_block = self.chain[0]  # Genesis block
-        current_index = 1
+        start = 1
+        if not full and self.checkpoint_intact():
+            start = self.verified_height
+
+        if self.workers > 1 and len(self.chain) - start >= PARALLEL_VALIDATION_MIN_BLOCKS:
+            failure, last_hash = self.validate_parallel(start)
+        else:
+            failure, last_hash = self.validate_serial(start)
+
+        if failure:
+            index, check = failure
+            print(INVALID_BLOCK_MESSAGES[check].format(index))
+            return False
+
+        self.verified_height = len(self.chain)
+        self.verified_hash = last_hash
+        return True
+
+    def validate_serial(self, start):
+        """
+        Checks the blocks from index start to the tip one after another.
+        :param start: <int> Index of the first block to check
+        :return: <tuple> (index, check) of the first invalid block or None, and the hash of the tip
+        """
+        current_index = start
+        last_hash = self.hash(self.chain[current_index - 1])
 
         while current_index < len(self.chain):
             block = self.chain[current_index]
 
             # Check if the 'previous_hash' matches the hash of the last block
-            if block['previous_hash'] != self.hash(last_block):
-                print(f"Invalid block at index {current_index}: Previous hash does not match.")
-                return False
+            if block.previous_hash != last_hash:
+                return (current_index, 'previous_hash'), None
+
+            # Check if the transactions match the Merkle root committed to in the header
+            if block.merkle_root != merkle_root(block.transactions):
+                return (current_index, 'transactions'), None
+
+            # Check if the block was mined at the difficulty the chain requires
+            if block.difficulty != self.difficulty_at(current_index):
+                return (current_index, 'difficulty'), None
 
             # Check if the proof of work is valid for this block
-            if not self.valid_proof(self.hash(last_block), block['proof']):
-                print(f"Invalid proof of work at block {current_index}.")
-                return False
+            if not self.valid_proof(last_hash, block.proof, block.difficulty):
+                return (current_index, 'proof'), None
 
             # Move to the next block
-            last_block = block
+            last_hash = self.hash(block)
             current_index += 1
 
-        return True
+        return None, last_hash
+
+    def validate_parallel(self, start):
+        """
+        Checks the blocks from index start to the tip on a process pool.
+        The blocks are split into runs that are hashed and proof-checked in separate processes.
+        The runs are then stitched together by comparing each run's first previous_hash with the
+        hash of the last block of the run before it. The difficulty rules only read timestamps and
+        difficulties, so they are checked here while the workers hash.
+        :param start: <int> Index of the first block to check
+        :return: <tuple> (index, check) of the first invalid block or None, and the hash of the tip
+        """
+        count = len(self.chain) - start
+        run_size = -(-count // (self.workers * 4))
+        starts = range(start, len(self.chain), run_size)
+
+        pool = self.process_pool()
+        futures = [
+            pool.submit(validate_block_range, self.chain[run_start:run_start + run_size], run_start)
+            for run_start in starts
+        ]
+
+        try:
+            failures = []
+            for index in range(start, len(self.chain)):
+                if self.chain[index].difficulty != self.difficulty_at(index):
+                    failures.append((index, 'difficulty'))
+                    break
+
+            last_hash = self.hash(self.chain[start - 1])
+            for run_start, future in zip(starts, futures):
+                if self.chain[run_start].previous_hash != last_hash:
+                    failures.append((run_start, 'previous_hash'))
+                failure, last_hash = future.result()
+                if failure:
+                    failures.append(failure)
+                    break
+        finally:
+            for future in futures:
+                future.cancel()
+
+        if failures:
+            # Several checks can fail on the same block; report them in the order the serial validator runs them
+            order = list(INVALID_BLOCK_MESSAGES)
+            return min(failures, key=lambda failure: (failure[0], order.index(failure[1]))), None
+        return None, last_hash
+
+    def checkpoint_intact(self):
+        """
+        Returns True if the blocks up to the verified checkpoint are still in the chain unchanged.
+        In a chain list every header up to the checkpoint is re-hashed and compared with the
+        previous_hash of the block after it, and the last one with verified_hash, so editing,
+        replacing or truncating any verified block makes the next valid_chain call re-check from
+        the genesis block. That is one header hash per block, well below the Merkle roots and
+        proofs a full check recomputes. Transactions edited in place do not change the header;
+        valid_chain(full=True) catches those.
+        A BlockStore hands out fresh copies of its blocks and can only be cut at the tail, so
+        there the block at the checkpoint is enough.
+        """
+        height = self.verified_height
+        if height == 0 or height > len(self.chain):
+            return False
+        if not isinstance(self.chain, BlockStore):
+            for index in range(1, height):
+                if self.chain[index].previous_hash != self.hash(self.chain[index - 1]):
+                    return False
+        return self.hash(self.chain[height - 1]) == self.verified_hash
 
     def mine_block(self):
         """
         Mines a new block by finding a valid proof of work for the last block and creating a new block.
         """
 
-        if not self.current_transactions:
+        if not self.mempool:
             print("No transactions to mine.")
             return None
 
@@ -138,53 +1561,58 @@ class Blockchain:
         proof = self.proof_of_work(last_block)
         block = self.new_block(proof)
 
-        print(f"New block mined! Block index: {block['index']}")
+        print(f"New block mined! Block index: {block.index}")
         return block
 
     def simulate_race_attack(self, sender, recipient1, recipient2, amount):
         """
-        Simulates a Race Attack by creating two conflicting transactions from the same sender to two different recipients.
+        Simulates a Race Attack: two conflicting transactions from the same sender to two different recipients
+        are mined into two competing blocks on the same parent. The network settles the tie by building on one
+        of them, and the chain reorganises onto that branch, reversing the other payment.
         """
         print(f"Simulating Race Attack: Creating two conflicting transactions from {sender} to {recipient1} and {recipient2} with the same amount {amount}.")
-        
-        # Transaction 1: Sender -> Recipient1
-        self.new_transaction(sender, recipient1, amount)
-        block1 = self.new_block(self.proof_of_work(self.last_block))
-        
-        # Transaction 2: Sender -> Recipient2
-        self.new_transaction(sender, recipient2, amount)
-        block2 = self.new_block(self.proof_of_work(self.last_block))
-        
-        # Simulate network accepting only one of the blocks (race resolution)
-        if block1['proof'] < block2['proof']:  # Simulating which block gets accepted
-            self.chain.append(block1)
-            print(f"Race Attack Outcome: Block with transaction {sender} -> {recipient1} accepted.")
-        else:
-            self.chain.append(block2)
-            print(f"Race Attack Outcome: Block with transaction {sender} -> {recipient2} accepted.")
-        
+
+        # Both spend the same nonce, so once one is mined the other cannot be
+        parent_hash = self.last_block.current_hash
+        nonce = self.mempool.next_nonce(sender)
+        block1 = self.build_block(parent_hash, [Transaction(sender, recipient1, amount, nonce=nonce)])
+        block2 = self.build_block(parent_hash, [Transaction(sender, recipient2, amount, nonce=nonce)])
+
+        # Recipient1 sees its block first, it becomes the tip; block2 is held on a competing branch
+        self.add_block(block1)
+        self.add_block(block2)
+        print(f"Both blocks are at height {block1.index}. Block with {sender} -> {recipient1} is the tip.")
+
+        # Simulate which block the next miner builds on (race resolution)
+        winner, loser = (block1, block2) if block1.proof < block2.proof else (block2, block1)
+        self.add_block(self.build_block(winner.current_hash, []))
+
+        for block in (winner, loser):
+            transaction = block.transactions[0]
+            state = "confirmed" if self.block_by_hash(block.current_hash) else "reversed"
+            print(f"Race Attack Outcome: Transaction {sender} -> {transaction.recipient} {state}.")
+
         print("Race attack simulated. Only one transaction remains valid in the chain.")
 
     def simulate_finney_attack(self, sender, recipient, amount):
         """
-        Simulates a Finney Attack by pre-mining a block with a transaction, and then attempting to double spend.
-        """
-        print(f"Simulating Finney Attack: Pre-mining a block with transaction {sender} -> {recipient} : {amount}.")
-        
-        # Step 1: Pre-mine a block with the intended transaction
-        self.new_transaction(sender, recipient, amount)
-        pre_mined_block = self.new_block(self.proof_of_work(self.last_block))
-        
-        # Step 2: Victim believes they received the amount, but this transaction isn't on the blockchain yet
-        print(f"Finney Attack: Pre-mined block with transaction {sender} -> {recipient} is created but not broadcasted.")
-        
-        # Step 3: Attacker spends the same amount elsewhere, convincing the victim the funds were sent
-        victim_transaction_amount = amount
-        self.new_transaction(sender, recipient, victim_transaction_amount)
-        print(f"Victim believes the transaction is valid: {sender} -> {recipient} : {victim_transaction_amount}")
-        
-        # Step 4: Broadcast the pre-mined block, invalidating the victim's transaction
-        self.chain[-1] = pre_mined_block
+        Simulates a Finney Attack: the attacker privately pre-mines a block paying the coins back to themselves,
+        pays the victim with the same coins, and broadcasts the block before the payment is mined.
+        """
+        print(f"Simulating Finney Attack: Pre-mining a block with transaction {sender} -> {sender} : {amount}.")
+
+        # Step 1: Pre-mine a block moving the coins to the attacker's own address, without broadcasting it
+        nonce = self.mempool.next_nonce(sender)
+        pre_mined_block = self.build_block(self.last_block.current_hash,
+                                           [Transaction(sender, sender, amount, nonce=nonce)])
+        print(f"Finney Attack: Pre-mined block {pre_mined_block.index} is created but not broadcasted.")
+
+        # Step 2: The attacker pays the victim with the same coins and nonce; the victim accepts it unconfirmed
+        self.mempool.add(Transaction(sender, recipient, amount, nonce=nonce))
+        print(f"Victim believes the transaction is valid: {sender} -> {recipient} : {amount}")
+
+        # Step 3: Broadcast the pre-mined block; it spends the nonce, which drops the payment from the mempool
+        self.add_block(pre_mined_block)
         print("Finney attack succeeded: The victim's transaction is invalidated as the pre-mined block is broadcasted.")
 
 def print_menu():
@@ -198,7 +1626,8 @@ def print_menu():
     print("4. Validate the blockchain")
     print("5. Simulate Race Attack")
     print("6. Simulate Finney Attack")
-    print("7. Exit")
+    print("7. Show a balance")
+    print("8. Exit")
 
 def mine_block(blockchain):
     blockchain.mine_block()
@@ -207,10 +1636,14 @@ def add_transaction(blockchain):
     sender = input("Enter the sender: ")
     recipient = input("Enter the recipient: ")
     amount = float(input("Enter the amount: "))
-    blockchain.new_transaction(sender, recipient, amount)
+    fee = input("Enter the fee (blank for none): ")
+    try:
+        blockchain.new_transaction(sender, recipient, amount, float(fee) if fee else 0.0)
+    except MempoolError as error:
+        print(f"Transaction rejected: {error}")
 
 def display_chain(blockchain):
-    print(json.dumps(blockchain.chain, indent=4))
+    print(json.dumps([block.to_dict() for block in blockchain.chain], indent=4))
 
 def validate_blockchain(blockchain):
     is_valid = blockchain.valid_chain()
@@ -219,6 +1652,12 @@ def validate_blockchain(blockchain):
     else:
         print("Blockchain is invalid!")
 
+def show_balance(blockchain):
+    address = input("Enter the address: ")
+    height = input("Enter the height (blank for the tip): ")
+    balance = blockchain.ledger.balance(address, int(height) if height else None)
+    print(f"Balance of {address}: {balance}")
+
 def simulate_race_attack(blockchain):
     sender = input("Enter the sender: ")
     recipient1 = input("Enter the first recipient: ")
@@ -233,7 +1672,26 @@ def simulate_finney_attack(blockchain):
     blockchain.simulate_finney_attack(sender, recipient, amount)
 
 def main():
-    blockchain = Blockchain()
+    parser = argparse.ArgumentParser(description="Interactive blockchain")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Processes used for mining, 0 uses every core (default: 1)")
+    parser.add_argument('--difficulty', type=int, default=DEFAULT_DIFFICULTY,
+                        help=f"Initial difficulty in leading zero bits (default: {DEFAULT_DIFFICULTY})")
+    parser.add_argument('--retarget-interval', type=int, default=None,
+                        help="Retarget the difficulty every N blocks (default: fixed difficulty)")
+    parser.add_argument('--block-time', type=float, default=10,
+                        help="Target seconds between blocks when retargeting (default: 10)")
+    parser.add_argument('--data-dir', default=None,
+                        help="Directory to keep the chain in across runs (default: in memory only)")
+    args = parser.parse_args()
+
+    blockchain = Blockchain(
+        workers=args.workers or os.cpu_count(),
+        difficulty=args.difficulty,
+        retarget_interval=args.retarget_interval,
+        block_time=args.block_time,
+        store=BlockStore(args.data_dir) if args.data_dir else None,
+    )
     while True:
         print_menu()
         choice = input("Enter your choice: ")
@@ -250,9 +1708,12 @@ def main():
         elif choice == '6':
             simulate_finney_attack(blockchain)
         elif choice == '7':
+            show_balance(blockchain)
+        elif choice == '8':
             break
         else:
             print("Invalid choice, please try again.")
+    blockchain.close()
 
 if __name__ == '__main__':
     main()
@@ -1,11 +1,22 @@
 import hashlib
 import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from time import time
 from uuid import uuid4
 
+from blockchain import parallel_proof_of_work
+
 
 class Blockchain:
-    def __init__(self):
+    def __init__(self, workers=1):
+        """
+        :param workers: Number of processes used for the proof of work, 1 mines serially on a single core
+        """
+        self.workers = workers
+        # One pool for every proof, so each block does not pay for starting the processes
+        self.pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
         self.current_transactions = []
         self.chain = []
 
@@ -77,8 +88,12 @@ class Blockchain:
         Proof of Work Algorithm:
         - Find a number p' (nonce) such that hash(last_block + p') contains leading 2 zeros
         - p is the previous proof, and p' is the new proof
+        - With more than one worker the search is spread over a process pool
         """
         last_hash = self.hash(last_block)
+        if self.workers > 1:
+            return parallel_proof_of_work(last_hash, self.workers, pool=self.pool)
+
         proof = 0
 
         while not self.valid_proof(last_hash, proof):
@@ -194,8 +209,9 @@ def validate_blockchain(blockchain):
 
 
 if __name__ == "__main__":
-    # Instantiate the Blockchain
-    blockchain = Blockchain()
+    # Instantiate the Blockchain, optionally with the number of mining processes (0 uses every core)
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    blockchain = Blockchain(workers=workers or os.cpu_count())
 
     while True:
         print_menu()
@@ -12,20 +12,26 @@ function BlockchainPage() {
   useEffect(() => {
     const fetchBlockchain = async () => {
       try {
-        const response = await fetch(`${Config.baseURL}/api/chain/`, {
-          method: 'GET',
-          headers: {
-            'Content-Type': 'application/json',
-            'Authorization': `Bearer ${authTokens.access}`,
-          },
-        });
+        let blocks = [];
+        let cursor = null;
+        do {
+          const query = cursor === null ? '' : `?after=${cursor}`;
+          const response = await fetch(`${Config.baseURL}/api/chain/${query}`, {
+            method: 'GET',
+            headers: {
+              'Content-Type': 'application/json',
+              'Authorization': `Bearer ${authTokens.access}`,
+            },
+          });
 
-        if (response.ok) {
-          const data = await response.json();
-          setBlockchain(data);
-        } else {
-          console.error('Failed to fetch blockchain:', response.status);
-        }
+          if (!response.ok) {
+            console.error('Failed to fetch blockchain:', response.status);
+            break;
+          }
+          blocks = blocks.concat(await response.json());
+          cursor = response.headers.get('X-Next-Cursor');
+        } while (cursor !== null);
+        setBlockchain(blocks);
       } catch (error) {
         console.error('Error fetching blockchain:', error);
       } finally {
@@ -34,6 +40,15 @@ function BlockchainPage() {
     };
 
     fetchBlockchain();
+
+    // Mined blocks are pushed by the server; reload the chain if events were missed
+    const events = new EventSource(`${Config.baseURL}/api/events/`);
+    events.addEventListener('block', (event) => {
+      const block = JSON.parse(event.data);
+      setBlockchain((blocks) => blocks.concat([block]));
+    });
+    events.addEventListener('resync', fetchBlockchain);
+    return () => events.close();
   }, [authTokens]);
 
   return (
@@ -57,6 +57,22 @@ function HomePage() {
 
     fetchLatestBlock();
     fetchPendingTransactions();
+
+    // New blocks and transactions are pushed by the server instead of polled
+    const events = new EventSource(`${Config.baseURL}/api/events/`);
+    events.addEventListener('block', (event) => {
+      setLatestBlock(JSON.parse(event.data));
+      fetchPendingTransactions();
+    });
+    events.addEventListener('transactions', (event) => {
+      const transactions = JSON.parse(event.data);
+      setPendingTransactions((pending) => pending.concat(transactions));
+    });
+    events.addEventListener('resync', () => {
+      fetchLatestBlock();
+      fetchPendingTransactions();
+    });
+    return () => events.close();
   }, [authTokens]);
 
   return (
@@ -0,0 +1,753 @@
+"""
+Peer-to-peer node for blockchain.py on asyncio streams, with block and transaction gossip.
+
+Nodes exchange length-prefixed JSON messages over TCP:
+- inv: hashes of blocks and ids of transactions the sender has, announced once to each peer
+- getdata: blocks and transactions asked for by hash, answered with one block message per block,
+  one tx message holding the transactions and a notfound message for anything no longer held
+Whatever a node sees is remembered in a bounded seen set, so an announcement is fetched from one
+peer only and relayed once; when that peer does not answer within REQUEST_TIMEOUT, or answers
+notfound, the item is asked from the next peer that announced it. A block whose parent is unknown
+is held as an orphan and its parent is asked from the peer that sent it, which is also how a node
+joining late catches up. A peer sending a message that cannot be decoded is disconnected.
+
+Backpressure is per peer: a peer's replies wait in a bounded queue written as fast as its socket
+drains, and a peer letting the queue fill up is disconnected. Announcements to a peer are merged
+into one inv while its socket is busy. At most IN_FLIGHT items are asked from a peer at a time,
+the rest wait until it answers, and a peer is only read from once its last message is handled.
+
+Modes:
+- simulate: runs a network of nodes on localhost in one process, mines blocks and submits
+  transactions at random nodes, and reports propagation latency, throughput and convergence
+- node: runs one node listening on a port, connected to the given peers, optionally mining.
+  Nodes started with the same difficulty share the same genesis block.
+
+Usage: python p2p_node.py simulate [--nodes 20] [--degree 3] [--blocks 20] [--transactions 2000] [--seed 0]
+       python p2p_node.py node --port 8333 [--peer 127.0.0.1:8334 ...] [--mine-interval 10]
+"""
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import random
+import statistics
+import struct
+from contextlib import redirect_stdout
+from time import perf_counter, time
+
+from blockchain import (DEFAULT_DIFFICULTY, GENESIS_PREVIOUS_HASH, Block, Blockchain, MempoolError, ProofHasher,
+                        Transaction, merkle_root, transaction_id)
+
+# Length prefix of a message on the wire
+MESSAGE_LENGTH = struct.Struct('>I')
+# Largest message accepted, a peer sending more is disconnected
+MAX_MESSAGE_SIZE = 32 * 1024 * 1024
+# Replies waiting to be written to a peer before it is considered stuck and disconnected
+PEER_QUEUE_SIZE = 1_000
+# Items asked from a peer and not answered yet
+IN_FLIGHT = 500
+# Seconds a peer has to answer for an item before it is asked from another peer that announced it
+REQUEST_TIMEOUT = 10.0
+# Announcements merged into one inv message
+MAX_INV = 5_000
+# Block hashes and transaction ids remembered to drop duplicates
+SEEN_SIZE = 100_000
+# Pending transactions kept to answer getdata
+RELAY_SIZE = 100_000
+
+
+def encode_message(message):
+    payload = json.dumps(message, separators=(',', ':')).encode()
+    return MESSAGE_LENGTH.pack(len(payload)) + payload
+
+
+async def read_message(reader):
+    """
+    Reads one message from a stream
+    :return: <dict> The message, or None at the end of the stream
+    :raise ValueError: The message is larger than MAX_MESSAGE_SIZE or not JSON
+    """
+    try:
+        header = await reader.readexactly(MESSAGE_LENGTH.size)
+        (length,) = MESSAGE_LENGTH.unpack(header)
+        if length > MAX_MESSAGE_SIZE:
+            raise ValueError(f"Message of {length} bytes is too large")
+        return json.loads(await reader.readexactly(length))
+    except asyncio.IncompleteReadError:
+        return None
+
+
+def shared_genesis(difficulty=DEFAULT_DIFFICULTY):
+    """
+    A genesis block every node started with the same difficulty agrees on, for Blockchain(genesis=...)
+    :param difficulty: <int> Difficulty of the genesis block
+    :return: <Block> Genesis block
+    """
+    block = Block(
+        index=1,
+        timestamp=0.0,
+        transactions=[],
+        merkle_root=merkle_root([]),
+        previous_hash=GENESIS_PREVIOUS_HASH,
+        current_hash=None,
+        proof=ProofHasher(GENESIS_PREVIOUS_HASH, difficulty).search(),
+        difficulty=difficulty,
+    )
+    block.current_hash = Blockchain.hash(block)
+    return block
+
+
+class SeenSet:
+    """
+    Set of the most recently added keys, forgetting the oldest past maxlen
+    """
+
+    def __init__(self, maxlen=SEEN_SIZE):
+        self.maxlen = maxlen
+        self.keys = {}  # Insertion ordered, the oldest key first
+
+    def add(self, key):
+        """
+        :return: <bool> True if the key is new
+        """
+        if key in self.keys:
+            return False
+        self.keys[key] = None
+        if len(self.keys) > self.maxlen:
+            del self.keys[next(iter(self.keys))]
+        return True
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class Peer:
+    """
+    A connection to another node: reads its messages one at a time and writes ours through
+    a bounded queue, with announcements merged while the socket is busy
+    """
+
+    def __init__(self, node, reader, writer):
+        self.node = node
+        self.reader = reader
+        self.writer = writer
+        self.address = writer.get_extra_info('peername')
+        self.outbox = asyncio.Queue(maxsize=node.queue_size)
+        self.inventory = {'blocks': {}, 'transactions': {}}  # Hashes to announce, insertion ordered
+        self.wanted = {'blocks': {}, 'transactions': {}}  # Announced by the peer, waiting to be asked for
+        self.in_flight = set()  # Hashes asked from the peer and not answered yet
+        self.ready = asyncio.Event()  # Set when there is something to write
+        self.tasks = []
+        self.closed = False
+
+    def start(self):
+        self.tasks = [asyncio.create_task(self.read_loop()), asyncio.create_task(self.write_loop())]
+
+    def send(self, message):
+        """
+        Queues a reply; a peer that does not read its replies is disconnected
+        """
+        if self.closed:
+            return
+        try:
+            self.outbox.put_nowait(message)
+        except asyncio.QueueFull:
+            self.close()
+            return
+        self.ready.set()
+
+    def announce(self, kind, key):
+        """
+        Queues a block hash or transaction id for the next inv sent to the peer
+        :param kind: <str> 'blocks' or 'transactions'
+        """
+        if self.closed:
+            return
+        self.inventory[kind][key] = None
+        self.ready.set()
+
+    def take_inventory(self):
+        message = {'type': 'inv', 'blocks': [], 'transactions': []}
+        room = MAX_INV
+        for kind in ('blocks', 'transactions'):
+            pending = self.inventory[kind]
+            while pending and room:
+                key = next(iter(pending))
+                del pending[key]
+                message[kind].append(key)
+                room -= 1
+        return message
+
+    def request_more(self):
+        """
+        Asks for announced items, keeping at most IN_FLIGHT of them unanswered.
+        Blocks are asked for before transactions.
+        """
+        message = {'type': 'getdata', 'blocks': [], 'transactions': []}
+        for kind in ('blocks', 'transactions'):
+            wanted = self.wanted[kind]
+            while wanted and len(self.in_flight) < IN_FLIGHT:
+                key = next(iter(wanted))
+                del wanted[key]
+                if self.node.want(kind, key, self):
+                    self.in_flight.add(key)
+                    message[kind].append(key)
+        if message['blocks'] or message['transactions']:
+            self.send(message)
+
+    def answered(self, key):
+        if key in self.in_flight:
+            self.in_flight.discard(key)
+            self.node.requested.pop(key, None)
+            self.node.announcers.pop(key, None)
+
+    async def read_loop(self):
+        try:
+            while True:
+                message = await read_message(self.reader)
+                if message is None:
+                    break
+                self.node.handle(self, message)
+        except (ConnectionError, ValueError, KeyError, TypeError, struct.error):
+            pass
+        finally:
+            self.close()
+
+    async def write_loop(self):
+        try:
+            while True:
+                if self.outbox.empty() and not (self.inventory['blocks'] or self.inventory['transactions']):
+                    self.ready.clear()
+                    await self.ready.wait()
+                    continue
+                message = self.outbox.get_nowait() if not self.outbox.empty() else self.take_inventory()
+                self.writer.write(encode_message(message))
+                await self.writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for task in self.tasks:
+            if task is not asyncio.current_task():
+                task.cancel()
+        self.writer.close()
+        self.node.disconnected(self)
+
+
+class Node:
+    """
+    A blockchain node gossiping blocks and transactions with its peers.
+    Blocks go through Blockchain.add_block, so forks and reorganisations follow its fork choice;
+    transactions go through the node's mempool and the ones it refuses are not relayed.
+    """
+
+    def __init__(self, blockchain, name=None, host='127.0.0.1', port=0, queue_size=PEER_QUEUE_SIZE):
+        """
+        :param blockchain: <Blockchain> Chain of the node, sharing its genesis block with the other nodes
+        :param name: <str> Name used in reports
+        :param host: <str> Address to listen on
+        :param port: <int> Port to listen on, 0 picks a free one
+        :param queue_size: <int> Replies queued for a peer before it is disconnected
+        """
+        self.blockchain = blockchain
+        self.name = name
+        self.host = host
+        self.port = port
+        self.queue_size = queue_size
+        self.peers = set()
+        self.server = None
+
+        self.seen_blocks = SeenSet()
+        self.seen_transactions = SeenSet()
+        self.requested = {}  # Hash asked for -> (kind, peer it was asked from, deadline)
+        self.announcers = {}  # Hash asked for -> other peers that announced it, asked in turn on a timeout
+        self.expiry = None  # Task retrying requests past their deadline
+        self.relay = {}  # Transaction id -> pending transaction, to answer getdata
+        self.relay_keys = {}  # (sender, nonce) -> id of the relayed transaction
+
+        # First time each block and transaction was seen, to measure propagation
+        self.arrivals = {}
+        for block in blockchain.chain:
+            self.seen_blocks.add(block.current_hash)
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.accept, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.expiry = asyncio.create_task(self.expire_requests())
+
+    async def stop(self):
+        if self.expiry is not None:
+            self.expiry.cancel()
+        for peer in list(self.peers):
+            peer.close()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def accept(self, reader, writer):
+        self.add_peer(reader, writer)
+
+    async def connect(self, host, port):
+        """
+        Opens a connection to another node
+        :return: <Peer> The peer
+        """
+        reader, writer = await asyncio.open_connection(host, port)
+        return self.add_peer(reader, writer)
+
+    def add_peer(self, reader, writer):
+        peer = Peer(self, reader, writer)
+        self.peers.add(peer)
+        peer.start()
+        # Tell the peer where our chain stands and what we have pending; it asks for what it lacks
+        peer.announce('blocks', self.blockchain.last_block.current_hash)
+        for key in self.relay:
+            peer.announce('transactions', key)
+        return peer
+
+    def disconnected(self, peer):
+        self.peers.discard(peer)
+        # Items it never answered are asked from another peer that announced them
+        for key in list(peer.in_flight):
+            if key in self.requested and self.requested[key][1] is peer:
+                self.retry(key)
+        peer.in_flight.clear()
+
+    def broadcast(self, kind, key, source=None):
+        for peer in self.peers:
+            if peer is not source:
+                peer.announce(kind, key)
+
+    def want(self, kind, key, peer):
+        """
+        Whether an announced item should be asked from peer: it is new and not asked from another peer.
+        A peer announcing an item already asked from another one is kept in case that one does not answer.
+        """
+        seen = self.seen_blocks if kind == 'blocks' else self.seen_transactions
+        if key in seen:
+            return False
+        if key in self.requested:
+            if self.requested[key][1] is not peer:
+                self.announcers.setdefault(key, {})[peer] = None
+            return False
+        self.requested[key] = (kind, peer, perf_counter() + REQUEST_TIMEOUT)
+        return True
+
+    def ask(self, peer, kind, key):
+        """
+        Asks peer for one item right away, outside its announced ones
+        """
+        self.requested[key] = (kind, peer, perf_counter() + REQUEST_TIMEOUT)
+        peer.in_flight.add(key)
+        message = {'type': 'getdata', 'blocks': [], 'transactions': []}
+        message[kind].append(key)
+        peer.send(message)
+
+    def retry(self, key):
+        """
+        Gives up on the peer an item was asked from and asks the next peer that announced it, if any
+        """
+        kind, peer, _ = self.requested.pop(key)
+        peer.in_flight.discard(key)
+        announcers = [other for other in self.announcers.pop(key, ()) if not other.closed and other is not peer]
+        if announcers:
+            self.ask(announcers[0], kind, key)
+            if len(announcers) > 1:
+                self.announcers[key] = dict.fromkeys(announcers[1:])
+
+    async def expire_requests(self):
+        """
+        Retries the requests a peer left unanswered past their deadline, so a peer that stays
+        connected without answering cannot hold an item back
+        """
+        while True:
+            await asyncio.sleep(REQUEST_TIMEOUT / 4)
+            now = perf_counter()
+            for key in [key for key, (_, _, deadline) in self.requested.items() if deadline <= now]:
+                self.retry(key)
+
+    def handle(self, peer, message):
+        handler = getattr(self, f"handle_{message['type']}", None)
+        if handler is None:
+            raise ValueError(f"Unknown message type {message['type']!r}")
+        handler(peer, message)
+
+    def handle_inv(self, peer, message):
+        for kind in ('blocks', 'transactions'):
+            seen = self.seen_blocks if kind == 'blocks' else self.seen_transactions
+            for key in message[kind]:
+                if key not in seen:
+                    peer.wanted[kind][key] = None
+        peer.request_more()
+
+    def handle_getdata(self, peer, message):
+        missing = {'blocks': [], 'transactions': []}
+        for block_hash in message['blocks']:
+            block = self.find_block(block_hash)
+            if block is None:
+                missing['blocks'].append(block_hash)
+            else:
+                peer.send({'type': 'block', 'block': block.to_dict()})
+        transactions = []
+        for key in message['transactions']:
+            transaction = self.relay.get(key)
+            if transaction is None:
+                missing['transactions'].append(key)
+            else:
+                transactions.append(transaction.to_dict())
+        if transactions:
+            peer.send({'type': 'tx', 'transactions': transactions})
+        if missing['blocks'] or missing['transactions']:
+            peer.send(dict(missing, type='notfound'))
+
+    def handle_notfound(self, peer, message):
+        for key in message['blocks'] + message['transactions']:
+            if key in peer.in_flight and key in self.requested and self.requested[key][1] is peer:
+                self.retry(key)
+            else:
+                peer.answered(key)
+        peer.request_more()
+
+    def handle_block(self, peer, message):
+        block = Block.from_dict(message['block'])
+        peer.answered(block.current_hash)
+        self.receive_block(block, peer)
+        peer.request_more()
+
+    def handle_tx(self, peer, message):
+        for data in message['transactions']:
+            transaction = Transaction.from_dict(data)
+            key = transaction_id(transaction)
+            peer.answered(key)
+            self.receive_transaction(transaction, peer, key)
+        peer.request_more()
+
+    def find_block(self, block_hash):
+        block = self.blockchain.block_by_hash(block_hash)
+        if block is None and block_hash in self.blockchain.side_blocks:
+            block = self.blockchain.side_blocks[block_hash].block
+        return block
+
+    def receive_block(self, block, source=None):
+        """
+        Adds a block from a peer, or mined here when source is None, and relays it once it is
+        connected to the block tree. A block with an unknown parent makes us ask for the parent.
+        :return: <bool> False if the block is invalid
+        """
+        block_hash = block.current_hash
+        # Checked before the hash is marked seen, or a forged block would keep the real one out
+        if block_hash != self.blockchain.hash(block):
+            return False
+        if not self.seen_blocks.add(block_hash):
+            return True
+        self.arrivals.setdefault(block_hash, perf_counter())
+
+        chain = self.blockchain
+        old_tip = chain.last_block.current_hash
+        old_length = len(chain.chain)
+        # The orphans waiting on this block, which add_block connects along with it
+        descendants = [block]
+        for waiting in descendants:
+            descendants.extend(chain.orphans.get(waiting.current_hash, []))
+
+        if not chain.add_block(block):
+            return False
+
+        if chain.locate(block_hash) is None:
+            # Held as an orphan: fetch the missing parent from the peer that sent the block
+            parent_hash = block.previous_hash
+            if source is not None and parent_hash not in self.requested and parent_hash not in self.seen_blocks:
+                self.ask(source, 'blocks', parent_hash)
+            return True
+
+        for connected in descendants:
+            if chain.locate(connected.current_hash) is not None:
+                self.broadcast('blocks', connected.current_hash, source)
+        self.settle(old_tip, old_length)
+        return True
+
+    def settle(self, old_tip, old_length):
+        """
+        Follows the active chain after it changed from old_tip with old_length blocks. The chain
+        has already settled the mempool; this stops relaying the transactions of the blocks that
+        joined the active chain, matched by sender and nonce, and relays again the transactions of
+        abandoned blocks that the mempool took back
+        """
+        chain = self.blockchain
+        height = min(old_length, len(chain.chain)) - 1
+        while height > 0 and chain.ancestor(old_tip, height).current_hash != chain.chain[height].current_hash:
+            height -= 1
+
+        for block in chain.chain[height + 1:]:
+            for transaction in block.transactions:
+                self.forget((transaction.sender, transaction.nonce))
+
+        mempool = chain.mempool
+        for abandoned_height in range(height + 1, old_length):
+            for transaction in chain.ancestor(old_tip, abandoned_height).transactions:
+                entry = mempool.entries.get((transaction.sender, transaction.nonce))
+                if entry is not None and entry.transaction == transaction:
+                    key = transaction_id(transaction)
+                    if key not in self.relay:
+                        self.relay[key] = transaction
+                        self.relay_keys[(transaction.sender, transaction.nonce)] = key
+                        self.broadcast('transactions', key)
+
+    def receive_transaction(self, transaction, source=None, key=None):
+        """
+        Admits a transaction from a peer, or submitted here when source is None, and relays it
+        :param key: <str> Its transaction id when already computed
+        :return: <bool> False if the mempool refused it
+        """
+        if key is None:
+            key = transaction_id(transaction)
+        if not self.seen_transactions.add(key):
+            return True
+        self.arrivals.setdefault(key, perf_counter())
+        try:
+            self.blockchain.mempool.add(transaction)
+        except MempoolError:
+            return False
+
+        self.relay[key] = transaction
+        self.relay_keys[(transaction.sender, transaction.nonce)] = key
+        if len(self.relay) > RELAY_SIZE:
+            oldest = self.relay[next(iter(self.relay))]
+            self.forget((oldest.sender, oldest.nonce))
+        self.broadcast('transactions', key, source)
+        return True
+
+    def forget(self, entry_key):
+        """
+        Stops relaying the transaction of a (sender, nonce) pair
+        """
+        key = self.relay_keys.pop(entry_key, None)
+        if key is not None:
+            del self.relay[key]
+
+    def submit_transaction(self, sender, recipient, amount, fee=0.0, nonce=None):
+        """
+        Creates a transaction at this node and gossips it
+        :return: <str> Id of the transaction, or None if the mempool refused it
+        """
+        if nonce is None:
+            nonce = self.blockchain.mempool.next_nonce(sender)
+        transaction = Transaction(sender, recipient, amount, fee, nonce)
+        key = transaction_id(transaction)
+        return key if self.receive_transaction(transaction, key=key) else None
+
+    async def mine(self):
+        """
+        Mines the best pending transactions on the current tip and gossips the block.
+        The proof of work runs in a thread, so the node keeps serving its peers meanwhile;
+        a block arriving in the meantime makes this one a competing branch.
+        :return: <Block> The mined block
+        """
+        chain = self.blockchain
+        parent = chain.last_block
+        height = len(chain.chain)
+        transactions = [entry.transaction for entry in chain.mempool.select()]
+        difficulty = chain.difficulty_at(height, parent.current_hash)
+        hasher = ProofHasher(chain.hash(parent), difficulty)
+        proof = await asyncio.to_thread(hasher.search)
+
+        block = Block(
+            index=height + 1,
+            timestamp=time(),
+            transactions=transactions,
+            merkle_root=merkle_root(transactions),
+            previous_hash=parent.current_hash,
+            current_hash=None,
+            proof=proof,
+            difficulty=difficulty,
+        )
+        block.current_hash = chain.hash(block)
+        self.receive_block(block)
+        return block
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def random_topology(count, degree, rng):
+    """
+    Edges of a connected random graph: a ring, plus random links until the average degree is reached
+    :return: <set> Pairs (i, j) with i < j
+    """
+    edges = {(min(i, (i + 1) % count), max(i, (i + 1) % count)) for i in range(count)} if count > 1 else set()
+    target = count * degree // 2
+    while len(edges) < min(target, count * (count - 1) // 2):
+        i, j = rng.sample(range(count), 2)
+        edges.add((min(i, j), max(i, j)))
+    return edges
+
+
+async def wait_until(condition, timeout, interval=0.005):
+    """
+    :return: <bool> Whether condition() became true before the timeout
+    """
+    deadline = perf_counter() + timeout
+    while not condition():
+        if perf_counter() > deadline:
+            return False
+        await asyncio.sleep(interval)
+    return True
+
+
+async def simulate(args):
+    """
+    Runs a network of nodes on localhost and measures how blocks and transactions spread through it
+    """
+    rng = random.Random(args.seed)
+    genesis = shared_genesis(args.difficulty)
+    nodes = []
+    for number in range(args.nodes):
+        with redirect_stdout(io.StringIO()):
+            chain = Blockchain(difficulty=args.difficulty, genesis=genesis)
+        node = Node(chain, name=f"node{number}")
+        await node.start()
+        nodes.append(node)
+
+    edges = random_topology(len(nodes), args.degree, rng)
+    for i, j in edges:
+        await nodes[i].connect(nodes[j].host, nodes[j].port)
+    print(f"{len(nodes)} nodes, {len(edges)} connections")
+
+    # Transactions: submitted at random nodes as fast as possible
+    senders = [f"user{number}" for number in range(max(1, args.transactions // 10))]
+    nonces = dict.fromkeys(senders, 0)
+    keys = []
+    start = perf_counter()
+    for number in range(args.transactions):
+        sender = rng.choice(senders)
+        origin = rng.choice(nodes)
+        key = origin.submit_transaction(sender, rng.choice(senders), 1.0, round(rng.random(), 3), nonces[sender])
+        nonces[sender] += 1
+        keys.append((key, origin))
+        if number % 100 == 99:
+            # Let the loop write to the sockets now and then
+            await asyncio.sleep(0)
+    spread = await wait_until(lambda: all(key in node.arrivals for key, _ in keys for node in nodes), args.timeout, 0.02)
+    elapsed = perf_counter() - start
+    if keys:
+        latencies = [max(node.arrivals.get(key, perf_counter()) for node in nodes) - origin.arrivals[key]
+                     for key, origin in keys]
+        print(f"\nTransactions: {len(keys)} in {elapsed:.2f}s, {len(keys) / elapsed:,.0f}/s reaching every node"
+              f"{'' if spread else ' (timed out)'}")
+        print(f"  latency to every node: median {statistics.median(latencies) * 1000:.1f} ms, "
+              f"p90 {percentile(latencies, 0.9) * 1000:.1f} ms, max {max(latencies) * 1000:.1f} ms")
+
+    # Blocks: mined at random nodes, each once the previous one reached every node unless racing
+    def reached_everyone(block):
+        return all(block.current_hash in node.arrivals for node in nodes)
+
+    mined = []
+    start = perf_counter()
+    for _ in range(args.blocks):
+        origin = rng.choice(nodes)
+        mined.append((await origin.mine(), origin))
+        if not args.race and not await wait_until(lambda: reached_everyone(mined[-1][0]), args.timeout):
+            print("  block did not reach every node")
+            break
+    if args.race:
+        # Branches of equal work stay split on first seen blocks, one more block settles them
+        await wait_until(lambda: all(reached_everyone(block) for block, _ in mined), args.timeout)
+        origin = rng.choice(nodes)
+        mined.append((await origin.mine(), origin))
+    converged = await wait_until(lambda: len({node.blockchain.last_block.current_hash for node in nodes}) == 1,
+                                 args.timeout)
+    elapsed = perf_counter() - start
+
+    latencies = [max(node.arrivals[block.current_hash] for node in nodes) - origin.arrivals[block.current_hash]
+                 for block, origin in mined if reached_everyone(block)]
+    stale = sum(nodes[0].blockchain.block_by_hash(block.current_hash) is None for block, _ in mined)
+    print(f"\nBlocks: {len(mined)} mined in {elapsed:.2f}s, {stale} stale, tips "
+          f"{'converged' if converged else 'differ'} at height {max(len(node.blockchain.chain) for node in nodes) - 1}")
+    if latencies:
+        print(f"  latency to every node: median {statistics.median(latencies) * 1000:.1f} ms, "
+              f"p90 {percentile(latencies, 0.9) * 1000:.1f} ms, max {max(latencies) * 1000:.1f} ms")
+    with redirect_stdout(io.StringIO()):
+        valid = all(node.blockchain.valid_chain() for node in nodes)
+    pending = [len(node.blockchain.mempool) for node in nodes]
+    print(f"  chains valid: {valid}, pending transactions per node: {min(pending)}-{max(pending)}")
+    # Every admitted transaction must end up mined or pending, stale blocks included
+    chain = nodes[0].blockchain
+    mined_ids = {transaction_id(transaction) for block in chain.chain for transaction in block.transactions}
+    pending_ids = {transaction_id(entry.transaction) for entry in chain.mempool.entries.values()}
+    admitted = [key for key, _ in keys if key is not None]
+    lost = sum(key not in mined_ids and key not in pending_ids for key in admitted)
+    print(f"  transactions mined: {sum(key in mined_ids for key in admitted)} of {len(admitted)}, lost: {lost}")
+
+    for node in nodes:
+        await node.stop()
+    return converged and valid and not lost
+
+
+async def run_node(args):
+    """
+    Runs one node until interrupted, mining every mine_interval seconds when given
+    """
+    with redirect_stdout(io.StringIO()):
+        chain = Blockchain(difficulty=args.difficulty, genesis=shared_genesis(args.difficulty))
+    node = Node(chain, host=args.host, port=args.port)
+    await node.start()
+    print(f"Listening on {node.host}:{node.port}")
+    for address in args.peer:
+        host, _, port = address.rpartition(':')
+        try:
+            await node.connect(host, int(port))
+        except OSError as error:
+            print(f"Could not connect to {address}: {error}")
+
+    while True:
+        await asyncio.sleep(args.mine_interval or 10)
+        if args.mine_interval:
+            block = await node.mine()
+            print(f"Mined block {block.index} with {len(block.transactions)} transactions")
+        print(f"Height {len(chain.chain) - 1}, {len(node.peers)} peers, {len(chain.mempool)} pending")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peer-to-peer blockchain node")
+    parser.add_argument('--difficulty', type=int, default=DEFAULT_DIFFICULTY,
+                        help=f"Difficulty in leading zero bits, nodes must agree on it (default: {DEFAULT_DIFFICULTY})")
+    modes = parser.add_subparsers(dest='mode', required=True)
+
+    simulation = modes.add_parser('simulate', help="Run a network of nodes on localhost and measure it")
+    simulation.add_argument('--nodes', type=int, default=20)
+    simulation.add_argument('--degree', type=int, default=3, help="Average connections per node")
+    simulation.add_argument('--blocks', type=int, default=20)
+    simulation.add_argument('--transactions', type=int, default=2_000)
+    simulation.add_argument('--race', action='store_true',
+                            help="Mine blocks back to back without waiting for them to spread, causing forks")
+    simulation.add_argument('--timeout', type=float, default=30, help="Seconds to wait for propagation")
+    simulation.add_argument('--seed', type=int, default=None)
+
+    single = modes.add_parser('node', help="Run one node")
+    single.add_argument('--host', default='127.0.0.1')
+    single.add_argument('--port', type=int, default=8333)
+    single.add_argument('--peer', action='append', default=[], help="host:port of a node to connect to")
+    single.add_argument('--mine-interval', type=float, default=None, help="Seconds between blocks mined here")
+    args = parser.parse_args()
+
+    if args.mode == 'simulate':
+        raise SystemExit(0 if asyncio.run(simulate(args)) else 1)
+    try:
+        asyncio.run(run_node(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,19 @@
+import contextlib
+import io
+
+
+def quietly(function, *args, **kwargs):
+    """
+    Calls function without the progress lines the chain prints.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+
+def grow(blockchain, blocks, sender='alice'):
+    """
+    Mines blocks onto the chain, each with one transaction from sender to bob.
+    """
+    for _ in range(blocks):
+        quietly(blockchain.new_transaction, sender, 'bob', 1.0)
+        quietly(blockchain.mine_block)
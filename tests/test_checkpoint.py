@@ -0,0 +1,32 @@
+import unittest
+
+from blockchain import Blockchain
+
+from .helpers import grow, quietly
+
+
+class CheckpointTests(unittest.TestCase):
+    def setUp(self):
+        self.blockchain = quietly(Blockchain, difficulty=4)
+        grow(self.blockchain, 4)
+        self.assertTrue(quietly(self.blockchain.valid_chain))
+
+    def test_appended_blocks_keep_the_checkpoint(self):
+        grow(self.blockchain, 1)
+        self.assertTrue(self.blockchain.checkpoint_intact())
+        self.assertTrue(quietly(self.blockchain.valid_chain))
+        self.assertEqual(self.blockchain.verified_height, len(self.blockchain.chain))
+
+    def test_edited_block_below_the_checkpoint_is_caught(self):
+        self.blockchain.chain[1].timestamp += 1
+        self.assertFalse(self.blockchain.checkpoint_intact())
+        self.assertFalse(quietly(self.blockchain.valid_chain))
+
+    def test_truncated_chain_is_checked_again(self):
+        del self.blockchain.chain[-1]
+        self.assertFalse(self.blockchain.checkpoint_intact())
+        self.assertTrue(quietly(self.blockchain.valid_chain))
+
+    def test_edited_transaction_needs_a_full_check(self):
+        self.blockchain.chain[2].transactions[0].amount = 100.0
+        self.assertFalse(quietly(self.blockchain.valid_chain, full=True))
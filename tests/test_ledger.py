@@ -0,0 +1,38 @@
+import unittest
+
+from blockchain import AccountLedger, Blockchain
+
+from .helpers import grow, quietly
+
+
+class AccountLedgerTests(unittest.TestCase):
+    def setUp(self):
+        self.blockchain = quietly(Blockchain, difficulty=4)
+        self.blockchain.ledger = AccountLedger(self.blockchain.chain, snapshot_interval=2)
+        grow(self.blockchain, 5)
+
+    def test_balances_at_every_height(self):
+        ledger = self.blockchain.ledger
+        self.assertEqual(ledger.balance('alice'), -5.0)
+        self.assertEqual(ledger.snapshot_heights, [0, 2, 4, 6])
+        # Block 0 is the genesis block, each block after it moves 1.0 from alice to bob
+        for height in range(len(self.blockchain.chain) + 1):
+            self.assertEqual(ledger.balance('bob', height), float(max(height - 1, 0)))
+        with self.assertRaises(ValueError):
+            ledger.balance('bob', len(self.blockchain.chain) + 1)
+
+    def test_reorganisation_rewinds_to_the_fork(self):
+        ledger = self.blockchain.ledger
+        ledger.sync()
+        parent_hash = self.blockchain.chain[2].current_hash
+        for _ in range(len(self.blockchain.chain) - 2):
+            block = quietly(self.blockchain.build_block, parent_hash, [])
+            quietly(self.blockchain.add_block, block)
+            parent_hash = block.current_hash
+
+        self.assertEqual(self.blockchain.chain[-1].current_hash, parent_hash)
+        # Rewound by reorganize itself, before any read syncs it
+        self.assertEqual(ledger.height, 2)
+        self.assertEqual(ledger.snapshot_heights, [0, 2])
+        self.assertEqual(ledger.balances_at(), AccountLedger(self.blockchain.chain).balances_at())
+        self.assertEqual(ledger.balance('alice'), -2.0)
@@ -0,0 +1,42 @@
+import unittest
+
+from blockchain import Mempool, MempoolError, Transaction
+
+
+class MempoolTests(unittest.TestCase):
+    def setUp(self):
+        self.mempool = Mempool(max_size=3)
+
+    def add(self, nonce, fee):
+        return self.mempool.add(Transaction('alice', 'bob', 1.0, fee=fee, nonce=nonce))
+
+    def test_selection_stops_at_an_evicted_nonce(self):
+        for nonce, fee in enumerate((2.0, 1.0, 3.0)):
+            self.add(nonce, fee)
+        self.add(3, 4.0)
+
+        # Nonce 1 was evicted: mining 2 and 3 after 0 would retire 1 unmined
+        self.assertEqual([entry.nonce for entry in self.mempool.select()], [0])
+        self.assertEqual(self.mempool.next_nonce('alice'), 1)
+
+        self.mempool.max_size = 4
+        self.add(1, 1.0)
+        self.assertEqual(sorted(entry.nonce for entry in self.mempool.select()), [0, 1, 2, 3])
+        self.assertEqual(self.mempool.next_nonce('alice'), 4)
+
+    def test_selection_waits_for_the_account_nonce(self):
+        self.add(0, 1.0)
+        self.mempool.confirm(self.mempool.select())
+        self.add(2, 1.0)
+        self.assertEqual(self.mempool.select(), [])
+        self.assertEqual(self.mempool.next_nonce('alice'), 1)
+
+    def test_pool_without_room_refuses_every_transaction(self):
+        self.mempool.max_size = 0
+        with self.assertRaisesRegex(MempoolError, 'full'):
+            self.add(0, 1.0)
+        self.assertEqual(len(self.mempool), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+import asyncio
+import unittest
+from unittest import mock
+
+import p2p_node
+from blockchain import Blockchain, Transaction
+from p2p_node import Node, encode_message, shared_genesis, wait_until
+
+from .helpers import quietly
+
+DIFFICULTY = 4
+
+
+class NodeTestCase(unittest.IsolatedAsyncioTestCase):
+    genesis = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.genesis = shared_genesis(DIFFICULTY)
+
+    async def start_node(self, name):
+        node = Node(quietly(Blockchain, difficulty=DIFFICULTY, genesis=self.genesis), name=name)
+        await node.start()
+        self.addAsyncCleanup(node.stop)
+        return node
+
+    async def connect(self, node, other):
+        await node.connect(other.host, other.port)
+
+    async def converge(self, *nodes):
+        return await wait_until(lambda: len({node.blockchain.last_block.current_hash for node in nodes}) == 1, 5)
+
+
+class SettleTests(NodeTestCase):
+    async def test_transactions_of_a_stale_block_are_mined_later(self):
+        alice = await self.start_node('alice')
+        bob = await self.start_node('bob')
+        key = alice.submit_transaction('alice', 'bob', 1.0)
+        stale = await alice.mine()
+        self.assertEqual(len(stale.transactions), 1)
+        await bob.mine()
+        await bob.mine()
+
+        await self.connect(alice, bob)
+        self.assertTrue(await self.converge(alice, bob))
+        self.assertIsNone(alice.blockchain.block_by_hash(stale.current_hash))
+        # alice took the payment back and gossiped it to bob, whose next block mines it
+        self.assertTrue(await wait_until(lambda: len(bob.blockchain.mempool) == 1, 5))
+        self.assertIn(key, alice.relay)
+
+        block = await bob.mine()
+        self.assertTrue(await self.converge(alice, bob))
+        self.assertEqual([transaction.nonce for transaction in block.transactions], [0])
+        self.assertEqual((len(alice.blockchain.mempool), len(bob.blockchain.mempool)), (0, 0))
+        self.assertNotIn(key, alice.relay)
+
+    async def test_settling_matches_sender_and_nonce(self):
+        alice = await self.start_node('alice')
+        bob = await self.start_node('bob')
+        await self.connect(alice, bob)
+        first = alice.submit_transaction('alice', 'bob', 1.0)
+        second = alice.submit_transaction('alice', 'bob', 1.0)
+        self.assertNotEqual(first, second)
+        self.assertTrue(await wait_until(lambda: len(bob.blockchain.mempool) == 2, 5))
+
+        # A block mining only the first: the identical second one with nonce 1 stays pending
+        block = quietly(bob.blockchain.build_block, bob.blockchain.last_block.current_hash,
+                        [Transaction('alice', 'bob', 1.0, nonce=0)])
+        bob.receive_block(block)
+        self.assertTrue(await self.converge(alice, bob))
+        for node in (alice, bob):
+            self.assertEqual(list(node.blockchain.mempool.entries), [('alice', 1)])
+        self.assertEqual(list(alice.relay), [second])
+
+
+class RequestTests(NodeTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(p2p_node, 'REQUEST_TIMEOUT', 0.2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def announced(self):
+        """
+        Starts alice, carol holding a transaction and a third node that has it too
+        :return: <tuple> alice, carol, the third node and the transaction id
+        """
+        alice = await self.start_node('alice')
+        carol = await self.start_node('carol')
+        other = await self.start_node('other')
+        await self.connect(other, carol)
+        key = carol.submit_transaction('carol', 'bob', 1.0)
+        self.assertTrue(await wait_until(lambda: key in other.relay, 5))
+        return alice, carol, other, key
+
+    async def test_item_a_peer_does_not_answer_is_asked_elsewhere(self):
+        alice, carol, silent, key = await self.announced()
+        # Stays connected but never answers a getdata
+        silent.handle_getdata = lambda peer, message: None
+
+        await self.connect(alice, silent)
+        self.assertTrue(await wait_until(lambda: key in alice.requested, 5))
+        await self.connect(alice, carol)
+        self.assertTrue(await wait_until(lambda: key in alice.relay, 5))
+        self.assertNotIn(key, alice.requested)
+        self.assertEqual(list(alice.blockchain.mempool.entries), [('carol', 0)])
+
+    async def test_notfound_is_asked_elsewhere(self):
+        alice, carol, forgetful, key = await self.announced()
+        # Answers once carol has announced the transaction too, and has forgotten it by then
+        answer = forgetful.handle_getdata
+        forgetful.handle_getdata = lambda peer, message: asyncio.get_running_loop().call_later(
+            0.1, answer, peer, message)
+
+        await self.connect(alice, forgetful)
+        self.assertTrue(await wait_until(lambda: key in alice.requested, 5))
+        forgetful.relay.clear()
+        await self.connect(alice, carol)
+        self.assertTrue(await wait_until(lambda: key in alice.relay, 5))
+
+
+
+class GossipTests(NodeTestCase):
+    async def test_blocks_and_transactions_reach_every_node_of_a_line(self):
+        nodes = [await self.start_node(name) for name in ('alice', 'bob', 'carol', 'dave')]
+        for node, other in zip(nodes, nodes[1:]):
+            await self.connect(node, other)
+        key = nodes[0].submit_transaction('alice', 'bob', 1.0)
+        self.assertTrue(await wait_until(lambda: all(key in node.relay for node in nodes), 5))
+
+        block = await nodes[-1].mine()
+        self.assertTrue(await self.converge(*nodes))
+        self.assertEqual(nodes[0].blockchain.last_block.current_hash, block.current_hash)
+        self.assertEqual([len(node.blockchain.mempool) for node in nodes], [0] * len(nodes))
+
+    async def test_peer_sending_an_undecodable_block_is_disconnected(self):
+        alice = await self.start_node('alice')
+        bob = await self.start_node('bob')
+        block = await bob.mine()
+
+        # Same hash as bob's block, but a proof the header cannot encode
+        forged = dict(block.to_dict(), proof=-1)
+        reader, writer = await asyncio.open_connection(alice.host, alice.port)
+        self.addCleanup(writer.close)
+        writer.write(encode_message({'type': 'block', 'block': forged}))
+        # alice's opening inv, then the end of the stream as she hangs up
+        await asyncio.wait_for(reader.read(), 5)
+        self.assertTrue(reader.at_eof())
+        self.assertEqual(len(alice.peers), 0)
+
+        # The forged block did not keep the real one out
+        await self.connect(alice, bob)
+        self.assertTrue(await self.converge(alice, bob))
+
+
+if __name__ == '__main__':
+    unittest.main()
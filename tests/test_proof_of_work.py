@@ -0,0 +1,77 @@
+import hashlib
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+from blockchain import MAX_RETARGET_STEP, Blockchain, ProofHasher, parallel_proof_of_work, retarget
+
+from .helpers import grow, quietly
+
+
+class ParallelProofOfWorkTests(unittest.TestCase):
+    def test_parallel_search_finds_the_serial_proof(self):
+        with ProcessPoolExecutor(max_workers=2) as pool:
+            for last_hash in ('0' * 64, 'a' * 64, '1'):
+                serial = ProofHasher(last_hash, 10).search()
+                # Small chunks, so the proof is found with chunks below and above it in flight
+                self.assertEqual(parallel_proof_of_work(last_hash, 2, 10, chunk_size=97, pool=pool), serial)
+
+    def test_chain_with_workers_mines_the_serial_proofs(self):
+        blockchain = quietly(Blockchain, workers=2, difficulty=8)
+        self.addCleanup(blockchain.close)
+        grow(blockchain, 3)
+
+        for parent, block in zip(blockchain.chain, blockchain.chain[1:]):
+            self.assertEqual(block.proof, ProofHasher(blockchain.hash(parent), block.difficulty).search())
+        self.assertTrue(quietly(blockchain.valid_chain, full=True))
+
+
+def leading_zero_bits(data):
+    return 256 - int.from_bytes(hashlib.sha256(data).digest(), 'big').bit_length()
+
+
+class ProofHasherTests(unittest.TestCase):
+    last_hash = 'f' * 64
+
+    def test_check_matches_hashing_the_whole_guess(self):
+        for difficulty in (0, 4, 8, 12):
+            hasher = ProofHasher(self.last_hash, difficulty)
+            for proof in range(2_000):
+                valid = leading_zero_bits(f'{self.last_hash}{proof}'.encode()) >= difficulty
+                self.assertEqual(hasher.check(proof), valid, (difficulty, proof))
+
+    def test_search_returns_the_lowest_valid_proof_in_range(self):
+        hasher = ProofHasher(self.last_hash, 8)
+        proof = hasher.search()
+        self.assertEqual(proof, next(p for p in range(100_000) if hasher.check(p)))
+        self.assertEqual(hasher.search(proof), proof)
+        self.assertIsNone(hasher.search(0, proof))
+        self.assertGreater(hasher.search(proof + 1), proof)
+
+
+
+class RetargetTests(unittest.TestCase):
+    def test_difficulty_moves_by_the_log_of_the_time_ratio(self):
+        self.assertEqual(retarget(10, 100.0, 100.0), 10)
+        self.assertEqual(retarget(10, 50.0, 100.0), 11)
+        self.assertEqual(retarget(10, 400.0, 100.0), 8)
+        # Bounded in both directions, and by the range of difficulties
+        self.assertEqual(retarget(10, 1.0, 100.0), 10 + MAX_RETARGET_STEP)
+        self.assertEqual(retarget(10, 0.0, 100.0), 10 + MAX_RETARGET_STEP)
+        self.assertEqual(retarget(10, 10_000.0, 100.0), 10 - MAX_RETARGET_STEP)
+        self.assertEqual(retarget(1, 10_000.0, 100.0), 0)
+
+    def test_chain_retargets_every_interval(self):
+        # Blocks come far faster than every 1000 seconds, so each retarget raises the difficulty
+        blockchain = quietly(Blockchain, difficulty=4, retarget_interval=2, block_time=1000)
+        grow(blockchain, 4)
+        self.assertEqual([block.difficulty for block in blockchain.chain], [4, 4, 6, 6, 8])
+        self.assertTrue(quietly(blockchain.valid_chain, full=True))
+
+        # A block claiming the difficulty before the retarget is refused
+        block = blockchain.chain[4]
+        block.difficulty = 6
+        self.assertFalse(quietly(blockchain.valid_chain, full=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import copy
+import unittest
+from unittest import mock
+
+import blockchain as blockchain_module
+from blockchain import Blockchain, MempoolError, Transaction
+
+from .helpers import grow, quietly
+
+
+class ReorganisationTests(unittest.TestCase):
+    def setUp(self):
+        self.blockchain = quietly(Blockchain, difficulty=4)
+        grow(self.blockchain, 4)
+
+    def extend(self, parent_hash, branch):
+        """
+        Adds a branch of blocks on top of parent_hash, one block per list of transactions
+        """
+        for transactions in branch:
+            block = quietly(self.blockchain.build_block, parent_hash, transactions)
+            self.assertTrue(quietly(self.blockchain.add_block, block))
+            parent_hash = block.current_hash
+        return parent_hash
+
+    def test_heavier_branch_replaces_the_blocks_above_the_fork(self):
+        fork = self.blockchain.chain[1]
+        abandoned = self.blockchain.chain[2:]
+        self.assertTrue(quietly(self.blockchain.valid_chain))
+
+        parent_hash = self.extend(fork.current_hash, [[]] * (len(abandoned) + 1))
+
+        chain = self.blockchain.chain
+        self.assertEqual(chain[-1].current_hash, parent_hash)
+        self.assertEqual(chain[2].previous_hash, fork.current_hash)
+        for block in abandoned:
+            self.assertIn(block.current_hash, self.blockchain.side_blocks)
+            self.assertIsNone(self.blockchain.block_by_hash(block.current_hash))
+
+        self.assertEqual(self.blockchain.verified_height, 2)
+        self.assertTrue(quietly(self.blockchain.valid_chain))
+
+    def test_lighter_branch_is_kept_aside(self):
+        tip = self.blockchain.chain[-1]
+        block = quietly(self.blockchain.build_block, self.blockchain.chain[1].current_hash, [])
+        self.assertTrue(quietly(self.blockchain.add_block, block))
+        self.assertIs(self.blockchain.chain[-1], tip)
+        self.assertIn(block.current_hash, self.blockchain.side_blocks)
+
+    def test_abandoned_transactions_return_to_the_mempool(self):
+        # alice's nonces 0 to 3 are mined in blocks 1 to 4; the branch from block 1 mines nonce 1
+        # again and spends nonce 2 on carol instead of bob
+        branch = [[Transaction('alice', 'bob', 1.0, nonce=1)], [Transaction('alice', 'carol', 1.0, nonce=2)], [], []]
+        self.extend(self.blockchain.chain[1].current_hash, branch)
+        self.assertEqual(len(self.blockchain.chain), 6)
+
+        mempool = self.blockchain.mempool
+        self.assertEqual(list(mempool.entries), [('alice', 3)])
+        self.assertEqual(mempool.next_nonce('alice'), 4)
+
+        quietly(self.blockchain.mine_block)
+        mined = [(tx.recipient, tx.nonce) for block in self.blockchain.chain for tx in block.transactions]
+        self.assertEqual(mined, [('bob', 0), ('bob', 1), ('carol', 2), ('bob', 3)])
+        self.assertEqual(len(mempool), 0)
+
+    def test_connected_block_settles_the_mempool(self):
+        quietly(self.blockchain.new_transaction, 'alice', 'bob', 1.0)
+        quietly(self.blockchain.new_transaction, 'alice', 'bob', 2.0)
+        block = quietly(self.blockchain.build_block, self.blockchain.last_block.current_hash,
+                        [Transaction('alice', 'carol', 5.0, nonce=4)])
+        self.assertTrue(quietly(self.blockchain.add_block, block))
+
+        # The block spent nonce 4, so the pending payment with that nonce can never be mined
+        self.assertEqual(list(self.blockchain.mempool.entries), [('alice', 5)])
+        with self.assertRaises(MempoolError):
+            self.blockchain.mempool.add(Transaction('alice', 'bob', 1.0, nonce=4))
+
+
+class OrphanTests(unittest.TestCase):
+    def setUp(self):
+        self.source = quietly(Blockchain, difficulty=4)
+        grow(self.source, 4)
+        # Knows only the genesis block, so the source's blocks above block 1 are orphans to it
+        self.blockchain = quietly(Blockchain, difficulty=4, genesis=self.source.chain[0])
+
+    def test_orphans_connect_once_the_parent_arrives(self):
+        for block in reversed(self.source.chain[2:]):
+            self.assertTrue(quietly(self.blockchain.add_block, block))
+        self.assertEqual(len(self.blockchain.chain), 1)
+
+        self.assertTrue(quietly(self.blockchain.add_block, self.source.chain[1]))
+        self.assertEqual(self.blockchain.last_block.current_hash, self.source.last_block.current_hash)
+        self.assertFalse(self.blockchain.orphans)
+
+    def test_orphan_without_proof_of_work_is_refused(self):
+        forged = copy.copy(self.source.chain[3])
+        forged.proof += 1
+        forged.current_hash = self.blockchain.hash(forged)
+        if self.blockchain.valid_proof(forged.previous_hash, forged.proof, forged.difficulty):
+            self.skipTest('the next proof happens to be valid too')
+        self.assertFalse(quietly(self.blockchain.add_block, forged))
+
+        # Nor one claiming a lower difficulty than any branch could retarget to
+        easy = copy.copy(self.source.chain[3])
+        easy.difficulty = 0
+        easy.current_hash = self.blockchain.hash(easy)
+        self.assertFalse(quietly(self.blockchain.add_block, easy))
+        self.assertFalse(self.blockchain.orphans)
+
+    def test_oldest_orphans_are_dropped_beyond_the_limit(self):
+        with mock.patch.object(blockchain_module, 'MAX_ORPHANS', 2):
+            for block in self.source.chain[2:]:
+                self.assertTrue(quietly(self.blockchain.add_block, block))
+        held = [block.current_hash for waiting in self.blockchain.orphans.values() for block in waiting]
+        self.assertEqual(held, [block.current_hash for block in self.source.chain[3:]])
@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+
+from blockchain import Blockchain, BlockStore, STORE_INDEX_ENTRY
+
+from .helpers import grow, quietly
+
+
+class BlockStoreTests(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        store = BlockStore(self.directory)
+        blockchain = quietly(Blockchain, difficulty=4, store=store)
+        grow(blockchain, 3)
+        self.hashes = [block.current_hash for block in store]
+        store.close()
+
+    def reopen(self):
+        store = BlockStore(self.directory)
+        self.addCleanup(store.close)
+        return store
+
+    def test_torn_record_at_the_tail_is_cut_off(self):
+        segment_path = os.path.join(self.directory, 'blocks.dat')
+        size = os.path.getsize(segment_path)
+        with open(segment_path, 'ab') as segment:
+            segment.write(b'\x40\x00\x00\x00partial')
+
+        store = self.reopen()
+        self.assertEqual([block.current_hash for block in store], self.hashes)
+        self.assertEqual(os.path.getsize(segment_path), size)
+
+    def test_record_missing_from_the_index_is_indexed(self):
+        index_path = os.path.join(self.directory, 'blocks.idx')
+        with open(index_path, 'r+b') as index:
+            # The last entry was half written when the process died
+            index.truncate(os.path.getsize(index_path) - STORE_INDEX_ENTRY.size // 2)
+
+        store = self.reopen()
+        self.assertEqual([block.current_hash for block in store], self.hashes)
+        self.assertEqual(store.heights[self.hashes[-1]], len(self.hashes) - 1)
+
+    def test_recovered_store_keeps_the_chain_valid(self):
+        with open(os.path.join(self.directory, 'blocks.dat'), 'ab') as segment:
+            segment.write(b'\x00')
+
+        blockchain = quietly(Blockchain, difficulty=4, store=self.reopen())
+        grow(blockchain, 1)
+        self.assertTrue(quietly(blockchain.valid_chain))
+        self.assertEqual(len(blockchain.chain), len(self.hashes) + 1)
@@ -0,0 +1,66 @@
+import copy
+import unittest
+
+from blockchain import Blockchain, Transaction
+
+from .helpers import grow, quietly
+
+
+class ParallelValidationTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.blockchain = quietly(Blockchain, workers=2, difficulty=4)
+        grow(cls.blockchain, 12)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.blockchain.close()
+
+    def assertSameVerdict(self, chain, start=1):
+        blockchain = self.blockchain
+        original = blockchain.chain
+        blockchain.chain = chain
+        try:
+            serial = blockchain.validate_serial(start)
+            self.assertEqual(blockchain.validate_parallel(start), serial)
+        finally:
+            blockchain.chain = original
+        return serial
+
+    def tampered(self, index, **fields):
+        chain = list(self.blockchain.chain)
+        chain[index] = copy.copy(chain[index])
+        for field, value in fields.items():
+            setattr(chain[index], field, value)
+        return chain
+
+    def test_valid_chain_gets_the_serial_tip_hash(self):
+        failure, last_hash = self.assertSameVerdict(self.blockchain.chain)
+        self.assertIsNone(failure)
+        self.assertEqual(last_hash, self.blockchain.hash(self.blockchain.last_block))
+        self.assertSameVerdict(self.blockchain.chain, start=7)
+
+    def invalid_proof(self, index):
+        block = self.blockchain.chain[index]
+        proof = block.proof + 1
+        while self.blockchain.valid_proof(block.previous_hash, proof, block.difficulty):
+            proof += 1
+        return proof
+
+    def test_first_invalid_block_and_check_match_the_serial_ones(self):
+        chain = self.blockchain.chain
+        cases = [
+            self.tampered(3, proof=self.invalid_proof(3)),
+            self.tampered(9, previous_hash='0' * 64),
+            self.tampered(6, transactions=[Transaction('mallory', 'bob', 1.0)]),
+            self.tampered(12, difficulty=chain[12].difficulty + 1),
+            # 12 blocks on 2 workers make runs of 2 from block 1, so block 5 starts a run
+            self.tampered(5, previous_hash='0' * 64, proof=self.invalid_proof(5)),
+        ]
+        for case in cases:
+            failure, _ = self.assertSameVerdict(case)
+            self.assertIsNotNone(failure)
+
+
+if __name__ == '__main__':
+    unittest.main()